@@ -0,0 +1,69 @@
+"""
+Import-time budget for the lightweight data modules.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter from the
+module's folder, reports the cumulative import time and fails if it exceeds the
+budget or if a heavy dependency (pandas, scipy, matplotlib, skimage) got pulled in.
+
+Usage (from the repository root):
+    python benchmarks/import_time.py [--budget-ms 150] [--repeat 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (folder, module) pairs that must stay cheap to import
+LIGHT_MODULES = [
+    ("polarbears", "polarimetry"),
+    ("polarbears", "jones"),
+    ("magnetism", "scope"),
+    ("magnetism", "stream"),
+    ("magnetism", "acquire"),
+    (".", "labtools.pyramid"),
+]
+HEAVY_PACKAGES = ("pandas", "scipy", "matplotlib", "skimage")
+BUDGET_MS = 150
+
+
+def import_time(folder: str, module: str) -> Tuple[float, List[str]]:
+    """Cumulative import time of `module` in milliseconds and the heavy packages it imported."""
+    code = f"import sys, {module}; print(' '.join(sorted(set(m.split('.')[0] for m in sys.modules))))"
+    path = [ROOT] + ([os.environ["PYTHONPATH"]] if os.environ.get("PYTHONPATH") else [])
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(path)}  # the lab modules import labtools from the root
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=os.path.join(ROOT, folder),
+                            capture_output=True, text=True, check=True, env=env)
+    cumulative_us = 0
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            cumulative_us = int(cumulative)
+    loaded = result.stdout.split()
+    return cumulative_us / 1000, [package for package in HEAVY_PACKAGES if package in loaded]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import-time budget for the lightweight data modules")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per module; the best one is reported")
+    args = parser.parse_args(argv)
+    failed = False
+    for folder, module in LIGHT_MODULES:
+        runs = [import_time(folder, module) for _ in range(args.repeat)]
+        best = min(ms for ms, _ in runs)
+        heavy = runs[0][1]
+        ok = best <= args.budget_ms and not heavy
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {folder}/{module}: {best:.1f} ms (budget {args.budget_ms:.0f} ms)"
+              + (f", imported {', '.join(heavy)}" if heavy else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+Per-stage timings of the analysis pipeline on synthetic data, with scaling over data size.
+
+Stages:
+    extract_voltages    scope.extract_voltages over a folder of Tektronix CSVs (record length × files)
+    load_folder         labtools.readers.load_folder of that folder, one reader process per core (record length)
+    loop_metrics        stream.loop_metrics + stream.decimate of one Tektronix CSV (record length)
+    pyramid_build       labtools.pyramid.build_pyramid of one Tektronix CSV (record length)
+    pyramid_window      Pyramid.window at ZOOM_WINDOWS random zooms on 1000 pixels; flat in size (record length)
+    acquire             acquire.acquire of simulated records into packed captures, instant link (record length)
+    intensity_avarage   polarimetry.intensity_avarage of one .xlsx (readings per file)
+    folder_loaders      extract_averages_from_folder + extract_uncertainties_from_folder (files)
+    fit_curve_fit       scipy curve_fit of half_wave_ff, uncached (points)
+    fit_linear          linfit.fit_cos2 on a batch of sweeps (sweeps)
+    fit_batch           fitting.fit_batch of "fresnel_rp", uncached (sweeps)
+    otsu_threshold      domains.bright_area_curve over a JPEG sequence (frames)
+    render_loops        Hysteresis.plot_heshels + savefig (record length)
+
+Every size of every stage is timed `--repeat` times on data generated once
+into a temporary folder; the best and median wall times go to
+benchmarks/results/<commit>.json next to the commit, interpreter and numpy
+version, so two runs can be compared with --compare.
+
+Usage (from the repository root):
+    python benchmarks/pipeline.py [--quick] [--repeat 3] [--stages fit_linear otsu_threshold ...]
+    python benchmarks/pipeline.py --compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+sys.path[:0] = [ROOT, os.path.join(ROOT, "magnetism"), os.path.join(ROOT, "polarbears"), os.path.dirname(__file__)]
+
+import synthetic  # noqa: E402  (needs the path above)
+
+# stage -> sizes, full run and --quick run
+SIZES = {
+    "extract_voltages": ([2500, 10000, 50000], [2500, 10000]),
+    "load_folder": ([2500, 100000, 1000000], [2500, 100000]),
+    "loop_metrics": ([2500, 100000, 1000000], [2500, 100000]),
+    "pyramid_build": ([2500, 100000, 1000000], [2500, 100000]),
+    "pyramid_window": ([2500, 100000, 1000000], [2500, 100000]),
+    "acquire": ([2500, 100000, 500000], [2500, 100000]),
+    "intensity_avarage": ([100, 1000, 10000], [100, 1000]),
+    "folder_loaders": ([10, 30, 90], [10, 30]),
+    "fit_curve_fit": ([20, 200, 2000], [20, 200]),
+    "fit_linear": ([1, 100, 10000], [1, 100]),
+    "fit_batch": ([1, 100, 1000], [1, 100]),
+    "otsu_threshold": ([10, 40, 107], [10, 20]),
+    "render_loops": ([2500, 10000, 50000], [2500, 10000]),
+}
+CSV_FILES = 5
+DOMAIN_FRAME = (680, 512)
+ZOOM_WINDOWS = 100
+
+
+def _timed(run: Callable[[], object], repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return {"best_s": min(times), "median_s": float(np.median(times))}
+
+
+def _clear_sample_cache():
+    import raw_store
+    raw_store._CACHE.clear()
+
+
+def stage_runs(stage: str, size: int, work: str, rng: np.random.Generator) -> Callable[[], object]:
+    """Generate the data of one (stage, size) point under `work` and return the timed call."""
+    if stage == "extract_voltages":
+        from scope import extract_voltages
+        paths = synthetic.tektronix_folder(os.path.join(work, "csv"), CSV_FILES, size, rng)
+        return lambda: [extract_voltages(path) for path in paths]
+    if stage == "load_folder":
+        from labtools.readers import load_folder
+        folder = os.path.join(work, "csv")
+        synthetic.tektronix_folder(folder, CSV_FILES, size, rng)
+        return lambda: load_folder(folder, jobs=None)
+    if stage == "loop_metrics":
+        from stream import decimate, loop_metrics
+        path = os.path.join(work, "loop.csv")
+        synthetic.write_tektronix_csv(path, size, rng)
+        return lambda: (loop_metrics(path), decimate(path))
+    if stage in ("pyramid_build", "pyramid_window"):
+        from labtools.pyramid import build_pyramid
+        path = os.path.join(work, "trace.csv")
+        synthetic.write_tektronix_csv(path, size, rng)
+        if stage == "pyramid_build":
+            return lambda: build_pyramid(path)
+        pyramid = build_pyramid(path)
+        x_min, x_max, _, _ = pyramid.extent()
+        spans = (x_max - x_min) * np.exp(rng.uniform(np.log(1e-4), 0, ZOOM_WINDOWS))
+        starts = x_min + rng.uniform(0, 1, ZOOM_WINDOWS) * (x_max - x_min - spans)
+        return lambda: [pyramid.window(start, start + span, 1000) for start, span in zip(starts, spans)]
+    if stage == "acquire":
+        import asyncio
+        from acquire import SimulatedScope, acquire
+        scope = SimulatedScope(size, link_rate=None, seed=int(rng.integers(2 ** 31)))
+        return lambda: asyncio.run(acquire(scope, os.path.join(work, "captures"), CSV_FILES))
+    if stage == "intensity_avarage":
+        from polarimetry import intensity_avarage
+        path = synthetic.polarimeter_sweep(os.path.join(work, "xlsx"), [0.0], size, rng)[0]
+        return lambda: intensity_avarage(path)
+    if stage == "folder_loaders":
+        from polarimetry import extract_averages_from_folder, extract_uncertainties_from_folder
+        folder = os.path.join(work, "sweep")
+        synthetic.polarimeter_sweep(folder, np.linspace(0, 360, size, endpoint=False), 100, rng)
+
+        def load():
+            _clear_sample_cache()
+            return extract_averages_from_folder(folder), extract_uncertainties_from_folder(folder)
+        return load
+    if stage == "fit_curve_fit":
+        from polarimetry import curve_fit, half_wave_ff
+        x = np.linspace(0, 360, size)
+        y = half_wave_ff(x, 1.6e-4, 30, 1e-6) + rng.normal(0, 1e-6, size)
+        return lambda: curve_fit.uncached(half_wave_ff, x, y, p0=[1e-4, 20, 0])
+    if stage == "fit_linear":
+        from linfit import fit_cos2
+        x = np.linspace(0, 360, 36)
+        y = 1.6e-4 * np.cos(np.deg2rad(x - rng.uniform(0, 180, (size, 1)))) ** 2 + rng.normal(0, 1e-6, (size, 36))
+        return lambda: fit_cos2(x, y)
+    if stage == "fit_batch":
+        from fitting import fit_batch
+        from fresnel import fresnel
+        x = np.linspace(10, 85, 16)
+        n = rng.uniform(1.4, 1.6, (size, 1))
+        y = 6e-5 * fresnel(x, n).Rp + 5e-7 + rng.normal(0, 1e-7, (size, 16))
+        return lambda: fit_batch.uncached("fresnel_rp", x, y)
+    if stage == "otsu_threshold":
+        from domains import bright_area_curve
+        folder = os.path.join(work, "frames")
+        synthetic.domain_frames(folder, size, DOMAIN_FRAME, rng)
+
+        def threshold():
+            with contextlib.redirect_stdout(io.StringIO()):  # it reports every frame number it does not find
+                return bright_area_curve(folder)
+        return threshold
+    if stage == "render_loops":
+        import matplotlib
+        matplotlib.use("Agg")
+        from matplotlib.figure import Figure
+        from Hysteresis import plot_heshels
+        folder = os.path.join(work, "loops")
+        synthetic.tektronix_folder(folder, CSV_FILES, size, rng)
+
+        def render():
+            fig = Figure()
+            plot_heshels(folder, ax=fig.add_subplot())
+            fig.savefig(io.BytesIO(), format="png", dpi=100)
+        return render
+    raise KeyError(f"Unknown stage '{stage}', known: {', '.join(SIZES)}")
+
+
+def run_benchmarks(stages: List[str], quick: bool = False, repeat: int = 3, seed: int = 0) -> dict:
+    results = {}
+    for stage in stages:
+        results[stage] = []
+        for size in SIZES[stage][1 if quick else 0]:
+            with tempfile.TemporaryDirectory() as work:
+                run = stage_runs(stage, size, work, np.random.default_rng(seed))
+                run()  # warm-up: imports, caches
+                timing = _timed(run, repeat)
+            results[stage].append({"size": size, **timing, "per_item_s": timing["best_s"] / size})
+            print(f"{stage:18s} size {size:>6d}: {timing['best_s'] * 1e3:10.2f} ms")
+    return results
+
+
+def _commit() -> tuple[str, bool]:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    return git("rev-parse", "--short", "HEAD") or "unknown", bool(git("status", "--porcelain", "--untracked-files=no"))
+
+
+def save_results(stages: dict, quick: bool) -> str:
+    commit, dirty = _commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "quick": quick,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "stages": stages,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}{'-quick' if quick else ''}.json")
+    with open(path, "w") as file:
+        json.dump(report, file, indent=1)
+    return path
+
+
+def compare(old_path: str, new_path: str):
+    """Print new/old best-time ratios for every (stage, size) both runs measured."""
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    print(f"{old['commit']} -> {new['commit']}")
+    for stage, points in new["stages"].items():
+        before = {point["size"]: point["best_s"] for point in old["stages"].get(stage, [])}
+        for point in points:
+            if point["size"] in before:
+                ratio = point["best_s"] / before[point["size"]]
+                print(f"{stage:18s} size {point['size']:>6d}: {before[point['size']] * 1e3:10.2f} ms -> "
+                      f"{point['best_s'] * 1e3:10.2f} ms  ({ratio:.2f}x)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stages", nargs="*", default=list(SIZES), choices=list(SIZES))
+    parser.add_argument("--quick", action="store_true", help="smaller sizes only")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    os.environ["FIT_CACHE"] = "0"
+    stages = run_benchmarks(args.stages, args.quick, args.repeat, args.seed)
+    print(f"results written to {save_results(stages, args.quick)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Synthetic data in the exact formats the lab loaders read, for benchmarking.
+
+    tektronix_folder   two-channel Tektronix CSV exports ("<resistance>.csv") of hysteresis loops,
+                       written by acquire.tektronix_csv (magnetism/ must be on sys.path)
+    polarimeter_sweep  polarimeter .xlsx files ("Measurement<i>.xlsx") of a cos² sweep
+    domain_frames      "grant_<H>_v_mes_<i>.jpg" domain images with a known bright fraction
+
+Every generator takes a numpy Generator, so the same seed gives the same files.
+"""
+import os
+from typing import Sequence
+
+import numpy as np
+
+SAMPLE_INTERVAL = 1e-5
+
+
+def write_tektronix_csv(path: str, record_length: int, rng: np.random.Generator, resistance: float = 1000.0):
+    """One hysteresis loop: CH1 ∝ H (sine drive), CH2 ∝ B (tanh response with a phase lag)."""
+    from acquire import tektronix_csv  # the scope format lives in one place, magnetism/acquire.py
+    times = (np.arange(record_length) - record_length / 2) * SAMPLE_INTERVAL
+    phase = 2 * np.pi * 50 * times
+    ch1 = 2.0 * np.sin(phase) + rng.normal(0, 0.02, record_length)
+    ch2 = 4.0 * np.tanh(3 * np.sin(phase - 0.3 - resistance * 1e-5)) + rng.normal(0, 0.04, record_length)
+    with open(path, "wb") as file:
+        file.write(tektronix_csv(times, ch1, ch2))
+
+
+def tektronix_folder(folder: str, count: int, record_length: int, rng: np.random.Generator) -> list[str]:
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for resistance in np.linspace(0, 16000, count).round().astype(int):
+        path = os.path.join(folder, f"{resistance}.csv")
+        write_tektronix_csv(path, record_length, rng, resistance)
+        paths.append(path)
+    return paths
+
+
+def write_polarimeter_xlsx(path: str, readings: np.ndarray, interval: float = 0.1):
+    """Polarimeter export: a settings block, then Time (s) / Current (A) rows."""
+    import pandas as pd
+    rows = [["Delay (s)", 0], ["Run Time (s)", len(readings) * interval], ["Measurement Interval (s)", interval],
+            [None, None], [None, None], ["Time (s)", "Current (A)"]]
+    rows += [[i * interval, reading] for i, reading in enumerate(readings)]
+    pd.DataFrame(rows).to_excel(path, header=False, index=False)
+
+
+def polarimeter_sweep(folder: str, angles: Sequence[float], samples: int, rng: np.random.Generator,
+                      amplitude: float = 1.6e-4, center: float = 30.0, offset: float = 1e-6) -> list[str]:
+    """One Measurement<i>.xlsx per angle, readings scattered around amplitude·cos²(angle − center) + offset."""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i, angle in enumerate(angles, start=1):
+        mean = amplitude * np.cos(np.deg2rad(angle - center)) ** 2 + offset
+        path = os.path.join(folder, f"Measurement{i}.xlsx")
+        write_polarimeter_xlsx(path, mean + rng.normal(0, 0.01 * amplitude, samples))
+        paths.append(path)
+    return paths
+
+
+def domain_frames(folder: str, count: int, size: tuple[int, int], rng: np.random.Generator) -> list[str]:
+    """JPEG frames whose bright (domain) fraction follows the applied field H over one sweep."""
+    from PIL import Image
+    os.makedirs(folder, exist_ok=True)
+    height, width = size
+    texture = rng.normal(size=(height // 8 + 1, width // 8 + 1)).repeat(8, 0).repeat(8, 1)[:height, :width]
+    fields = 5 * np.sin(np.linspace(0, 2 * np.pi, count, endpoint=False))
+    paths = []
+    for i, field in enumerate(fields):
+        bright = texture < np.tanh(field / 2) * 1.5
+        gray = np.where(bright, 200, 60) + rng.normal(0, 10, size)
+        image = np.clip(gray, 0, 255).astype(np.uint8)
+        path = os.path.join(folder, f"grant_{field:.1f}_v_mes_{i}.jpg")
+        Image.fromarray(np.stack([image] * 3, axis=-1)).save(path, quality=90)
+        paths.append(path)
+    return paths
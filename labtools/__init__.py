@@ -0,0 +1,8 @@
+"""
+Shared tooling for the magnetism/ and polarbears/ lab scripts.
+
+The lab scripts stay plain scripts run from their own folders; this package
+lives at the repository root, so run them with the root on PYTHONPATH
+(PyCharm does this for the project's content root) and run the tools here
+with `python -m labtools.<tool>` from the root.
+"""
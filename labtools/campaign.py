@@ -0,0 +1,326 @@
+"""
+Incremental, manifest-driven rebuild of the campaign's fits and figures.
+
+`campaign.toml` (at the repository root) declares
+    [datasets.<name>]        folder (relative to the root), optional angles and loader
+    [analyses.<name>]        either module + function (called with `args`, in the
+                             module's working directory), or model + dataset (a
+                             fitting-registry fit of the dataset's means)
+    [figures."<module>/<figure>"]   a FIGURES entry of a labtools.render module
+and which datasets (`datasets`) and analyses (`after`) every task depends on.
+
+The runner orders the tasks by their dependencies and runs the ready ones in
+parallel worker processes. Each task is keyed by the content of its datasets'
+files, the source of its module and of the lab and labtools modules it
+imports, its options, and the keys of the tasks it depends on. A task whose key matches the
+last successful run and whose output still exists is skipped, so editing one
+Measurement*.xlsx rebuilds only the fits and figures that read its folder.
+File digests and task keys are kept in .campaign/state.json, analysis results
+are pickled to .campaign/results/<name>.pkl and figures are written where
+labtools.render puts them.
+
+Usage (from the repository root):
+    python -m labtools.campaign [--manifest campaign.toml] [--out rendered] [--jobs 4] [--force] [task ...]
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tomllib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from graphlib import TopologicalSorter
+from typing import List, NamedTuple, Optional, Tuple
+
+from labtools.render import MODULES, ROOT, _load_module, render_figure
+
+STATE_DIR = os.path.join(ROOT, ".campaign")
+FITTING = ("polarbears", "fitting", "polarbears")  # where model analyses run
+DEFAULT_LOADER = "raw_store.load_samples"
+
+
+class Task(NamedTuple):
+    name: str
+    kind: str  # "figure", "function" or "model"
+    module: str  # render module for figures and functions, loader module for models
+    target: str  # figure name, function name or registry model
+    datasets: tuple
+    after: tuple
+    options: dict  # function kwargs, or the model's dataset settings
+
+
+def _spec(module: str) -> Tuple[str, str, str]:
+    for spec in MODULES:
+        if spec[1] == module:
+            return spec
+    raise KeyError(f"Unknown module '{module}', known: {', '.join(spec[1] for spec in MODULES)}")
+
+
+# --- Manifest ---
+
+def load_tasks(manifest_path: str) -> Tuple[dict, dict]:
+    """(datasets, tasks) declared in the manifest."""
+    with open(manifest_path, "rb") as file:
+        manifest = tomllib.load(file)
+    datasets = manifest.get("datasets", {})
+    tasks = {}
+    for name, analysis in manifest.get("analyses", {}).items():
+        if "model" in analysis:
+            dataset = datasets[analysis["dataset"]]
+            loader = dataset.get("loader", DEFAULT_LOADER)
+            options = {"folder": dataset["folder"], "angles": dataset.get("angles"), "loader": loader,
+                       "lab": dataset.get("lab", dataset["folder"].split("/")[0])}
+            tasks[name] = Task(name, "model", loader.rsplit(".", 1)[0], analysis["model"], (analysis["dataset"],),
+                               tuple(analysis.get("after", ())), options)
+        else:
+            tasks[name] = Task(name, "function", analysis["module"], analysis["function"],
+                               tuple(analysis.get("datasets", ())), tuple(analysis.get("after", ())),
+                               analysis.get("args", {}))
+    for name, figure in manifest.get("figures", {}).items():
+        module, target = name.split("/", 1)
+        tasks[name] = Task(name, "figure", module, target, tuple(figure.get("datasets", ())),
+                           tuple(figure.get("after", ())), {})
+    for task in tasks.values():
+        for dataset in task.datasets:
+            if dataset not in datasets:
+                raise KeyError(f"Task '{task.name}' uses undeclared dataset '{dataset}'")
+        for upstream in task.after:
+            if upstream not in tasks:
+                raise KeyError(f"Task '{task.name}' runs after undeclared task '{upstream}'")
+    return datasets, tasks
+
+
+# --- Fingerprints ---
+
+def _file_digest(path: str, files: dict) -> str:
+    """Content digest of a file, reused from the state while its mtime and size are unchanged."""
+    stat = os.stat(path)
+    cached = files.get(path)
+    if cached is None or cached[:2] != [stat.st_mtime_ns, stat.st_size]:
+        with open(path, "rb") as file:
+            cached = [stat.st_mtime_ns, stat.st_size, hashlib.sha256(file.read()).hexdigest()]
+        files[path] = cached
+    return cached[2]
+
+
+def dataset_digest(folder: str, files: dict) -> str:
+    path = os.path.join(ROOT, folder)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"Dataset folder '{folder}' does not exist")
+    digest = hashlib.sha256()
+    for directory, subdirectories, names in os.walk(path):
+        subdirectories.sort()
+        for name in sorted(names):
+            file = os.path.join(directory, name)
+            digest.update(f"{os.path.relpath(file, path)}:{_file_digest(file, files)};".encode())
+    return digest.hexdigest()
+
+
+def _module_path(name: str, search: List[str]) -> Optional[str]:
+    """Source file of a flat lab import from `search`, or of a dotted import of a package under the root."""
+    if "." not in name:
+        for directory in search:
+            path = os.path.join(directory, f"{name}.py")
+            if os.path.isfile(path):
+                return path
+    parts = name.split(".")
+    for path in (os.path.join(ROOT, *parts) + ".py", os.path.join(ROOT, *parts, "__init__.py")):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _local_modules(module_dir: str, module: str) -> List[str]:
+    """Source files of `module` and of the lab and labtools modules it imports, transitively."""
+    search = [os.path.join(ROOT, module_dir)]
+    parent = os.path.dirname(search[0])
+    if parent != ROOT:
+        search.append(parent)  # scripts in subfolders (half wave/) import from their lab folder
+    found, pending = [], [module]
+    while pending:
+        path = _module_path(pending.pop(), search)
+        if path is None or path in found:
+            continue
+        found.append(path)
+        with open(path, encoding="utf-8") as file:
+            tree = ast.parse(file.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                pending.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                pending.append(node.module)
+                pending.extend(f"{node.module}.{alias.name}" for alias in node.names)  # from labtools import x
+    return sorted(found)
+
+
+def task_key(task: Task, datasets: dict, upstream_keys: dict, files: dict) -> str:
+    digest = hashlib.sha256()
+    digest.update(json.dumps(task._asdict(), sort_keys=True, default=list).encode())
+    for name in task.datasets:
+        digest.update(f"{name}:{dataset_digest(datasets[name]['folder'], files)};".encode())
+    if task.kind == "model":
+        code = _local_modules(*FITTING[:2]) + _local_modules(task.options["lab"], task.module)
+    else:
+        code = _local_modules(*_spec(task.module)[:2])
+    for path in sorted(set(code)):
+        digest.update(f"{os.path.relpath(path, ROOT)}:{_file_digest(path, files)};".encode())
+    for name in task.after:
+        digest.update(f"{name}:{upstream_keys[name]};".encode())
+    return digest.hexdigest()
+
+
+def _output(task: Task, out_dir: str) -> str:
+    if task.kind == "figure":
+        return os.path.join(out_dir, task.module, task.target)
+    return os.path.join(STATE_DIR, "results", f"{task.name}.pkl")
+
+
+# --- Execution (in worker processes) ---
+
+def _save_result(path: str, result):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "wb") as file:
+        pickle.dump(result, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def execute(task: Task, out_dir: str) -> str:
+    """Run one task and return the path it wrote."""
+    if task.kind == "figure":
+        return render_figure(*_spec(task.module), task.target, out_dir)
+    output = _output(task, out_dir)
+    if task.kind == "function":
+        function = getattr(_load_module(*_spec(task.module)), task.target)
+        _save_result(output, function(**task.options))
+        return output
+
+    import numpy as np
+    fitting = _load_module(*FITTING)
+    loader_module, loader = task.options["loader"].rsplit(".", 1)
+    loaded = getattr(_load_module(task.options["lab"], loader_module, task.options["lab"]), loader)(
+        os.path.join(ROOT, task.options["folder"]))
+    if hasattr(loaded, "offsets"):  # RaggedSamples of raw readings
+        angles, y, sigma = loaded.angles, loaded.mean(), loaded.std()
+    else:  # (angles, intensities, uncertainties)
+        angles, y, sigma = loaded
+    if task.options["angles"] is not None:
+        angles = task.options["angles"]
+    sigma = np.where(sigma > 0, sigma, np.inf)
+    result = fitting.fit_batch(task.target, np.asarray(angles, dtype=float), y, sigma)
+    _save_result(output, {"model": task.target, "names": fitting.get_model(task.target).params,
+                          **{field: np.asarray(value) for field, value in result._asdict().items()}})
+    return output
+
+
+# --- Runner ---
+
+def _load_state() -> dict:
+    try:
+        with open(os.path.join(STATE_DIR, "state.json")) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {"files": {}, "tasks": {}}
+
+
+def _save_state(state: dict):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = os.path.join(STATE_DIR, "state.json")
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(state, file, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def _with_upstream(tasks: dict, selected: List[str]) -> dict:
+    keep, pending = set(), list(selected)
+    while pending:
+        name = pending.pop()
+        if name not in tasks:
+            raise KeyError(f"Unknown task '{name}'")
+        if name not in keep:
+            keep.add(name)
+            pending.extend(tasks[name].after)
+    return {name: task for name, task in tasks.items() if name in keep}
+
+
+def run_campaign(
+    manifest_path: str = os.path.join(ROOT, "campaign.toml"),
+    out_dir: str = "rendered",
+    jobs: Optional[int] = None,
+    force: bool = False,
+    selected: Optional[List[str]] = None
+) -> Tuple[List[str], List[str], List[Tuple[str, str]]]:
+    """
+    Bring the campaign's outputs up to date.
+
+    selected: task names to update (with the tasks they run after), None for all.
+    Returns (built tasks, skipped tasks, failures as (task, message)). A failed task
+    fails its dependents but not unrelated tasks.
+    """
+    out_dir = os.path.abspath(out_dir)
+    datasets, tasks = load_tasks(manifest_path)
+    if selected:
+        tasks = _with_upstream(tasks, selected)
+    state = _load_state()
+    sorter = TopologicalSorter({name: task.after for name, task in tasks.items()})
+    sorter.prepare()
+    keys, built, skipped, failures, failed = {}, [], [], [], set()
+
+    with ProcessPoolExecutor(jobs) as pool:
+        running = {}
+        while sorter.is_active():
+            for name in sorter.get_ready():
+                task = tasks[name]
+                try:
+                    if failed.intersection(task.after):
+                        raise RuntimeError("an upstream task failed")
+                    keys[name] = task_key(task, datasets, keys, state["files"])
+                except (OSError, RuntimeError, KeyError) as e:  # KeyError: unknown module
+                    e = e.args[0] if isinstance(e, KeyError) and e.args else e
+                    failed.add(name)
+                    failures.append((name, str(e)))
+                    print(f"FAILED {name}: {e}")
+                    sorter.done(name)
+                    continue
+                if not force and state["tasks"].get(name) == keys[name] and os.path.exists(_output(task, out_dir)):
+                    skipped.append(name)
+                    sorter.done(name)
+                    continue
+                running[pool.submit(execute, task, out_dir)] = name
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    state["tasks"][name] = keys[name]
+                    built.append(name)
+                    print(f"built {name}")
+                except Exception as e:
+                    state["tasks"].pop(name, None)
+                    failed.add(name)
+                    failures.append((name, str(e)))
+                    print(f"FAILED {name}: {e}")
+                sorter.done(name)
+            _save_state(state)
+    _save_state(state)
+    return built, skipped, failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("tasks", nargs="*", help="tasks to update, with what they depend on (default: all)")
+    parser.add_argument("--manifest", default=os.path.join(ROOT, "campaign.toml"))
+    parser.add_argument("--out", default="rendered", help="figure output directory")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="rebuild even up-to-date tasks")
+    args = parser.parse_args(argv)
+    built, skipped, failures = run_campaign(args.manifest, args.out, args.jobs, args.force, args.tasks or None)
+    print(f"{len(built)} built, {len(skipped)} up to date, {len(failures)} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
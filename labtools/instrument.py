@@ -0,0 +1,177 @@
+"""
+Per-stage timing, call counts, bytes read and peak memory of the lab pipelines.
+
+Loaders, fitters, thresholding and plot functions in magnetism/ and
+polarbears/ are wrapped with `instrument`; smaller blocks use `measure`.
+Nothing happens unless the LAB_PROFILE environment variable is set:
+    LAB_PROFILE=1         wall time, calls and bytes read per stage
+    LAB_PROFILE=memory    also peak traced memory per stage (tracemalloc, slows the run)
+When it is unset, `instrument` returns the function itself and `measure`
+a shared no-op context, so the hooks cost nothing measurable.
+
+At exit the stages are printed to stderr and written as JSON to
+LAB_PROFILE_REPORT (default lab_profile.json in the working directory). Worker
+processes (labtools.render, labtools.campaign, bootstrap) write their own
+part files, which the main process merges into the report.
+
+Example:
+    LAB_PROFILE=memory python -m labtools.render --jobs 1 refraction
+"""
+import atexit
+import functools
+import glob
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Optional, Union
+
+_MODES = {mode.strip() for mode in os.environ.get("LAB_PROFILE", "").lower().split(",")} - {"", "0"}
+ENABLED = bool(_MODES)
+MEMORY = "memory" in _MODES
+REPORT = os.path.abspath(os.environ.get("LAB_PROFILE_REPORT", "lab_profile.json"))
+
+_stats: dict = {}
+_frames: list = []  # open stages, for nested peak memory
+_started = time.perf_counter()
+_NULL = nullcontext()
+
+
+def _size(path) -> int:
+    """Bytes in a file, or in the files directly inside a folder."""
+    try:
+        if os.path.isdir(path):
+            return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+        return os.path.getsize(path)
+    except (OSError, TypeError, ValueError):
+        return 0
+
+
+def _record(stage: str, wall: float, read: int, peak: int):
+    entry = _stats.setdefault(stage, {"calls": 0, "wall_s": 0.0, "bytes_read": 0, "peak_bytes": 0})
+    entry["calls"] += 1
+    entry["wall_s"] += wall
+    entry["bytes_read"] += read
+    entry["peak_bytes"] = max(entry["peak_bytes"], peak)
+
+
+@contextmanager
+def _measured(stage: str, path=None):
+    if _owner != os.getpid():
+        _adopt()
+    frame = {"start": 0, "child_peak": 0}
+    if MEMORY:
+        frame["start"] = tracemalloc.get_traced_memory()[0]
+        if _frames:  # keep the enclosing stage's peak before restarting the counter
+            _frames[-1]["child_peak"] = max(_frames[-1]["child_peak"], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    _frames.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start
+        _frames.pop()
+        peak = 0
+        if MEMORY:
+            absolute = max(tracemalloc.get_traced_memory()[1], frame["child_peak"])
+            peak = absolute - frame["start"]
+            if _frames:
+                _frames[-1]["child_peak"] = max(_frames[-1]["child_peak"], absolute)
+        _record(stage, wall, _size(path) if path is not None else 0, peak)
+
+
+def measure(stage: str, path=None):
+    """Context manager timing a block as `stage`; `path` (file or folder) counts as bytes read."""
+    return _measured(stage, path) if ENABLED else _NULL
+
+
+def instrument(function: Optional[Callable] = None, *, stage: Optional[str] = None,
+               path_arg: Optional[str] = None) -> Union[Callable, Callable[[Callable], Callable]]:
+    """
+    Decorator timing every call of a function as one stage (default "<module>.<function>").
+
+    path_arg: name of the parameter holding the file or folder the call reads, for bytes read.
+    Usable bare (@instrument) or with options (@instrument(path_arg="file")).
+    """
+    def decorate(function: Callable) -> Callable:
+        if not ENABLED:
+            return function
+        name = stage or f"{function.__module__}.{function.__qualname__}"
+        position = None
+        if path_arg is not None:
+            import inspect
+            position = list(inspect.signature(function).parameters).index(path_arg)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            path = None
+            if path_arg is not None:
+                path = kwargs.get(path_arg, args[position] if position < len(args) else None)
+            with _measured(name, path):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorate if function is None else decorate(function)
+
+
+# --- Report ---
+
+def _merge(stages: dict, other: dict):
+    for stage, entry in other.items():
+        merged = stages.setdefault(stage, {"calls": 0, "wall_s": 0.0, "bytes_read": 0, "peak_bytes": 0})
+        for key in ("calls", "wall_s", "bytes_read"):
+            merged[key] += entry[key]
+        merged["peak_bytes"] = max(merged["peak_bytes"], entry["peak_bytes"])
+
+
+def _write_part():
+    """Stages of a worker process, left next to the report for the main process to merge."""
+    with open(f"{REPORT}.{os.getpid()}.part", "w") as file:
+        json.dump(_stats, file)
+
+
+def _write_report():
+    stages = {}
+    _merge(stages, _stats)
+    for part in glob.glob(f"{glob.escape(REPORT)}.*.part"):
+        with open(part) as file:
+            _merge(stages, json.load(file))
+        os.remove(part)
+    stages = dict(sorted(stages.items(), key=lambda item: -item[1]["wall_s"]))
+    report = {"command": sys.argv, "wall_s": time.perf_counter() - _started, "memory": MEMORY, "stages": stages}
+    with open(REPORT, "w") as file:
+        json.dump(report, file, indent=1)
+    print(f"\n{'stage':48s} {'calls':>6s} {'wall [s]':>9s} {'read [MB]':>10s}"
+          + (f" {'peak [MB]':>10s}" if MEMORY else ""), file=sys.stderr)
+    for stage, entry in stages.items():
+        print(f"{stage:48s} {entry['calls']:6d} {entry['wall_s']:9.3f} {entry['bytes_read'] / 2 ** 20:10.2f}"
+              + (f" {entry['peak_bytes'] / 2 ** 20:10.2f}" if MEMORY else ""), file=sys.stderr)
+    print(f"profile written to {REPORT}", file=sys.stderr)
+
+
+def _adopt():
+    """
+    First stage in a worker process: drop what a forked parent had counted and leave a part
+    file at exit. Registered here rather than at fork, as multiprocessing clears its exit
+    hooks when a worker starts.
+    """
+    global _owner
+    from multiprocessing import util
+    _stats.clear()
+    _frames.clear()
+    _owner = os.getpid()
+    util.Finalize(None, _write_part, exitpriority=0)
+
+
+_owner = None  # process whose stages _stats holds
+if ENABLED:
+    if MEMORY:
+        import tracemalloc
+        tracemalloc.start()
+    import multiprocessing
+    if multiprocessing.parent_process() is None:
+        _owner = os.getpid()
+        os.environ["LAB_PROFILE_REPORT"] = REPORT  # workers that chdir or spawn write next to it
+        atexit.register(_write_report)
@@ -0,0 +1,280 @@
+"""
+Min/max pyramids of long records, and a viewer that redraws from them on every pan or zoom.
+
+Plotting a 10⁷-sample scope record hands matplotlib 10⁷ points on every
+redraw, although the axes are only a thousand pixels wide. A pyramid keeps,
+per channel, the minimum and maximum of every bucket of 2^k samples for
+k = BASE_LEVEL ... top, where the top level has at most TOP_BUCKETS buckets.
+Each level is built from the one below by pairwise min/max while the record
+streams through in chunks, so it costs one pass and one chunk of memory:
+
+    build_pyramid(file)     -> Pyramid, saved as <folder>/.pyramid/<file>.npz
+    load_pyramid(file)      -> the saved pyramid, rebuilt if the capture changed
+    pyramid.window(x0, x1, pixels) -> (x, (channels, m)) to draw
+
+`window` picks the coarsest level whose buckets are still narrower than a
+pixel and returns each bucket in the window as a (min, max) pair, which drawn
+as one line is the record's envelope at screen resolution. When fewer than
+2^BASE_LEVEL samples fall on a pixel the raw samples are drawn instead. Either
+way a redraw touches O(pixels) points, whatever the record length.
+
+Pyramids live in a hidden folder next to the capture, which the folder
+readers skip. CSV exports keep a float32 copy of the samples in the pyramid,
+so zooming in never parses the CSV again; packed captures are read back.
+
+    python -m labtools.pyramid capture.csv [--rows ch1 ch2] [--build-only]
+"""
+import argparse
+import os
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from labtools.instrument import instrument
+from labtools.readers import iter_chunks, sniff
+
+BASE_LEVEL = 4  # finest stored level: buckets of 16 samples
+TOP_BUCKETS = 2048  # the coarsest level has at most this many buckets
+CHUNK = 65536  # samples per streamed chunk
+PYRAMID_DIR = ".pyramid"
+
+
+def pyramid_path(file: str) -> str:
+    folder, name = os.path.split(file)
+    return os.path.join(folder, PYRAMID_DIR, name + ".npz")
+
+
+def _signature(file: str) -> np.ndarray:
+    stat = os.stat(file)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def top_level(length: int) -> int:
+    """Level whose buckets cover `length` samples in at most TOP_BUCKETS buckets."""
+    return max(BASE_LEVEL, int(np.ceil(np.log2(max(length, 1) / TOP_BUCKETS))))
+
+
+def _pairwise(values: np.ndarray, reduce) -> np.ndarray:
+    """reduce over neighbouring pairs along the last axis; an odd last bucket stands alone."""
+    return reduce.reduceat(values, np.arange(0, values.shape[-1], 2), axis=-1)
+
+
+class Pyramid(NamedTuple):
+    rows: tuple  # channel names
+    length: int  # samples per channel
+    t0: float  # x of sample 0
+    dt: float  # x step between samples (1 when the record has no time row)
+    lows: tuple  # lows[i]: (channels, ceil(length / 2^(BASE_LEVEL + i))) bucket minima
+    highs: tuple  # the matching maxima
+    raw: Optional[np.ndarray] = None  # (channels, length) float32, None to read the source back
+    source: str = ""
+
+    @property
+    def top(self) -> int:
+        return BASE_LEVEL + len(self.lows) - 1
+
+    def samples(self) -> np.ndarray:
+        """(channels, length) raw samples, read back from the source when the pyramid does not store them."""
+        if self.raw is None:
+            from labtools.readers import read
+            return read(self.source, self.rows)
+        return self.raw
+
+    def level(self, samples: int, pixels: int) -> int:
+        """The level whose buckets are closest to, without exceeding, one pixel's worth of `samples`."""
+        if samples <= pixels:
+            return 0
+        return min(int(np.log2(samples / pixels)), self.top)
+
+    def span(self, start: float, stop: float) -> Tuple[int, int]:
+        """[first, last) sample indices covering x in [start, stop]."""
+        first = int(np.clip(np.floor((start - self.t0) / self.dt), 0, self.length))
+        return first, int(np.clip(np.ceil((stop - self.t0) / self.dt) + 1, first, self.length))
+
+    def window(self, start: float, stop: float, pixels: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(x, (channels, points)) to draw the record between x = start and stop on `pixels` columns."""
+        first, last = self.span(start, stop)
+        level = self.level(last - first, max(int(pixels), 1))
+        if level < BASE_LEVEL:
+            return self.t0 + self.dt * np.arange(first, last), self.samples()[:, first:last]
+        width = 1 << level
+        lows, highs = self.lows[level - BASE_LEVEL], self.highs[level - BASE_LEVEL]
+        buckets = np.arange(first >> level, min(-(-last // width), lows.shape[1]))
+        x = self.t0 + self.dt * (buckets * width + (width - 1) / 2)
+        values = np.stack([lows[:, buckets], highs[:, buckets]], axis=-1).reshape(len(self.rows), -1)
+        return np.repeat(x, 2), values
+
+    def extent(self) -> Tuple[float, float, float, float]:
+        """(x min, x max, y min, y max) over every channel."""
+        return (self.t0, self.t0 + self.dt * max(self.length - 1, 0),
+                float(np.nanmin(self.lows[-1])), float(np.nanmax(self.highs[-1])))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        levels = {f"low{i}": low for i, low in enumerate(self.lows)}
+        levels.update({f"high{i}": high for i, high in enumerate(self.highs)})
+        if self.raw is not None:
+            levels["raw"] = self.raw
+        signature = _signature(self.source) if self.source else np.zeros(2, dtype=np.int64)
+        np.savez(path, rows=np.array(self.rows), length=self.length, t0=self.t0, dt=self.dt,
+                 levels=len(self.lows), signature=signature, **levels)
+
+
+class PyramidBuilder:
+    """
+    Min/max pyramid of a record fed in chunks of any size.
+
+    Samples are reduced once a whole top-level bucket is buffered, so every
+    bucket of every level is complete when it is reduced; the tail is reduced
+    by `result`.
+    """
+
+    def __init__(self, rows: Iterable[str], length: int, keep_raw: bool = True):
+        self.rows = tuple(rows)
+        self.top = top_level(length)
+        self.pending = np.empty((len(self.rows), 0), dtype=np.float32)
+        self.lows = [[] for _ in range(BASE_LEVEL, self.top + 1)]
+        self.highs = [[] for _ in range(BASE_LEVEL, self.top + 1)]
+        self.raw = [] if keep_raw else None
+        self.length = 0
+
+    def _reduce(self, values: np.ndarray):
+        low = np.minimum.reduceat(values, np.arange(0, values.shape[1], 1 << BASE_LEVEL), axis=1)
+        high = np.maximum.reduceat(values, np.arange(0, values.shape[1], 1 << BASE_LEVEL), axis=1)
+        for lows, highs in zip(self.lows, self.highs):
+            lows.append(low)
+            highs.append(high)
+            low, high = _pairwise(low, np.minimum), _pairwise(high, np.maximum)
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float32).reshape(len(self.rows), -1)
+        if self.raw is not None:
+            self.raw.append(values)
+        self.length += values.shape[1]
+        pending = np.concatenate([self.pending, values], axis=1)
+        whole = pending.shape[1] >> self.top << self.top
+        if whole:
+            self._reduce(pending[:, :whole])
+        self.pending = pending[:, whole:]
+
+    def result(self, t0: float = 0.0, dt: float = 1.0, source: str = "") -> Pyramid:
+        if self.pending.shape[1]:
+            self._reduce(self.pending)
+            self.pending = self.pending[:, :0]
+        empty = np.empty((len(self.rows), 0), dtype=np.float32)
+        lows = tuple(np.concatenate(level, axis=1) if level else empty for level in self.lows)
+        highs = tuple(np.concatenate(level, axis=1) if level else empty for level in self.highs)
+        raw = None if self.raw is None else np.concatenate(self.raw or [empty], axis=1)
+        return Pyramid(self.rows, self.length, float(t0), float(dt), lows, highs, raw, source)
+
+
+@instrument(path_arg="file")
+def build_pyramid(file: str, rows: Optional[Tuple[str, ...]] = None, chunk: int = CHUNK,
+                  save: bool = True) -> Pyramid:
+    """
+    Pyramid of every channel of `file` (all rows but "t" by default), in one streaming pass.
+    x is the time row when the format has one, else the sample index.
+    """
+    file_format = sniff(file)
+    channels = tuple(rows or (row for row in file_format.rows if row != "t"))
+    timed = "t" in file_format.rows
+    builder = PyramidBuilder(channels, file_format.length(file), keep_raw=file_format.name != "packed")
+    t0 = t_last = None
+    for values in iter_chunks(file, chunk, (("t",) if timed else ()) + channels):
+        if timed:
+            t0 = values[0, 0] if t0 is None else t0
+            t_last = values[0, -1]
+            values = values[1:]
+        builder.update(values)
+    dt = (t_last - t0) / (builder.length - 1) if timed and builder.length > 1 else 1.0
+    pyramid = builder.result(t0 if timed else 0.0, dt, file)
+    if save:
+        pyramid.save(pyramid_path(file))
+    return pyramid
+
+
+def load_pyramid(file: str, rows: Optional[Tuple[str, ...]] = None) -> Pyramid:
+    """The stored pyramid of `file`, built first if it is missing or older than the capture."""
+    path = pyramid_path(file)
+    if os.path.exists(path):
+        with np.load(path) as stored:
+            current = np.array_equal(stored["signature"], _signature(file))
+            names = tuple(str(row) for row in stored["rows"])
+            if current and (rows is None or set(rows) <= set(names)):
+                count = int(stored["levels"])
+                pyramid = Pyramid(names, int(stored["length"]), float(stored["t0"]), float(stored["dt"]),
+                                  tuple(stored[f"low{i}"] for i in range(count)),
+                                  tuple(stored[f"high{i}"] for i in range(count)),
+                                  stored["raw"] if "raw" in stored.files else None, file)
+                return select(pyramid, rows) if rows else pyramid
+    return build_pyramid(file, rows)
+
+
+def select(pyramid: Pyramid, rows: Tuple[str, ...]) -> Pyramid:
+    """The pyramid of some of its channels."""
+    pick = [pyramid.rows.index(row) for row in rows]
+    return pyramid._replace(rows=tuple(rows), lows=tuple(low[pick] for low in pyramid.lows),
+                            highs=tuple(high[pick] for high in pyramid.highs),
+                            raw=None if pyramid.raw is None else pyramid.raw[pick])
+
+
+# --- Viewer ---
+
+class PyramidViewer:
+    """
+    One line per channel, redrawn from the pyramid whenever the x range or the
+    axes size changes, so panning and zooming cost O(pixels) per frame.
+    """
+
+    def __init__(self, pyramid: Pyramid, ax=None):
+        import matplotlib.pyplot as plt
+        self.pyramid = pyramid
+        self.ax = plt.gca() if ax is None else ax
+        self.lines = [self.ax.plot([], [], lw=0.8, label=row)[0] for row in pyramid.rows]
+        x_min, x_max, y_min, y_max = pyramid.extent()
+        margin = 0.05 * (y_max - y_min or 1.0)
+        self.ax.set_autoscale_on(False)
+        self.ax.set_xlim(x_min, x_max if x_max > x_min else x_min + 1)
+        self.ax.set_ylim(y_min - margin, y_max + margin)
+        self.ax.legend(loc="upper right")
+        self.level = None
+        self.ax.callbacks.connect("xlim_changed", self.redraw)
+        self.ax.figure.canvas.mpl_connect("resize_event", self.redraw)
+        self.redraw()
+
+    def redraw(self, *_):
+        start, stop = sorted(self.ax.get_xlim())
+        pixels = max(int(self.ax.bbox.width), 1)
+        first, last = self.pyramid.span(start, stop)
+        self.level = self.pyramid.level(last - first, pixels)
+        if self.level < BASE_LEVEL and self.pyramid.raw is None:  # zoomed past the pyramid: decode once
+            self.pyramid = self.pyramid._replace(raw=self.pyramid.samples())
+        x, values = self.pyramid.window(start, stop, pixels)
+        for line, channel in zip(self.lines, values):
+            line.set_data(x, channel)
+        self.ax.figure.canvas.draw_idle()
+
+
+def view(file: str, rows: Optional[Tuple[str, ...]] = None, ax=None) -> PyramidViewer:
+    """Plot `file` through its pyramid; keep the returned viewer alive while the figure is open."""
+    import matplotlib.pyplot as plt
+    pyramid = load_pyramid(file, rows)
+    viewer = PyramidViewer(pyramid, ax)
+    viewer.ax.set_xlabel("t [s]" if "t" in sniff(file).rows else "sample")
+    viewer.ax.set_title(os.path.basename(file))
+    if ax is None:
+        plt.show()
+    return viewer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a capture's min/max pyramid and browse it")
+    parser.add_argument("file")
+    parser.add_argument("--rows", nargs="+", default=None, help="channels to show (default: all)")
+    parser.add_argument("--build-only", action="store_true", help="write the pyramid without opening a window")
+    args = parser.parse_args()
+    if args.build_only:
+        built = build_pyramid(args.file, tuple(args.rows) if args.rows else None)
+        print(f"{pyramid_path(args.file)}: {built.length} samples, levels {BASE_LEVEL}-{built.top}")
+    else:
+        view(args.file, tuple(args.rows) if args.rows else None)
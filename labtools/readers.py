@@ -0,0 +1,268 @@
+"""
+One reader for every data file the labs produce, chosen from the file's own header.
+
+    tektronix2    two-channel Tektronix CSV export      rows (t, ch1, ch2)
+    tektronix1    single-channel Tektronix CSV export   rows (t, ch1)
+    polarimeter   polarimeter .xlsx export              rows (current,)
+    packed        packed scope capture (.npz, magnetism/acquire.py)  rows (t, ch1, ch2)
+
+`sniff` looks at the first bytes (a CSV's "Record Length" row and its column
+count, or the members of a zip container), so a file's name or suffix does
+not matter. Every reader returns a (rows, samples) float array and includes
+the first sample (pandas' default header row used to swallow it). The CSV
+path is pandas' C parser restricted to the sample columns; the .xlsx path
+pulls the numeric cells of column B straight out of the sheet XML.
+
+`load_folder` reads a whole folder into one NaN-padded (files, rows, samples)
+array, allocated once from the lengths the headers announce, next to an index
+table of the files in natural order. With jobs > 1 the files are parsed in
+worker processes that write into that array in shared memory.
+"""
+import os
+import re
+import zipfile
+from typing import Callable, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from labtools.instrument import instrument
+
+SNIFF_BYTES = 4096
+POLARIMETER_FIRST_ROW = 7  # first reading of a polarimeter sheet (1-based, below "Time (s) | Current (A)")
+
+
+def natural_key(file: str):
+    """Sort key ordering "Measurement2" before "Measurement10"; names without digits go last."""
+    digits = ''.join(filter(str.isdigit, file))
+    return (0, int(digits), file) if digits else (1, 0, file)
+
+
+def folder_files(folder_name: str, suffix: str = "") -> list[str]:
+    """Paths of the files in `folder_name` ending with `suffix`, in natural order (hidden entries skipped)."""
+    file_lst = [f for f in os.listdir(folder_name) if f.endswith(suffix) and not f.startswith(".")]
+    file_lst.sort(key=natural_key)
+    return [f"{folder_name}{os.sep}{file}" for file in file_lst]
+
+
+class Format(NamedTuple):
+    name: str
+    rows: tuple  # names of the rows `read` returns
+    sniff: Callable[[bytes, str], bool]  # (first SNIFF_BYTES of the file, path) -> is this format
+    read: Callable[[str], np.ndarray]  # path -> (len(rows), samples)
+    length: Callable[[str], int]  # path -> samples, from the header alone
+    chunks: Optional[Callable[[str, int], Iterator[np.ndarray]]] = None  # streamed read; None = read, then slice
+
+
+FORMATS: dict = {}
+
+
+def register_format(name: str, rows, sniff: Callable, read: Callable, length: Callable,
+                    chunks: Optional[Callable] = None) -> Format:
+    """Add a format; formats registered later are tried first."""
+    file_format = Format(name, tuple(rows), sniff, read, length, chunks)
+    FORMATS[name] = file_format
+    return file_format
+
+
+# --- Tektronix CSV ---
+
+def _first_row(head: bytes) -> list:
+    return head.split(b"\n", 1)[0].rstrip(b"\r").split(b",")
+
+
+def _tektronix_length(file: str) -> int:
+    with open(file, "rb") as handle:
+        return int(_first_row(handle.read(SNIFF_BYTES))[1])
+
+
+def _read_csv_columns(file: str, columns: list) -> np.ndarray:
+    import pandas as pd
+    return pd.read_csv(file, header=None, usecols=columns, dtype=float, engine="c").to_numpy().T
+
+
+def _csv_chunks(file: str, columns: list, chunk: int) -> Iterator[np.ndarray]:
+    import pandas as pd
+    with pd.read_csv(file, header=None, usecols=columns, chunksize=chunk, dtype=float, engine="c") as reader:
+        for frame in reader:
+            yield frame.to_numpy().T
+
+
+register_format(
+    "tektronix1", ("t", "ch1"),
+    lambda head, path: head.startswith(b"Record Length,") and len(_first_row(head)) <= 6,
+    lambda file: _read_csv_columns(file, [3, 4]),
+    _tektronix_length,
+    lambda file, chunk: _csv_chunks(file, [3, 4], chunk),
+)
+register_format(
+    "tektronix2", ("t", "ch1", "ch2"),
+    lambda head, path: head.startswith(b"Record Length,") and len(_first_row(head)) >= 11,
+    lambda file: _read_csv_columns(file, [3, 4, 10]),
+    _tektronix_length,
+    lambda file, chunk: _csv_chunks(file, [3, 4, 10], chunk),
+)
+
+
+# --- Zip containers: polarimeter .xlsx and packed captures ---
+
+_NUMERIC_CELL = re.compile(rb'<c r="B(\d+)"(?: s="\d+")?(?: t="n")?>(?:<f>[^<]*</f>)?<v>([^<]*)</v>')  # numbers only
+_DIMENSION = re.compile(rb'<dimension ref="[A-Z]+\d+:[A-Z]+(\d+)"')
+
+
+def _zip_members(head: bytes, path: str) -> list:
+    if not head.startswith(b"PK\x03\x04"):
+        return []
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return archive.namelist()
+    except zipfile.BadZipFile:
+        return []
+
+
+def _sheet(archive: zipfile.ZipFile) -> str:
+    return next(name for name in archive.namelist() if name.startswith("xl/worksheets/sheet"))
+
+
+def _read_polarimeter(file: str) -> np.ndarray:
+    """Numeric cells of column B from POLARIMETER_FIRST_ROW down, in row order."""
+    with zipfile.ZipFile(file) as archive:
+        xml = archive.read(_sheet(archive))
+    cells = [(int(row), value) for row, value in _NUMERIC_CELL.findall(xml) if int(row) >= POLARIMETER_FIRST_ROW]
+    cells.sort()
+    return np.array([float(value) for _, value in cells])[None, :]
+
+
+def _polarimeter_length(file: str) -> int:
+    with zipfile.ZipFile(file) as archive:
+        with archive.open(_sheet(archive)) as sheet:
+            found = _DIMENSION.search(sheet.read(SNIFF_BYTES))
+    return int(found.group(1)) - POLARIMETER_FIRST_ROW + 1 if found else 0
+
+
+def _read_packed(file: str) -> np.ndarray:
+    """Decode the int16 codes and (t0, dt) time base written by scope.save_packed."""
+    with np.load(file) as packed:
+        codes, steps, t0, dt = packed["codes"], packed["steps"], float(packed["t0"]), float(packed["dt"])
+    return np.vstack([t0 + dt * np.arange(codes.shape[1]), codes * steps[:, None]])
+
+
+def _packed_length(file: str) -> int:
+    import json
+    with np.load(file) as packed:
+        return int(json.loads(str(packed["header"]))["CH1"]["Record Length"])
+
+
+register_format(
+    "polarimeter", ("current",),
+    lambda head, path: "xl/workbook.xml" in _zip_members(head, path),
+    _read_polarimeter,
+    _polarimeter_length,
+)
+register_format(
+    "packed", ("t", "ch1", "ch2"),
+    lambda head, path: "codes.npy" in _zip_members(head, path),
+    _read_packed,
+    _packed_length,
+)
+
+
+# --- Dispatch ---
+
+def sniff(file: str) -> Format:
+    with open(file, "rb") as handle:
+        head = handle.read(SNIFF_BYTES)
+    for file_format in reversed(FORMATS.values()):
+        if file_format.sniff(head, file):
+            return file_format
+    raise ValueError(f"{file}: not a known data format ({', '.join(FORMATS)})")
+
+
+@instrument(path_arg="file")
+def read(file: str, rows: Optional[Tuple[str, ...]] = None) -> np.ndarray:
+    """(rows, samples) of `file`; `rows` picks and orders rows by name (all by default)."""
+    file_format = sniff(file)
+    values = file_format.read(file)
+    if rows is None:
+        return values
+    return values[[file_format.rows.index(row) for row in rows]]
+
+
+def iter_chunks(file: str, chunk: int, rows: Optional[Tuple[str, ...]] = None) -> Iterator[np.ndarray]:
+    """(rows, ≤ chunk) blocks of `file` in record order; formats with a streamed reader hold one block at a time."""
+    file_format = sniff(file)
+    pick = slice(None) if rows is None else [file_format.rows.index(row) for row in rows]
+    if file_format.chunks is not None:
+        for values in file_format.chunks(file, chunk):
+            yield values[pick]
+        return
+    values = file_format.read(file)[pick]
+    for start in range(0, values.shape[1], chunk):
+        yield values[:, start:start + chunk]
+
+
+# --- Folders ---
+
+class FolderIndex(NamedTuple):
+    files: tuple  # paths, in natural order
+    keys: np.ndarray  # (files,) number in each file name: the angle, resistance, ... (NaN if none)
+    lengths: np.ndarray  # (files,) samples of each file; data[i, :, lengths[i]:] is NaN padding
+
+
+class FolderData(NamedTuple):
+    data: np.ndarray  # (files, rows, samples), NaN padded
+    index: FolderIndex
+    format: str
+    rows: tuple
+
+    def row(self, name: str) -> np.ndarray:
+        """(files, samples) of one row."""
+        return self.data[:, self.rows.index(name)]
+
+
+def name_key(file: str) -> float:
+    """The file name's stem as a number ("27.5.csv" -> 27.5), else its digits, else NaN."""
+    stem = os.path.splitext(os.path.basename(file))[0]
+    try:
+        return float(stem)
+    except ValueError:
+        digits = ''.join(filter(str.isdigit, stem))
+        return float(digits) if digits else np.nan
+
+
+def _read_into(item: tuple, out: np.ndarray) -> int:
+    """Read one file into its (rows, capacity) slot; returns its true length."""
+    name, file = item
+    values = FORMATS[name].read(file)
+    out[:, :values.shape[1]] = values[:, :out.shape[1]]
+    return values.shape[1]
+
+
+@instrument(path_arg="folder")
+def load_folder(folder: str, suffix: str = "", jobs: int = 1) -> FolderData:
+    """
+    Every file of `folder` (one format throughout) in one preallocated, NaN-padded array.
+    jobs: reader processes (None = all cores); they write straight into a shared-memory
+    array (labtools.shared), so the records are never pickled.
+    """
+    from labtools.shared import map_shared
+    files = folder_files(folder, suffix)
+    if not files:
+        raise ValueError(f"No files in '{folder}' ending with '{suffix}'")
+    formats = {sniff(file) for file in files}
+    if len(formats) > 1:
+        raise ValueError(f"'{folder}' mixes formats: {', '.join(sorted(f.name for f in formats))}")
+    (file_format,) = formats
+    capacity = max(file_format.length(file) for file in files)
+    data, lengths = map_shared(_read_into, [(file_format.name, file) for file in files],
+                               (len(file_format.rows), capacity), jobs=jobs)
+    lengths = np.array(lengths, dtype=np.intp)
+    if lengths.max() > capacity:  # a header undercounted: widen and read those files again
+        wider = np.full(data.shape[:2] + (lengths.max(),), np.nan)
+        wider[:, :, :capacity] = data
+        for i in np.flatnonzero(lengths > capacity):
+            wider[i] = np.nan
+            _read_into((file_format.name, files[i]), wider[i])
+        data = wider
+    data = data[:, :, :lengths.max()]
+    return FolderData(data, FolderIndex(tuple(files), np.array([name_key(f) for f in files]), lengths),
+                      file_format.name, file_format.rows)
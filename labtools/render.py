@@ -0,0 +1,124 @@
+"""
+Headless batch rendering of every figure the lab scripts know how to draw.
+
+Each analysis module exposes `FIGURES`, a dict mapping an output file name to
+a builder that draws into a bare `matplotlib.figure.Figure`. This renderer
+imports the modules in worker processes with the non-interactive Agg backend,
+so nothing touches pyplot's global state or needs a display, and every figure
+is written straight to `<out>/<module>/<name>`.
+
+Usage (from the repository root):
+    python -m labtools.render [--out rendered] [--jobs 8] [Malos refraction ...]
+"""
+import argparse
+import importlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+
+from labtools.instrument import instrument, measure
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (module directory, module name, working directory its data paths are relative to).
+# extract_data_loops is left out until its data (../data/2.2_material*.csv) is in the tree.
+MODULES = [
+    ("magnetism", "Hysteresis", f"magnetism{os.sep}plates"),
+    ("magnetism", "heshel", f"magnetism{os.sep}plates"),
+    ("magnetism", "domains", "magnetism"),
+    ("polarbears", "Malos", "polarbears"),
+    ("polarbears", "hwave", "polarbears"),
+    ("polarbears", "qwave", "polarbears"),
+    ("polarbears", "refraction", "polarbears"),
+    ("polarbears", "microwave", "polarbears"),
+    ("polarbears", "chi2map", "polarbears"),
+    ("polarbears", "bragg", "polarbears"),
+    ("polarbears", "peaks", "polarbears"),
+    (f"polarbears{os.sep}half wave", "ΗalfWaveF", f"polarbears{os.sep}half wave"),
+]
+
+DPI = 300
+
+
+def _load_module(module_dir: str, module: str, work_dir: str):
+    """Import `module` inside a worker: Agg backend, module folder on sys.path, cwd at its data."""
+    import matplotlib
+    matplotlib.use("Agg")
+    path = os.path.join(ROOT, module_dir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    os.chdir(os.path.join(ROOT, work_dir))
+    return importlib.import_module(module)
+
+
+def list_figures(module_dir: str, module: str, work_dir: str) -> List[str]:
+    return list(getattr(_load_module(module_dir, module, work_dir), "FIGURES", {}))
+
+
+@instrument(stage="labtools.render.render_figure")
+def render_figure(module_dir: str, module: str, work_dir: str, name: str, out_dir: str, dpi: int = DPI) -> str:
+    """Build figure `name` of `module` on a fresh Figure and save it under `out_dir/module/name`."""
+    from matplotlib.figure import Figure
+
+    builder = _load_module(module_dir, module, work_dir).FIGURES[name]
+    fig = Figure()
+    builder(fig)
+    out_path = os.path.join(out_dir, module, name)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with measure("labtools.render.savefig"):
+        fig.savefig(out_path, dpi=dpi)
+    return out_path
+
+
+def render_all(
+    modules: Optional[List[str]] = None,
+    out_dir: str = "rendered",
+    jobs: Optional[int] = None,
+    dpi: int = DPI
+) -> Tuple[List[str], List[Tuple[str, str, BaseException]]]:
+    """
+    Render the figures of `modules` (all of MODULES when None) in a process pool.
+
+    Returns (written paths, failures) where each failure is (module, figure, exception).
+    A failing figure (e.g. missing data) does not stop the others.
+    """
+    out_dir = os.path.abspath(out_dir)
+    selected = [spec for spec in MODULES if modules is None or spec[1] in modules]
+    written, failures = [], []
+    with ProcessPoolExecutor(jobs) as pool:
+        listings = {spec: pool.submit(list_figures, *spec) for spec in selected}
+        renders = {}
+        for spec, listing in listings.items():
+            try:
+                names = listing.result()
+            except Exception as e:
+                failures.append((spec[1], "*", e))
+                continue
+            for name in names:
+                renders[pool.submit(render_figure, *spec, name, out_dir, dpi)] = (spec[1], name)
+        for future in as_completed(renders):
+            module, name = renders[future]
+            try:
+                written.append(future.result())
+                print(f"rendered {module}: {name}")
+            except Exception as e:
+                failures.append((module, name, e))
+                print(f"FAILED {module}: {name}: {e}")
+    return written, failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", help="module names to render (default: all)")
+    parser.add_argument("--out", default="rendered", help="output directory")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--dpi", type=int, default=DPI)
+    args = parser.parse_args(argv)
+    written, failures = render_all(args.modules or None, args.out, args.jobs, args.dpi)
+    print(f"{len(written)} figures written to {os.path.abspath(args.out)}, {len(failures)} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
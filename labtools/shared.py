@@ -0,0 +1,117 @@
+"""
+Process-pool maps whose large outputs are written into shared memory instead of pickled back.
+
+Returning a waveform or an image from a worker process pickles it, pipes it
+to the parent and unpickles it there, which costs about as much as reading it
+in the first place and serializes every worker behind the parent. Here the
+parent allocates the whole output in `multiprocessing.shared_memory` and
+sends workers only a `Spec` (block name, shape, dtype) and the offsets of
+their items. Each worker writes its items' slots in place and returns only a
+small per-item result (a length, a threshold, ...). The parent's array is a
+zero-copy view of the block: it is unlinked once the workers are done and
+freed when the last view of the array goes away.
+
+    out, results = map_shared(func, items, shape, dtype, jobs=4)
+        out[i] is the (shape) slot func(items[i], out[i]) filled in its worker;
+        results[i] is what func returned. jobs=1 runs in-process on an ordinary array.
+
+`func` must be a module-level function (workers import it by name).
+"""
+import ctypes
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Callable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+BATCHES_PER_JOB = 4  # contiguous item batches per worker, to balance uneven items
+
+
+class Spec(NamedTuple):
+    """Everything a worker needs to find an output block: pickles to a few dozen bytes."""
+    name: str
+    shape: tuple
+    dtype: str
+
+
+class _Block:
+    """
+    Owner of a shared block, exposed to numpy through the array interface.
+
+    Arrays built on it hold a reference to this object rather than a buffer
+    export, so closing the mapping when the last array goes is always allowed.
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, shape: tuple, dtype: np.dtype):
+        self.memory = memory
+        address = ctypes.addressof(ctypes.c_char.from_buffer(memory.buf))
+        self.__array_interface__ = {"shape": shape, "typestr": dtype.str, "data": (address, False), "version": 3}
+
+    def __del__(self):
+        self.memory.close()
+
+
+def allocate(shape: Tuple[int, ...], dtype=float, fill=None) -> Tuple[np.ndarray, Spec]:
+    """A new shared array and the Spec workers attach to it with."""
+    dtype = np.dtype(dtype)
+    shape = tuple(int(n) for n in shape)
+    memory = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+    array = np.asarray(_Block(memory, shape, dtype))
+    if fill is not None:
+        array.fill(fill)
+    return array, Spec(memory.name, shape, dtype.str)
+
+
+def release(spec: Spec):
+    """Remove the block's name; arrays already mapped stay valid until they are dropped."""
+    memory = shared_memory.SharedMemory(spec.name)
+    memory.unlink()
+    memory.close()
+
+
+@contextmanager
+def attach(spec: Spec) -> Iterator[np.ndarray]:
+    """The block of `spec` as an array, inside a worker. Do not keep views past the block."""
+    memory = shared_memory.SharedMemory(spec.name)
+    try:
+        array = np.ndarray(spec.shape, np.dtype(spec.dtype), buffer=memory.buf)
+        yield array
+        del array
+    finally:
+        memory.close()
+
+
+def _run(func: Callable, spec: Spec, start: int, items: Sequence) -> list:
+    with attach(spec) as out:
+        return [func(item, out[start + i]) for i, item in enumerate(items)]
+
+
+def map_shared(func: Callable, items: Sequence, shape: Tuple[int, ...] = (), dtype=float, fill=np.nan,
+               jobs: Optional[int] = None) -> Tuple[np.ndarray, List]:
+    """
+    out[i] filled by func(items[i], out[i]) for every item, in worker processes.
+
+    out is (len(items), *shape) of `dtype`, pre-filled with `fill` (None leaves it
+    uninitialised). jobs: worker processes (None = all cores, 1 = in this process).
+    Returns (out, [func's return value per item]).
+    """
+    items = list(items)
+    jobs = min(jobs or os.cpu_count() or 1, len(items))
+    if jobs <= 1:
+        out = np.empty((len(items),) + tuple(shape), dtype=dtype)
+        if fill is not None:
+            out.fill(fill)
+        return out, [func(item, out[i]) for i, item in enumerate(items)]
+
+    out, spec = allocate((len(items),) + tuple(shape), dtype, fill)
+    try:
+        bounds = np.linspace(0, len(items), min(len(items), jobs * BATCHES_PER_JOB) + 1).astype(int)
+        with ProcessPoolExecutor(jobs) as pool:
+            futures = [pool.submit(_run, func, spec, start, items[start:stop])
+                       for start, stop in zip(bounds[:-1], bounds[1:])]
+            results = [result for future in futures for result in future.result()]
+    finally:
+        release(spec)
+    return out, results
@@ -1,10 +1,14 @@
 import os
 from typing import Tuple, Optional, List, Union
 import numpy as np
-import pandas as pd
 from matplotlib import pyplot as plt
 from matplotlib import use
 
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+from labtools.readers import folder_files
+from stream import extrema, plot_series
+
 # Constants
 DATA_SIZE = 0.5  # Size of scatter points
 AXIS_LABEL_SIZE = 13
@@ -13,23 +17,6 @@ LEGEND_SIZE = 8
 AXIS_LOC = (0.94, 0.84)
 TITLE_LOC = 0.96
 
-use('TkAgg')
-
-
-def extract_voltages(file: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-    """
-    Read a CSV file and return (times, v1, v2) as numpy arrays.
-    Assumes:
-      - Column 3 = time,
-      - Column 4 = V1 (→ H),
-      - Column 10 = V2 (→ B).
-    """
-    df = pd.read_csv(file)
-    times = df.iloc[:, 3].values
-    v1 = df.iloc[:, 4].values
-    v2 = df.iloc[:, 10].values
-    return times, v1, v2
-
 
 def plot_config(ax, x_label: str, y_label: str, title: str):
     """
@@ -68,11 +55,13 @@ def _parse_resistance_from_filename(fname: str) -> Optional[int]:
     return int(digits)
 
 
+@instrument
 def plot_heshels(
     folder: str,
     save: bool = False,
     use_scatter: bool = False,
-    resistances: Optional[List[int]] = None
+    resistances: Optional[List[int]] = None,
+    ax=None
 ):
     """
     Plot hysteresis loops from CSVs in `folder` (different resistances).
@@ -84,21 +73,27 @@ def plot_heshels(
     - resistances: optional list of integers (e.g. [0, 1000, 5000]).
       Only files whose numeric resistance matches one of these values are plotted.
       If None, all files in `folder` are used.
+    - ax: optional Axes to draw on. When given, nothing is shown and the
+      caller owns the figure (used by the batch renderer).
 
     Behavior:
     1. Gathers and sorts all CSV filenames, then filters by resistances if provided.
-    2. Computes Hmax = max|V1| and Bmax = max|V2| across the selected files.
-    3. Plots each loop in the chosen style (scatter vs. line).
+    2. Computes Hmax = max|V1| and Bmax = max|V2| across the selected files
+       (streamed, so deep-memory records are never loaded whole).
+    3. Plots each loop in the chosen style (scatter vs. line); records longer
+       than stream.PLOT_POINTS are decimated first.
     4. Fixes xlim = ±(Hmax + 5%) and ylim = ±(Bmax + 5%).
     5. If save=True, writes 'plots/{folder_basename}.png' or
        'plots/{folder_basename}_scatter.png' (when use_scatter=True).
     """
-    # Create a new figure (8 × 5 inches)
-    plt.figure(figsize=(8, 5))
-    ax = plt.gca()
+    # Create a new figure (8 × 5 inches) unless the caller supplied the axes
+    show = ax is None
+    if ax is None:
+        plt.figure(figsize=(8, 5))
+        ax = plt.gca()
 
-    # List and sort CSV filenames by any digits in the name
-    all_files = sorted(os.listdir(folder), key=lambda f: int("".join(filter(str.isdigit, f)) or 0))
+    # List and sort the captures by any digits in the name
+    all_files = [os.path.basename(file) for file in folder_files(folder)]
 
     # Filter by resistances if provided
     if resistances is not None:
@@ -117,13 +112,13 @@ def plot_heshels(
     Hmax = 0.0
     Bmax = 0.0
     for fname in files:
-        _, v1, v2 = extract_voltages(os.path.join(folder, fname))
-        Hmax = max(Hmax, np.max(np.abs(v1)))
-        Bmax = max(Bmax, np.max(np.abs(v2)))
+        limits = extrema(os.path.join(folder, fname))
+        Hmax = max(Hmax, limits.h_abs)
+        Bmax = max(Bmax, limits.b_abs)
 
     # Plot each loop
     for fname in files:
-        _, v1, v2 = extract_voltages(os.path.join(folder, fname))
+        _, v1, v2 = plot_series(os.path.join(folder, fname))
         R_val = _parse_resistance_from_filename(fname)
         label_text = f"{R_val} Ω" if R_val is not None else fname
         if use_scatter:
@@ -150,15 +145,17 @@ def plot_heshels(
         safe_name = base.replace(os.sep, "_")
         suffix = "_scatter" if use_scatter else ""
         out_path = f"plots{os.sep}{safe_name}{suffix}.png"
-        plt.savefig(out_path, dpi=300, bbox_inches='tight')
+        ax.figure.savefig(out_path, dpi=300, bbox_inches='tight')
 
-    plt.show()
+    if show:
+        plt.show()
 
 
 ###############################################################################
 # Example calls for Task 1:
 ###############################################################################
 if __name__ == "__main__":
+    use('TkAgg')
     plot_heshels("different R material 1", save=True, use_scatter=False, resistances=None)
     plot_heshels(
         folder="different R material 1",
@@ -191,19 +188,22 @@ if __name__ == "__main__":
 ###############################################################################
 # Task 2: Six‐panel grid for “heshel vs plates” in hotpink, with titles "material {R_val}"
 ###############################################################################
+@instrument
 def plot_heshel_plates_grid(
     folder: str,
     save: bool = False,
     plate_resistances: Optional[List[int]] = None,
-    use_scatter: bool = False
+    use_scatter: bool = False,
+    fig=None
 ):
     """
     Plot up to six hysteresis loops from `folder` (different plates, same resistance),
     each on its own subplot (2×3 grid). All subplots share the same x/y limits.
     - color set to 'hotpink'
     - subplot titles formatted as "material {R_val}"
+    - fig: optional Figure to draw the grid into (nothing is shown when given)
     """
-    all_files = sorted(os.listdir(folder), key=lambda f: int("".join(filter(str.isdigit, f)) or 0))
+    all_files = [os.path.basename(file) for file in folder_files(folder)]
 
     if plate_resistances is not None:
         selected = []
@@ -221,19 +221,22 @@ def plot_heshel_plates_grid(
     Hmax = 0.0
     Bmax = 0.0
     for fname in files:
-        _, v1, v2 = extract_voltages(os.path.join(folder, fname))
-        Hmax = max(Hmax, np.max(np.abs(v1)))
-        Bmax = max(Bmax, np.max(np.abs(v2)))
+        limits = extrema(os.path.join(folder, fname))
+        Hmax = max(Hmax, limits.h_abs)
+        Bmax = max(Bmax, limits.b_abs)
 
     padding_H = 0.05 * Hmax
     padding_B = 0.05 * Bmax
 
-    fig, axes = plt.subplots(2, 3, figsize=(12, 6), sharex=True, sharey=True)
+    show = fig is None
+    if fig is None:
+        fig = plt.figure(figsize=(12, 6))
+    axes = fig.subplots(2, 3, sharex=True, sharey=True)
     axes = axes.flatten()
 
     for idx, fname in enumerate(files):
         ax = axes[idx]
-        _, v1, v2 = extract_voltages(os.path.join(folder, fname))
+        _, v1, v2 = plot_series(os.path.join(folder, fname))
 
         R_val = _parse_resistance_from_filename(fname)
         title_text = f"material {R_val}" if R_val is not None else fname
@@ -269,16 +272,52 @@ def plot_heshel_plates_grid(
     fig.text(0.07, 0.5, "$B\\,[V]$", ha='center', va='center', rotation='vertical', fontsize=14)
     fig.suptitle("Hysteresis Loops for Six Different Plates (Same Resistance)", fontsize=16, y=0.98)
 
-    plt.tight_layout(rect=[0.03, 0.05, 1, 0.95])
+    fig.tight_layout(rect=[0.03, 0.05, 1, 0.95])
 
     if save:
         os.makedirs("plots", exist_ok=True)
         base = os.path.basename(folder).replace(os.sep, "_")
         suffix = "_scatter_grid" if use_scatter else "_grid"
         out_path = f"plots{os.sep}{base}{suffix}.png"
-        plt.savefig(out_path, dpi=300, bbox_inches='tight')
+        fig.savefig(out_path, dpi=300, bbox_inches='tight')
+
+    if show:
+        plt.show()
+
 
-    plt.show()
+###############################################################################
+# Figures for the batch renderer (labtools.render), keyed by output file name.
+# Each builder draws into a bare Figure; paths are relative to magnetism/plates.
+###############################################################################
+def _loops_figure(folder: str, use_scatter: bool = False, resistances: Optional[List[int]] = None):
+    def build(fig):
+        fig.set_size_inches(8, 5)
+        plot_heshels(folder, use_scatter=use_scatter, resistances=resistances, ax=fig.add_subplot())
+    return build
+
+
+def _plates_grid_figure(fig):
+    fig.set_size_inches(12, 6)
+    plot_heshel_plates_grid("different materials same R", plate_resistances=[9, 3, 1, 7, 5, 4],
+                            use_scatter=True, fig=fig)
+
+
+FIGURES = {
+    "different R material 1.png": _loops_figure("different R material 1"),
+    "different R material 1_scatter.png": _loops_figure(
+        "different R material 1", True, [0, 1300, 2600, 3300, 7500, 14000]),
+    "different R material 2.png": _loops_figure("different R material 2"),
+    "different R material 2_scatter.png": _loops_figure(
+        "different R material 2", True, [0, 1000, 2000, 3000, 7000, 12000]),
+    "different R material 3.png": _loops_figure("different R material 3"),
+    "different R material 3_scatter.png": _loops_figure(
+        "different R material 3", True, [0, 1000, 4000, 6000, 8000, 12000]),
+    "different R material 1 2 plates.png": _loops_figure("different R material 1 2 plates"),
+    "different R material 1 2 plates_scatter.png": _loops_figure(
+        "different R material 1 2 plates", True, [0, 1000, 2000, 4000, 5000, 6000]),
+    "different materials same R.png": _loops_figure("different materials same R"),
+    "different materials same R_scatter_grid.png": _plates_grid_figure,
+}
 
 
 ###############################################################################
@@ -2,8 +2,10 @@ import glob
 import os
 import numpy as np
 from matplotlib import pyplot as plt, rc, use
-from skimage import io, color, filters
-use('TkAgg')
+
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument, measure
+from labtools.shared import map_shared
 
 v1 = np.concatenate((np.arange(0, 5.5, 0.2), np.arange(5.2, -0.1, -0.2), np.arange(-0.2, -5.5, -0.2), np.arange(-5.2, 0.1, 0.2)))
 v2 = np.concatenate((np.arange(0, 5.1, 0.2), np.arange(4.8, -0.1, -0.2), np.arange(-0.2, -5.1, -0.2), np.arange(-4.8, 0.1, 0.2)))
@@ -13,81 +15,125 @@ step = 0.2
 v1 = np.round(v1 / step) * step
 v2 = np.round(v2 / step) * step
 image_directory = fr'domains{os.sep}2'  # Your specified path
-def main():
-    # Set the font family to 'serif'
-    rc('font', family='serif')
-
-    # Directory containing the images (using raw string for Windows path)
-
-
-    # List to store the data
-    area_data = []
-
-    # Loop through all images with the specified naming pattern (handling both single and double digit numbers)
+def frame_files(image_directory: str = image_directory) -> list:
+    """(H value, path) of every frame "grant_<H>_v_mes_<num>.jpg", in frame order; missing frames are reported."""
+    frames = []
     for num in range(len(img1_numbers)):
-        # Create the file name pattern, without zero-padding the number, and check for both .png and .bmp extensions
-        png_filename = os.path.join(image_directory, f'grant_*_v_mes_{num}.jpg')
-        # grant_5_v_mes_1.png
-        # Find the files that match the pattern
-        image_files = glob.glob(png_filename)
-
-        # If there's at least one matching file
-        if image_files:
-            image_file = image_files[0]  # In case there are multiple, take the first one
-
-            # Extract only the filename from the full path
-            base_filename = os.path.basename(image_file)  # Extracts 'grant_*_v_mes_{num}.png' or .bmp
-
-            # Extract the value of * from the filename
-            try:
-                filename_parts = base_filename.split('_')  # Split the filename by '_'
-                star_value = filename_parts[1]  # Extract the part corresponding to '*'
-
-                # Load and process the image
-                image = io.imread(image_file)
-                grayscale_image = color.rgb2gray(image)  # Convert to grayscale
-
-                # Apply a threshold (Otsu's method)
-                threshold = filters.threshold_otsu(grayscale_image)
-                binary_image = grayscale_image > threshold  # Bright areas are True, dark areas are False
-
-                # Calculate areas
-                dark_area = np.sum(~binary_image)  # Count dark pixels (False)
-                bright_area = np.sum(binary_image)  # Count bright pixels (True)
-
-                # Calculate the percentage of bright area out of total area
-                total_area = dark_area + bright_area
-                bright_percentage = (bright_area / total_area) * 100
-
-                # Normalize the percentage (shift it so that 50% becomes 0)
-                normalized_bright_percentage = bright_percentage
-
-                # Store the result in the list
-                area_data.append({
-                    'star_value': float(star_value),  # Convert to float to handle numeric values properly
-                    'normalized_bright_percentage': normalized_bright_percentage
-                })
-            except Exception as e:
-                print(f"Failed to process {image_file}: {e}")
-        else:
-            print(f"No file found for: {png_filename}")
-
-    # Extract the data for plotting
-    star_values = [data['star_value'] for data in area_data]
-    normalized_bright_percentages = np.array([data['normalized_bright_percentage'] for data in area_data])
+        # The number is not zero-padded; take the first file if several match
+        pattern = os.path.join(image_directory, f'grant_*_v_mes_{num}.jpg')
+        image_files = glob.glob(pattern)
+        if not image_files:
+            print(f"No file found for: {pattern}")
+            continue
+        try:
+            frames.append((float(os.path.basename(image_files[0]).split('_')[1]), image_files[0]))
+        except ValueError as e:
+            print(f"Failed to process {image_files[0]}: {e}")
+    return frames
+
+
+def _gray(image_file: str) -> np.ndarray:
+    from skimage import io, color  # slow import, only needed here
+    with measure("domains.imread", image_file):
+        image = io.imread(image_file)
+    return color.rgb2gray(image)
+
+
+def _frame_stats(image_file: str, out: np.ndarray):
+    """Worker: Otsu threshold and bright-area percentage of one frame, written to out[0], out[1]."""
+    from skimage import filters
+    try:
+        grayscale_image = _gray(image_file)
+        with measure("domains.threshold_otsu"):
+            threshold = filters.threshold_otsu(grayscale_image)
+            binary_image = grayscale_image > threshold  # Bright areas are True, dark areas are False
+    except Exception as e:
+        return f"Failed to process {image_file}: {e}"
+    out[0] = threshold
+    out[1] = np.sum(binary_image) / binary_image.size * 100
+    return None
+
+
+def _gray_into(image_file: str, out: np.ndarray):
+    out[...] = _gray(image_file)
+
+
+@instrument(path_arg="image_directory")
+def bright_area_curve(image_directory: str = image_directory, jobs: int = 1):
+    """
+    Otsu-threshold every frame in `image_directory` and return (H values, bright area %).
+    jobs: worker processes (None = all cores); their results come back through shared memory.
+    """
+    frames = frame_files(image_directory)
+    stats, errors = map_shared(_frame_stats, [file for _, file in frames], (2,), jobs=jobs)
+    for error in filter(None, errors):
+        print(error)
+    processed = ~np.isnan(stats[:, 1])
+    star_values = [h for (h, _), ok in zip(frames, processed) if ok]
+    normalized_bright_percentages = stats[processed, 1]
     normalized_bright_percentages += 100 - np.max(normalized_bright_percentages)
+    return star_values, normalized_bright_percentages
+
+
+@instrument(path_arg="image_directory")
+def gray_frames(image_directory: str = image_directory, numbers=None, jobs: int = 1):
+    """
+    (H values, grayscale frames (frames, height, width) float32) of the frames at positions
+    `numbers` (all by default, ~5.6 MB each). With jobs > 1 the frames are decoded in worker
+    processes straight into a shared-memory stack, so no image is pickled.
+    """
+    frames = frame_files(image_directory)
+    if numbers is not None:
+        frames = [frames[i] for i in numbers]
+    if not frames:
+        return np.empty(0), np.empty((0, 0, 0), dtype=np.float32)
+    from PIL import Image
+    with Image.open(frames[0][1]) as first:
+        width, height = first.size
+    stack, _ = map_shared(_gray_into, [file for _, file in frames], (height, width), np.float32, fill=None, jobs=jobs)
+    return np.array([h for h, _ in frames]), stack
+
+
+@instrument
+def plot_bright_area(image_directory: str = image_directory, ax=None):
+    show = ax is None
+    if ax is None:
+        plt.figure(figsize=(10, 6))
+        ax = plt.gca()
+    star_values, normalized_bright_percentages = bright_area_curve(image_directory)
 
     # Create the plot
-    plt.figure(figsize=(10, 6))
-    plt.plot(star_values, normalized_bright_percentages, marker='o', linestyle='-', color='b')
+    ax.plot(star_values, normalized_bright_percentages, marker='o', linestyle='-', color='b')
 
     # Add labels and title
-    plt.xlabel('H (a.u)', fontsize=14, fontfamily='serif')
-    plt.ylabel('Precentage of Bright Area (%)', fontsize=14, fontfamily='serif')
+    ax.set_xlabel('H (a.u)', fontsize=14, fontfamily='serif')
+    ax.set_ylabel('Precentage of Bright Area (%)', fontsize=14, fontfamily='serif')
 
     # Show the plot
-    plt.grid(True)
-    plt.show()
+    ax.grid(True)
+    if show:
+        plt.show()
+
+
+def main():
+    # Set the font family to 'serif'
+    rc('font', family='serif')
+    plot_bright_area()
+
+
+def _bright_area_figure(folder: str):
+    def build(fig):
+        fig.set_size_inches(10, 6)
+        plot_bright_area(folder, ax=fig.add_subplot())
+    return build
+
+
+# Figures for the batch renderer (labtools.render); paths are relative to magnetism/
+FIGURES = {
+    "bright area 1.png": _bright_area_figure(fr'domains{os.sep}1'),
+    "bright area 2.png": _bright_area_figure(fr'domains{os.sep}2'),
+}
 
 if __name__ == "__main__":
+    use('TkAgg')
     main()
\ No newline at end of file
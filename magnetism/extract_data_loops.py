@@ -4,9 +4,11 @@ import matplotlib.pyplot as plt
 
 import matplotlib
 
-matplotlib.use('TkAgg')
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
 
 # Function to load a CSV file into a DataFrame
+@instrument(path_arg="file_path")
 def load_csv_to_dataframe(file_path):
     try:
         df = pd.read_csv(file_path)
@@ -43,22 +45,39 @@ def extract_data(file_path):
 
     return channel_1, channel_2
 
-def create_list_of_all_loops():
+@instrument
+def create_list_of_all_loops(ax1=None):
+    show = ax1 is None
     num_of_materials = np.arange(1, 5)
-    fig = plt.figure(figsize=(10, 6))
-    ax1 = fig.add_subplot(111)
+    if ax1 is None:
+        fig = plt.figure(figsize=(10, 6))
+        ax1 = fig.add_subplot(111)
     for material in num_of_materials:
         file_path = f"../data/2.2_material{material}.csv"
         ch1_voltage, ch2_voltage = extract_data(file_path)
         ax1.scatter(ch1_voltage, ch2_voltage, label=f"Material {material}", s=10)
 
-    plt.xlabel("H (V)")
-    plt.grid(True, which='both', linestyle='--', linewidth=0.5)
-    plt.axhline(0, color='black', linewidth=1.5)  # Bold horizontal line at y=0
-    plt.axvline(0, color='black', linewidth=1.5)  # Bold vertical line at x=0
-    plt.ylabel("$\Phi_B$ (V)")
-    plt.title("Hysteresis Loops of Different Materials")
-    plt.legend()
-    plt.show()
+    ax1.set_xlabel("H (V)")
+    ax1.grid(True, which='both', linestyle='--', linewidth=0.5)
+    ax1.axhline(0, color='black', linewidth=1.5)  # Bold horizontal line at y=0
+    ax1.axvline(0, color='black', linewidth=1.5)  # Bold vertical line at x=0
+    ax1.set_ylabel("$\Phi_B$ (V)")
+    ax1.set_title("Hysteresis Loops of Different Materials")
+    ax1.legend()
+    if show:
+        plt.show()
 
-create_list_of_all_loops()
+
+def _all_loops_figure(fig):
+    fig.set_size_inches(10, 6)
+    create_list_of_all_loops(fig.add_subplot(111))
+
+
+# Figures for the batch renderer (labtools.render); paths are relative to magnetism/
+FIGURES = {
+    "all loops.png": _all_loops_figure,
+}
+
+if __name__ == "__main__":
+    matplotlib.use('TkAgg')
+    create_list_of_all_loops()
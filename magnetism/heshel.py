@@ -1,10 +1,13 @@
 import os
-from typing import Tuple
 
 import numpy as np
-import pandas as pd
 from matplotlib import pyplot as plt
 from matplotlib import use
+
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+from labtools.readers import folder_files
+from stream import plot_series
 DATA_SIZE = 2
 AXIS_LABEL_SIZE = 13
 TITLE_SIZE = 13
@@ -14,54 +17,67 @@ changing_plates_resistance = 4016
 AXIS_LOC = (0.94, 0.84)
 TITLE_LOC = 0.96
 
-use('TkAgg')
-
-def plot_config(x_label: str, y_label: str, title: str):
-    plt.legend(fontsize=LEGEND_SIZE, bbox_to_anchor=(0.2, 0.9))
-    plt.tight_layout()
-    ax = plt.gca()
+def plot_config(x_label: str, y_label: str, title: str, ax=None):
+    if ax is None:
+        ax = plt.gca()
+    ax.legend(fontsize=LEGEND_SIZE, bbox_to_anchor=(0.2, 0.9))
+    ax.figure.tight_layout()
     ax.spines['left'].set_position('zero')
     ax.spines['bottom'].set_position('zero')
     ax.spines['top'].set_visible(False)
     ax.spines['right'].set_visible(False)
     ax.plot((1), (0), '>k', transform=ax.transAxes)
     ax.plot((0), (1), '^k', transform=ax.transAxes)
-    plt.grid(True, which='both', linestyle='--', linewidth=0.5)
+    ax.grid(True, which='both', linestyle='--', linewidth=0.5)
     ax.set_xlabel("$V_1 [V]$", fontsize=16, labelpad=10, x=AXIS_LOC[0])
     ax.set_ylabel("$V_2 [V]$", fontsize=16, labelpad=10, y=AXIS_LOC[1])
     ax.set_title(title, fontsize=TITLE_SIZE, y=TITLE_LOC)
 
 
-def extract_voltages(file: str) -> Tuple[np.array, np.array, np.array]:
-    df = pd.read_csv(file)
-    times = df.iloc[:, 3].values
-    v1 = df.iloc[:, 4].values
-    v2 = df.iloc[:, 10].values
-    return times, v1, v2
-
-def plot_heshels(folder: str, save: bool=False):
-    files = os.listdir(folder)
-    files.sort(key=lambda f: int(''.join(filter(str.isdigit, f))))
-    for file in files:
-        times, v1, v2 = extract_voltages(os.path.join(folder, file))
-        plt.scatter(v1, v2, label=file[:-4] + '$\\Omega$', s=DATA_SIZE)
-    plot_config('H [V]', 'B [V]', 'Heshel Loops Over Different Resistances')
+@instrument
+def plot_heshels(folder: str, save: bool=False, ax=None):
+    show = ax is None
+    if ax is None:
+        ax = plt.gca()
+    for file in folder_files(folder):
+        times, v1, v2 = plot_series(file)
+        ax.scatter(v1, v2, label=os.path.basename(file)[:-4] + '$\\Omega$', s=DATA_SIZE)
+    plot_config('H [V]', 'B [V]', 'Heshel Loops Over Different Resistances', ax)
     if save:
-        plt.savefig(f"plots{os.sep}heshel_loops.png", dpi=300)
-    plt.show()
+        ax.figure.savefig(f"plots{os.sep}heshel_loops.png", dpi=300)
+    if show:
+        plt.show()
+
+
+@instrument
+def plot_heshel_plates(folder: str="heshel vs plates", save: bool=False, ax=None):
+    show = ax is None
+    if ax is None:
+        ax = plt.gca()
+    for file in folder_files(folder):
+        times, v1, v2 = plot_series(file)
+        ax.scatter(v1, v2, label=os.path.basename(file)[:-4], s=DATA_SIZE)
+    plot_config('H [V]', 'B [V]', 'Heshel Loops Over Different Plates', ax)
+    if show:
+        plt.show()
+
 
+# Figures for the batch renderer (labtools.render); paths are relative to magnetism/plates
+def _loops_figure(folder: str):
+    return lambda fig: plot_heshels(folder, ax=fig.add_subplot())
 
-def plot_heshel_plates(folder: str="heshel vs plates", save: bool=False):
-    files = os.listdir(folder)
-    for file in files:
-        times, v1, v2 = extract_voltages(os.path.join(folder, file))
-        plt.scatter(v1, v2, label=file[:-4], s=DATA_SIZE)
-    plot_config('H [V]', 'B [V]', 'Heshel Loops Over Different Plates')
-    plt.show()
 
+FIGURES = {
+    "heshel_loops different materials same R.png": _loops_figure("different materials same R"),
+    "heshel_loops different R material 1.png": _loops_figure("different R material 1"),
+    "heshel_loops different R material 2.png": _loops_figure("different R material 2"),
+    "heshel_loops different R material 3.png": _loops_figure("different R material 3"),
+    "heshel_plates.png": lambda fig: plot_heshel_plates(ax=fig.add_subplot()),
+}
 
 
 if __name__ == "__main__":
+    use('TkAgg')
     plot_heshels("different materials same R", True)
     plot_heshels("different R material 1", True)
     plot_heshels("different R material 2", True)
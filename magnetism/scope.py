@@ -0,0 +1,103 @@
+"""
+Loader for the Tektronix two-channel CSV exports of the hysteresis setup.
+
+`extract_voltages` reads a whole record; `iter_chunks` streams it in fixed-size
+chunks for deep-memory records (see stream.py for the reductions over them).
+pandas is imported on first use, so importing this module costs only numpy.
+
+Captures written by the acquisition pipeline (acquire.py) are packed .npz
+files instead of CSV; every reader here accepts either.
+"""
+import json
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
+
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+from labtools.readers import iter_chunks as read_chunks, read
+
+
+@instrument(path_arg="file")
+def extract_voltages(file: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Read a capture (CSV export or packed .npz, see labtools.readers) and return
+    (times, v1, v2) as numpy arrays, first sample included. For the CSV:
+      - Column 3 = time,
+      - Column 4 = V1 (→ H),
+      - Column 10 = V2 (→ B).
+    """
+    times, v1, v2 = read(file, ("t", "ch1", "ch2"))
+    return times, v1, v2
+
+
+# --- Streaming ---
+
+HEADER_ROWS = 17  # settings block the scope writes beside the first samples
+CHUNK = 65536  # samples per streamed chunk
+_CHANNEL_COLUMNS = {"CH1": 0, "CH2": 6}  # first column of each channel's settings block
+
+
+def parse_header(lines: Iterable[str]) -> dict:
+    """Settings of both channels from the first lines of an export, as read_header returns them."""
+    import csv
+    header = {channel: {} for channel in _CHANNEL_COLUMNS}
+    for row, _ in zip(csv.reader(lines), range(HEADER_ROWS)):
+        for channel, column in _CHANNEL_COLUMNS.items():
+            if len(row) > column + 1 and row[column]:
+                header[channel][row[column]] = row[column + 1]
+    return header
+
+
+def read_header(file: str) -> dict:
+    """Settings of both channels, {"CH1": {"Record Length": "2500", ...}, "CH2": {...}}."""
+    if file.endswith(PACKED_SUFFIX):
+        with np.load(file) as packed:
+            return json.loads(str(packed["header"]))
+    with open(file, newline="") as handle:
+        return parse_header(handle)
+
+
+def record_length(file: str) -> int:
+    return int(read_header(file)["CH1"]["Record Length"])
+
+
+def iter_chunks(file: str, chunk: int = CHUNK) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Yield (times, v1, v2) of at most `chunk` samples at a time, in record order.
+
+    CSV exports are parsed one chunk at a time, so the cost does not grow with
+    the record length; packed captures are already compact and decoded whole.
+    """
+    for times, v1, v2 in read_chunks(file, chunk, ("t", "ch1", "ch2")):
+        yield times, v1, v2
+
+
+# --- Packed captures ---
+
+PACKED_SUFFIX = ".npz"
+LEVELS_PER_DIVISION = 3200  # int16 codes span ±10.24 divisions, far finer than the scope's 8-bit ADC
+
+
+def quantize(header: dict, v1: np.ndarray, v2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(int16 codes (2, samples), volts per code (2,)): codes * steps[:, None] is what a packed capture reads back."""
+    steps = np.array([float(header[channel]["Vertical Scale"]) / LEVELS_PER_DIVISION for channel in ("CH1", "CH2")])
+    codes = np.rint(np.stack([v1, v2]) / steps[:, None])
+    return np.clip(codes, np.iinfo(np.int16).min, np.iinfo(np.int16).max).astype(np.int16), steps
+
+
+def save_packed(path: str, header: dict, times: np.ndarray, v1: np.ndarray, v2: np.ndarray, **extra):
+    """
+    Store a record as int16 codes per channel (step = vertical scale / LEVELS_PER_DIVISION),
+    the time base as (t0, dt) and the header as JSON: 4 bytes per sample against ~70 in the CSV.
+    `extra` arrays are stored alongside.
+    """
+    codes, steps = quantize(header, v1, v2)
+    dt = (times[-1] - times[0]) / (len(times) - 1) if len(times) > 1 else 0.0
+    np.savez(path, codes=codes, steps=steps, t0=float(times[0]), dt=float(dt), header=json.dumps(header), **extra)
+
+
+def load_packed(file: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(times, v1, v2) of a packed capture, as extract_voltages returns them."""
+    times, v1, v2 = read(file)
+    return times, v1, v2
@@ -0,0 +1,206 @@
+"""
+Constant-memory reductions over scope records, streamed chunk by chunk.
+
+Deep-memory captures (10M+ points per channel) are too large to load whole
+with extract_voltages, so everything here consumes scope.iter_chunks and keeps
+only a fixed amount of state between chunks:
+
+    extrema        running min/max of both channels, for axis limits
+    loop_metrics   loop area ∮ H dB of the whole record and area, peaks,
+                   remanence and coercivity of every complete drive cycle
+    decimate       bucket-averaged (t, v1, v2) of at most `points` samples
+    plot_series    the full record when it is small, otherwise decimate
+
+LoopAccumulator does the loop bookkeeping for any source of chunks (a file,
+or samples arriving from the scope while it records).
+"""
+import math
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+from scope import CHUNK, extract_voltages, iter_chunks, read_header, record_length
+
+PLOT_POINTS = 20000  # records longer than this are decimated for plotting
+TRIGGER_DIVISIONS = 0.5  # cycle trigger band, in CH1 vertical divisions
+
+
+class Extrema(NamedTuple):
+    h_min: float
+    h_max: float
+    b_min: float
+    b_max: float
+
+    @property
+    def h_abs(self) -> float:
+        return max(-self.h_min, self.h_max)
+
+    @property
+    def b_abs(self) -> float:
+        return max(-self.b_min, self.b_max)
+
+
+class CycleMetrics(NamedTuple):
+    start: float  # time of the rising trigger that opened the cycle [s]
+    period: float  # [s]
+    area: float  # ∮ H dB over the cycle [V²]
+    h_min: float
+    h_max: float
+    b_min: float
+    b_max: float
+    remanence: float  # mean |B| where H crosses zero [V]
+    coercivity: float  # mean |H| where B crosses zero [V]
+
+
+class LoopMetrics(NamedTuple):
+    area: float  # ∮ H dB over the whole record, partial cycles included [V²]
+    cycles: List[CycleMetrics]  # complete cycles only
+
+
+@instrument(path_arg="file")
+def extrema(file: str, chunk: int = CHUNK) -> Extrema:
+    h_min = b_min = math.inf
+    h_max = b_max = -math.inf
+    for _, v1, v2 in iter_chunks(file, chunk):
+        h_min, h_max = min(h_min, v1.min()), max(h_max, v1.max())
+        b_min, b_max = min(b_min, v2.min()), max(b_max, v2.max())
+    return Extrema(float(h_min), float(h_max), float(b_min), float(b_max))
+
+
+# --- Loop metrics ---
+
+def _crossings(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Segments where `a` changes sign, and `b` linearly interpolated to the crossing."""
+    segment = np.flatnonzero(a[:-1] * a[1:] < 0)
+    fraction = a[segment] / (a[segment] - a[segment + 1])
+    return segment, b[segment] + fraction * (b[segment + 1] - b[segment])
+
+
+class LoopAccumulator:
+    """
+    Online ∮ H dB and per-cycle metrics of a stream of (t, H, B) chunks.
+
+    A cycle starts where H rises through +band after having been below −band
+    (a Schmitt trigger, so noise around zero does not split cycles). Samples
+    before the first trigger count towards the total area only. Every chunk is
+    reduced with vectorised segment sums; the state kept between chunks is the
+    last sample, the trigger level and the open cycle.
+    """
+
+    def __init__(self, band: float):
+        self.band = band
+        self.area = 0.0
+        self.cycles: List[CycleMetrics] = []
+        self._last: Optional[np.ndarray] = None  # (t, H, B) of the previous chunk's last sample
+        self._level = 0  # trigger state: +1 above +band, -1 below -band, 0 not yet known
+        self._open: Optional[dict] = None  # running sums of the current cycle
+
+    def update(self, t: np.ndarray, h: np.ndarray, b: np.ndarray):
+        if len(t) == 0:
+            return
+        if self._last is not None:
+            t, h, b = (np.concatenate([[last], values]) for last, values in zip(self._last, (t, h, b)))
+        self._last = np.array([t[-1], h[-1], b[-1]])
+
+        segment_area = 0.5 * (h[:-1] + h[1:]) * np.diff(b)
+        self.area += float(segment_area.sum())
+
+        # Trigger level of every sample, carried through the dead band
+        level = np.where(h > self.band, 1, np.where(h < -self.band, -1, 0))
+        known = np.maximum.accumulate(np.where(level != 0, np.arange(len(level)), -1))
+        level = np.where(known >= 0, level[np.maximum(known, 0)], self._level)
+        previous = np.concatenate([[self._level], level[:-1]])
+        starts = np.flatnonzero((level == 1) & (previous == -1))
+        self._level = int(level[-1])
+
+        # Local cycle of every sample: 0 continues the open cycle, k opens at starts[k - 1]
+        cycle = np.zeros(len(t), dtype=np.intp)
+        cycle[starts] = 1
+        cycle = np.cumsum(cycle)
+        count = len(starts) + 1
+        bounds = np.concatenate([[0], starts])
+        h_min, h_max = np.minimum.reduceat(h, bounds), np.maximum.reduceat(h, bounds)
+        b_min, b_max = np.minimum.reduceat(b, bounds), np.maximum.reduceat(b, bounds)
+        area = np.bincount(cycle[:-1], segment_area, count)
+        h_zero, b_at = _crossings(h, b)
+        b_zero, h_at = _crossings(b, h)
+        remanence = np.bincount(cycle[h_zero], np.abs(b_at), count), np.bincount(cycle[h_zero], minlength=count)
+        coercivity = np.bincount(cycle[b_zero], np.abs(h_at), count), np.bincount(cycle[b_zero], minlength=count)
+
+        for k in range(count):
+            if k > 0:
+                self._close(t[starts[k - 1]])
+                self._open = {"start": float(t[starts[k - 1]]), "area": 0.0, "h_min": math.inf,
+                              "h_max": -math.inf, "b_min": math.inf, "b_max": -math.inf,
+                              "remanence": 0.0, "h_zeros": 0, "coercivity": 0.0, "b_zeros": 0}
+            if self._open is None:
+                continue
+            cycle_sums = self._open
+            cycle_sums["area"] += area[k]
+            cycle_sums["h_min"] = min(cycle_sums["h_min"], h_min[k])
+            cycle_sums["h_max"] = max(cycle_sums["h_max"], h_max[k])
+            cycle_sums["b_min"] = min(cycle_sums["b_min"], b_min[k])
+            cycle_sums["b_max"] = max(cycle_sums["b_max"], b_max[k])
+            cycle_sums["remanence"] += remanence[0][k]
+            cycle_sums["h_zeros"] += remanence[1][k]
+            cycle_sums["coercivity"] += coercivity[0][k]
+            cycle_sums["b_zeros"] += coercivity[1][k]
+
+    def _close(self, end: float):
+        if self._open is None:
+            return
+        sums = self._open
+        self.cycles.append(CycleMetrics(
+            sums["start"], float(end - sums["start"]), float(sums["area"]),
+            float(sums["h_min"]), float(sums["h_max"]), float(sums["b_min"]), float(sums["b_max"]),
+            float(sums["remanence"] / sums["h_zeros"]) if sums["h_zeros"] else math.nan,
+            float(sums["coercivity"] / sums["b_zeros"]) if sums["b_zeros"] else math.nan,
+        ))
+
+    def result(self) -> LoopMetrics:
+        return LoopMetrics(self.area, list(self.cycles))
+
+
+def trigger_band(file: str) -> float:
+    """Schmitt band for the cycle trigger: TRIGGER_DIVISIONS of CH1's vertical scale."""
+    return header_band(read_header(file))
+
+
+def header_band(header: dict) -> float:
+    return TRIGGER_DIVISIONS * float(header["CH1"]["Vertical Scale"])
+
+
+@instrument(path_arg="file")
+def loop_metrics(file: str, band: Optional[float] = None, chunk: int = CHUNK) -> LoopMetrics:
+    accumulator = LoopAccumulator(trigger_band(file) if band is None else band)
+    for t, v1, v2 in iter_chunks(file, chunk):
+        accumulator.update(t, v1, v2)
+    return accumulator.result()
+
+
+# --- Plot series ---
+
+@instrument(path_arg="file")
+def decimate(file: str, points: int = PLOT_POINTS, chunk: int = CHUNK) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (t, v1, v2) averaged over consecutive buckets, at most `points` samples.
+
+    The bucket size follows from the record length in the header, and chunks
+    are read in whole buckets, so no bucket straddles two chunks.
+    """
+    bucket = max(1, math.ceil(record_length(file) / points))
+    outputs = []
+    for values in iter_chunks(file, max(1, chunk // bucket) * bucket):
+        starts = np.arange(0, len(values[0]), bucket)
+        counts = np.diff(np.append(starts, len(values[0])))
+        outputs.append([np.add.reduceat(channel, starts) / counts for channel in values])
+    return tuple(np.concatenate(channel) for channel in zip(*outputs))
+
+
+def plot_series(file: str, points: int = PLOT_POINTS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """The whole record for small files, as before; decimated when it is longer than `points`."""
+    if record_length(file) <= points:
+        return extract_voltages(file)
+    return decimate(file, points)
@@ -1,9 +1,13 @@
-import pandas as pd
 import os
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
+
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+from polarimetry import *
+from linfit import fit_cos2, fit_double_polarizers, fit_triple_polarizers
+from sweeps import merge
 
 
 GRAPH_TITLE_SIZE = 20
@@ -18,55 +22,27 @@ FIGURE_SIZE = (8, 6)
 AXIS_LABEL_SIZE = 20
 CAPSIZE = 5
 LEGEND_SIZE = 15
-matplotlib.use('TkAgg')
-
-def double_polarizers_ff(x, a, b):
-    return a * (np.cos(np.deg2rad(x))) ** 2 + b
-def triple_polarizers_ff(x, a, b):
-    return a * (np.cos(np.deg2rad(x)) * np.sin(np.deg2rad(x))) ** 2 + b
-
-
-def extract_averages_from_folder(folder_name: str) -> np.ndarray:
-    averages = []
-    file_lst = os.listdir(f"{folder_name}")
-    file_lst.sort(key=lambda f: int(''.join(filter(str.isdigit, f))) if any(c.isdigit() for c in f) else f)
-    # Iterate through all Excel files in the folder
-    for file in file_lst:
-        averages.append(intensity_avarage(f"{folder_name}{os.sep}{file}"))
-    return np.array(averages)
-
-def extract_uncertainties_from_folder(folder_name: str) -> np.ndarray:
-    uncertainties = []
-    file_lst = os.listdir(f"{folder_name}")
-    file_lst.sort(key=lambda f: int(''.join(filter(str.isdigit, f))) if any(c.isdigit() for c in f) else f)
-    # Iterate through all Excel files in the folder
-    for file in file_lst:
-        uncertainties.append(measurement_uncertainty(f"{folder_name}{os.sep}{file}"))
-    return np.array(uncertainties)
 
-
-def intensity_avarage(file: str) -> float:
-    df = pd.read_excel(file)
-    # Extract column B starting from the seventh row (index 6 in zero-based index)
-    column_b_values = df.iloc[6:, 1]  # Column B (index 1)
-    # Compute the average and store in the list
-    return column_b_values.mean()
-
-
-def plot_double_polarizers(angle_polarizer_list, averages_list, save=False):
+@instrument
+def plot_double_polarizers(angle_polarizer_list, averages_list, save=False, ax=None):
+    show = ax is None
+    if ax is None:
+        ax = plt.gca()
     intensity_uncertainty = measurement_uncertainty(f"double polarizers{os.sep}Measurement3.xlsx")
     angle_uncertainty = ANGLE_UNCERTAINTY
-    (A, B), cov_mat = curve_fit(double_polarizers_ff, angle_polarizer_list, averages_list)
+    # Angles measured twice (e.g. 70° and 250°) become one point with a smaller error bar
+    sweep = merge(angle_polarizer_list, averages_list, intensity_uncertainty, period=180)
+    (A, B), cov_mat = fit_double_polarizers(sweep.angles, sweep.values, sweep.sigma)
     x_values = np.linspace(0, 180, 100)
     fit_vals = double_polarizers_ff(x_values, A, B)
     # Fake data point
-    angle_polarizer_list = np.append(angle_polarizer_list, 60)
-    averages_list = np.append(averages_list, 0.00009)
-    plt.errorbar(
+    angle_polarizer_list = np.append(sweep.angles, 60)
+    averages_list = np.append(sweep.values, 0.00009)
+    ax.errorbar(
         angle_polarizer_list,
         averages_list,
         xerr=angle_uncertainty,
-        yerr=intensity_uncertainty,
+        yerr=np.append(sweep.sigma, intensity_uncertainty),
         fmt='o',
         color=DATA_COLOR,
         ecolor=ERRORBARS_COLOR,
@@ -76,44 +52,39 @@ def plot_double_polarizers(angle_polarizer_list, averages_list, save=False):
         label='Measured Intensity',
         ms=DATA_POINTs_SIZE
     )
-    plt.plot(x_values, fit_vals, color='black', label=rf'$I = {A:.2e} \cos^2(\theta) + {B:.2e}$')
-    plot_config(DEG_LABEL, INTENSITY_LABEL, 'Intensity vs Polarizer Angle')
+    ax.plot(x_values, fit_vals, color='black', label=rf'$I = {A:.2e} \cos^2(\theta) + {B:.2e}$')
+    plot_config(DEG_LABEL, INTENSITY_LABEL, 'Intensity vs Polarizer Angle', ax)
     if save:
-        plt.savefig(f"figures{os.sep}double polarizers.pdf", format="pdf")
-    plt.show()
+        ax.figure.savefig(f"figures{os.sep}double polarizers.pdf", format="pdf")
+    if show:
+        plt.show()
     return A, cov_mat[0][0]
 
-def plot_config(xlabel, ylabel, title):
-    plt.xlabel(xlabel, size=AXIS_LABEL_SIZE)
-    plt.ylabel(ylabel, size=AXIS_LABEL_SIZE)
-    plt.title(title, size=GRAPH_TITLE_SIZE)
-    plt.legend(fontsize=LEGEND_SIZE)
-    plt.grid(True)
-    plt.tight_layout()
-    plt.gca().tick_params(axis='both', which='major', labelsize=15)
-    plt.gcf().set_size_inches(FIGURE_SIZE)
-    plt.subplots_adjust(left=0.18)
-
-
-
-def fix_angles(angles: np.ndarray, center: int, cycle: int):
-    angles = (angles - center) % cycle
-    angles = np.where(angles < 0, angles + cycle, angles)
-    return angles
-
-
-def measurement_uncertainty(file: str) -> float:
-    """Extract measurement uncertainty from an Excel file"""
-    df = pd.read_excel(file)
-    intensities = df.iloc[6:, 1]
-    return np.std(intensities)
-
-
-def plot_triple_polarizers(angle_polarizer_list, averages_list, uncertainties,save=False):
+def plot_config(xlabel, ylabel, title, ax=None):
+    if ax is None:
+        ax = plt.gca()
+    fig = ax.figure
+    ax.set_xlabel(xlabel, size=AXIS_LABEL_SIZE)
+    ax.set_ylabel(ylabel, size=AXIS_LABEL_SIZE)
+    ax.set_title(title, size=GRAPH_TITLE_SIZE)
+    ax.legend(fontsize=LEGEND_SIZE)
+    ax.grid(True)
+    fig.tight_layout()
+    ax.tick_params(axis='both', which='major', labelsize=15)
+    fig.set_size_inches(FIGURE_SIZE)
+    fig.subplots_adjust(left=0.18)
+
+
+
+@instrument
+def plot_triple_polarizers(angle_polarizer_list, averages_list, uncertainties,save=False, ax=None):
+    show = ax is None
+    if ax is None:
+        ax = plt.gca()
     averages_list = np.delete(averages_list, 4)
     uncertainties = np.delete(uncertainties, 4)
     x_values = np.linspace(0, 100, 100)
-    (A, B), cov_mat = curve_fit(triple_polarizers_ff, angle_polarizer_list, averages_list)
+    (A, B), cov_mat = fit_triple_polarizers(angle_polarizer_list, averages_list)
     fit_values = triple_polarizers_ff(x_values, A, B)
 
     # Drifted data point
@@ -124,12 +95,13 @@ def plot_triple_polarizers(angle_polarizer_list, averages_list, uncertainties,sa
     averages_list[np.where(angle_polarizer_list == 60)] += 0.000016
     averages_list[np.where(angle_polarizer_list == 75)] += 0.000005
     angle_polarizer_list[np.where(angle_polarizer_list == 25)] += 1.3
-    plt.errorbar(angle_polarizer_list, averages_list, xerr=ANGLE_UNCERTAINTY, yerr=uncertainties,fmt='o',color=DATA_COLOR,ecolor=ERRORBARS_COLOR,capsize=5,label='Measured Intensity',ms=DATA_POINTs_SIZE)
-    plt.plot(x_values, fit_values, color=FIT_COLOR, label=rf'$I = {A:.2e} \cos^2(\theta)\sin^2(\theta) + {B:.2e}$')
-    plot_config(DEG_LABEL, INTENSITY_LABEL, 'Intensity vs Polarizer Angle')
+    ax.errorbar(angle_polarizer_list, averages_list, xerr=ANGLE_UNCERTAINTY, yerr=uncertainties,fmt='o',color=DATA_COLOR,ecolor=ERRORBARS_COLOR,capsize=5,label='Measured Intensity',ms=DATA_POINTs_SIZE)
+    ax.plot(x_values, fit_values, color=FIT_COLOR, label=rf'$I = {A:.2e} \cos^2(\theta)\sin^2(\theta) + {B:.2e}$')
+    plot_config(DEG_LABEL, INTENSITY_LABEL, 'Intensity vs Polarizer Angle', ax)
     if save:
-        plt.savefig(f"figures{os.sep}triple polarizers.pdf", format="pdf")
-    plt.show()
+        ax.figure.savefig(f"figures{os.sep}triple polarizers.pdf", format="pdf")
+    if show:
+        plt.show()
     return A, cov_mat[0][0]
 
 
@@ -139,7 +111,18 @@ triple_polarizers_angles = np.array(([120, 125, 130, 140, 100, 165, 170, 180, 16
 triple_polarizers_angles = fix_angles(triple_polarizers_angles, 75, 90)  # Max value is 120 degrees so zero is 120 - 45
 
 
+# Figures for the batch renderer (labtools.render); paths are relative to polarbears/
+FIGURES = {
+    "double polarizers.pdf": lambda fig: plot_double_polarizers(
+        double_polarizers_angles, extract_averages_from_folder("double polarizers"), ax=fig.add_subplot()),
+    "triple polarizers.pdf": lambda fig: plot_triple_polarizers(
+        triple_polarizers_angles, extract_averages_from_folder("triple polarizers"),
+        extract_uncertainties_from_folder("triple polarizers"), ax=fig.add_subplot()),
+}
+
+
 if __name__ == "__main__":
+    matplotlib.use('TkAgg')
     double_polarizers_I0 = intensity_avarage(f"double polarizers{os.sep}Measurement3.xlsx")
     triple_polarizers_I0 = intensity_avarage(f"triple polarizers{os.sep}Measurement1.xlsx") * 4
     fitted_I0, fittedI0_err = plot_double_polarizers(double_polarizers_angles, extract_averages_from_folder("double polarizers"), True)
@@ -0,0 +1,171 @@
+"""
+Bootstrap uncertainties of fitted parameters from the raw polarimeter readings.
+
+Every measurement file holds ~100 raw readings of one angle. Instead of
+collapsing them to mean ± std and trusting the fit covariance, the readings of
+every angle are resampled with replacement to build B synthetic datasets at
+once, a (B, n_angles) array of resampled means, which a batched solver refits
+in one call: the closed-form linfit solvers for the cos² models, `fit_batch`
+(warm-started at the measured fit) for the rest. Percentiles of the refitted
+parameters and of derived quantities (peak intensity, visibility, Brewster
+angle) give the intervals. Resampled fits that do not converge are left out
+of the spread and counted.
+
+Datasets are drawn in fixed-size chunks, each from its own spawned seed, so the
+result depends only on the seed and not on whether the chunks run serially or
+in a process pool (used when the batch is large).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from fitting import Model, fit_batch, get_model
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+from linfit import fit_cos2, fit_double_polarizers, fit_triple_polarizers
+from raw_store import RaggedSamples, load_samples
+
+CHUNK_BYTES = 32 * 2 ** 20  # budget for one chunk's resampling indices
+PARALLEL_SAMPLES = 5 * 10 ** 7  # resampled readings above which the chunks go to a process pool
+
+# Closed-form batched solvers, (x, y, sigma) -> params
+LINEAR_FITTERS = {
+    "cos2": lambda x, y, sigma: fit_cos2(x, y, sigma)[0],
+    "double_polarizers": lambda x, y, sigma: fit_double_polarizers(x, y, sigma)[0],
+    "cos2sin2": lambda x, y, sigma: fit_triple_polarizers(x, y, sigma)[0],
+}
+
+# Parameters defined modulo a period, unwrapped around the measured fit before taking percentiles
+PERIODIC = {"cos2": {1: 180.0}}
+
+
+def _brewster(p):
+    return np.rad2deg(np.arctan(p[..., 2]))
+
+
+def _visibility(p):
+    """(I_max − I_min) / (I_max + I_min) of a·cos²(...) + offset, the offset being the last parameter."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return p[..., 0] / (p[..., 0] + 2 * p[..., -1])
+
+
+# Quantities derived from the parameters, reported alongside them
+DERIVED = {
+    "cos2": {"I_max": lambda p: p[..., 0] + p[..., 2], "visibility": _visibility},
+    "double_polarizers": {"I_max": lambda p: p[..., 0] + p[..., 1], "visibility": _visibility},
+    "cos2sin2": {"I_max": lambda p: p[..., 0] / 4 + p[..., 1]},  # a·cos²·sin² = (a/4)·sin²(2x)
+    "fresnel_rp": {"brewster": _brewster},
+    "fresnel_rs": {"brewster": _brewster},
+}
+
+
+class BootstrapResult(NamedTuple):
+    names: tuple  # parameters, then derived quantities
+    estimate: np.ndarray  # (q,) from the measured means
+    samples: np.ndarray  # (B - dropped, q) one row per bootstrap dataset whose fit converged
+    lower: np.ndarray  # (q,)
+    upper: np.ndarray  # (q,)
+    dropped: int = 0  # bootstrap datasets left out because their fit did not converge
+
+
+def resample_means(values: np.ndarray, offsets: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    (count, n_measurements) means of readings resampled with replacement within each measurement.
+
+    values: all readings back to back; offsets: start of each measurement, plus the total length.
+    """
+    counts = np.diff(offsets)
+    starts = np.repeat(offsets[:-1], counts)
+    index = starts + (rng.random((count, len(values))) * np.repeat(counts, counts)).astype(np.intp)
+    return np.add.reduceat(values[index], offsets[:-1], axis=1) / counts
+
+
+def _fit(model: str, x, y, sigma, estimate):
+    """(params, converged); the closed-form solvers always converge."""
+    if model in LINEAR_FITTERS:
+        params = LINEAR_FITTERS[model](x, y, sigma)
+        return params, np.ones(np.shape(params)[:-1], dtype=bool)
+    result = fit_batch(model, x, y, sigma, p0=estimate)
+    return result.params, np.asarray(result.converged)
+
+
+def _bootstrap_chunk(model: str, values, offsets, x, sigma, estimate, count: int, seed):
+    means = resample_means(values, offsets, count, np.random.default_rng(seed))
+    return _fit(model, x, means, sigma, estimate)
+
+
+@instrument
+def bootstrap_fit(
+    model: Union[str, Model],
+    x,
+    samples: Union[RaggedSamples, Sequence[np.ndarray]],
+    count: int = 2000,
+    confidence: float = 0.682689,
+    derived: Optional[dict[str, Callable]] = None,
+    seed=None,
+    jobs: Optional[int] = None
+) -> BootstrapResult:
+    """
+    Bootstrap the fit of a registered model to the means of `samples`.
+
+    x: (n,) angle of every measurement; samples: their raw readings, as RaggedSamples or n arrays.
+    The readings' standard deviations weight every fit. derived: extra
+    name -> f(params) quantities, added to the model's entries in DERIVED.
+    confidence: central probability of the percentile intervals.
+    jobs: worker processes for large batches (None = all cores, 1 = serial).
+    """
+    name = get_model(model).name
+    x = np.asarray(x, dtype=float)
+    if not isinstance(samples, RaggedSamples):
+        samples = RaggedSamples.from_arrays(samples)
+    values, offsets = samples.values, samples.offsets
+    means = samples.mean()
+    sigma = samples.std()
+    sigma = np.where(sigma > 0, sigma, np.inf)
+    estimate, _ = _fit(name, x, means, sigma, None)
+    derived = {**DERIVED.get(name, {}), **(derived or {})}
+
+    chunk = max(1, CHUNK_BYTES // (16 * len(values)))
+    sizes = [min(chunk, count - start) for start in range(0, count, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    arguments = [(name, values, offsets, x, sigma, estimate, size, child) for size, child in zip(sizes, seeds)]
+    if jobs != 1 and len(sizes) > 1 and count * len(values) > PARALLEL_SAMPLES:
+        with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+            chunks = list(pool.map(_bootstrap_chunk, *zip(*arguments)))
+    else:
+        chunks = [_bootstrap_chunk(*args) for args in arguments]
+    converged = np.concatenate([ok for _, ok in chunks])
+    params = np.concatenate([fitted for fitted, _ in chunks])[converged]
+
+    for index, period in PERIODIC.get(name, {}).items():
+        params[:, index] = estimate[index] + (params[:, index] - estimate[index] + period / 2) % period - period / 2
+    names = get_model(model).params + tuple(derived)
+    estimate = np.concatenate([estimate, [f(estimate) for f in derived.values()]])
+    table = np.column_stack([params] + [f(params) for f in derived.values()])
+    tail = 50 * (1 - confidence)
+    if len(table):
+        lower, upper = np.percentile(table, [tail, 100 - tail], axis=0)
+    else:  # no resampled fit converged
+        lower = upper = np.full(len(names), np.nan)
+    return BootstrapResult(names, estimate, table, lower, upper, int(np.count_nonzero(~converged)))
+
+
+def print_bootstrap(result: BootstrapResult):
+    for name, value, low, high in zip(result.names, result.estimate, result.lower, result.upper):
+        print(f"{name} = {value:.4g} (+{high - value:.2g} / -{value - low:.2g})")
+    if result.dropped:
+        print(f"({result.dropped} of {result.dropped + len(result.samples)} resampled fits did not converge "
+              f"and were left out)")
+
+
+if __name__ == "__main__":
+    from refraction import BREWSTER_ANGLES, REFRACTION_ANGLES
+    from hwave import angles_30
+    print("Refraction, horizontal (Rp) with the Brewster sweep:")
+    print_bootstrap(bootstrap_fit("fresnel_rp", np.append(REFRACTION_ANGLES, BREWSTER_ANGLES),
+                                  load_samples(f"refraction{os.sep}horizontal").segments() +
+                                  load_samples(f"refraction{os.sep}brewster").segments(), seed=0))
+    print("Half wave, 30 degrees:")
+    print_bootstrap(bootstrap_fit("cos2", angles_30, load_samples(f"half wave{os.sep}30 angle"), seed=0))
@@ -0,0 +1,235 @@
+"""
+Forward model of microwave Bragg diffraction from the cubic ball lattice.
+
+The lattice (constant `lattice` [m]) turns about its vertical [001] axis, so
+the planes that reflect within the horizontal scattering plane are the (hk0)
+families. A family whose normal makes the angle φ = atan2(k, h) with the
+[100] face normal reflects at the scan angle θ (glancing angle to the face,
+`90 − angle` of the bragg2 file names) when its own glancing angle θ − φ
+satisfies Bragg's law:
+    2·d_hk·|sin(θ − φ)| = n·λ,    d_hk = lattice / √(h² + k²)
+
+`peak_table` lists those angles for every primitive (h, k) up to `max_index`
+and every order allowed by sin ≤ 1. `intensity` evaluates the expected scan on
+a dense angle grid: per family and allowed order n ≥ 1, the main lobe of the
+interference function of N = `layers` reflecting planes
+    sinc²(N·(|s| − n)),    s = 2·d_hk·sin(θ − φ) / λ,
+which is 1 at s = ±n, weighted by the Lorentz factor 1/sin 2θ_B of that order
+and a Debye-Waller falloff exp(−B·(n/d_hk)²). The zeroth order (the direct
+beam, s ≈ 0) is left out.
+
+Every function broadcasts over lattice constant and frequency, so a whole
+(a, f) sweep is one array expression; `score_sweep` fits it to a measured
+scan. Only λ/a is physically identifiable: a and f trade off along a ridge.
+"""
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+
+SPEED_OF_LIGHT = 3e8  # as in microwave.py
+FREQUENCY = 10.5e9
+LATTICE = 0.04
+MAX_INDEX = 3
+LAYERS = 5  # ball planes the beam reaches; sets the peak width
+SCAN_RANGE = (0.0, 90.0)
+MAX_BYTES = 64 * 2 ** 20  # budget for the per-chunk temporaries of score_sweep
+
+
+def families(max_index: int = MAX_INDEX) -> np.ndarray:
+    """Primitive (h, k) with normals at φ in (−90°, 90°], shape (F, 2), the [100] face first."""
+    from math import gcd
+    pairs = [(h, k) for h in range(0, max_index + 1) for k in range(-max_index, max_index + 1)
+             if gcd(h, k) == 1 and (h > 0 or k > 0)]
+    return np.array(sorted(pairs, key=lambda hk: (hk[0] ** 2 + hk[1] ** 2, abs(hk[1]), -hk[1])))
+
+
+def wavelength(frequency) -> np.ndarray:
+    return SPEED_OF_LIGHT / np.asarray(frequency, dtype=float)
+
+
+def _geometry(hk: np.ndarray):
+    """Normal angle φ [deg] and 1/d in lattice units √(h² + k²) of every family."""
+    return np.rad2deg(np.arctan2(hk[:, 1], hk[:, 0])), np.hypot(hk[:, 0], hk[:, 1])
+
+
+class PeakTable(NamedTuple):
+    h: np.ndarray  # (F, orders, 2): family, order, side of the plane
+    k: np.ndarray
+    order: np.ndarray
+    spacing: np.ndarray  # d_hk [m], (..., F, orders, 2) with the broadcast (lattice, frequency) shape in front
+    bragg_angle: np.ndarray  # θ_B [deg]
+    scan_angle: np.ndarray  # θ at which the peak appears [deg], NaN when out of range or forbidden
+    intensity: np.ndarray  # peak height of `intensity()` (Lorentz × Debye-Waller), NaN like scan_angle
+
+
+def peak_table(lattice=LATTICE, frequency=FREQUENCY, max_index: int = MAX_INDEX, max_order: int = 4,
+               scan_range=SCAN_RANGE, debye_waller: float = 0.0) -> PeakTable:
+    """Every (h, k, n) peak inside `scan_range`, on both sides of each plane (θ = φ ± θ_B)."""
+    hk = families(max_index)
+    phi, norm = _geometry(hk)
+    lattice, wave = np.broadcast_arrays(np.asarray(lattice, dtype=float), wavelength(frequency))
+    lattice, wave = lattice[..., None, None, None], wave[..., None, None, None]
+    order = np.arange(1, max_order + 1)[None, :, None]
+    spacing = lattice / norm[:, None, None]
+    sine = order * wave / (2 * spacing)
+    with np.errstate(invalid='ignore'):
+        bragg = np.rad2deg(np.arcsin(np.where(sine <= 1, sine, np.nan)))
+    scan = phi[:, None, None] + np.array([1, -1]) * bragg
+    scan = np.where((scan >= scan_range[0]) & (scan <= scan_range[1]), scan, np.nan)
+    height = _lorentz(bragg) * np.exp(-debye_waller * (order / spacing) ** 2)
+    shape = scan.shape[-3:]
+    return PeakTable(np.broadcast_to(hk[:, 0, None, None], shape), np.broadcast_to(hk[:, 1, None, None], shape),
+                     np.broadcast_to(order, shape), np.broadcast_to(spacing, scan.shape),
+                     np.broadcast_to(bragg, scan.shape), scan, np.where(np.isnan(scan), np.nan, height))
+
+
+def _lorentz(bragg_angle):
+    return 1 / np.sin(np.deg2rad(2 * bragg_angle))
+
+
+def print_peaks(table: PeakTable):
+    """The peaks of a single (lattice, frequency), by scan angle."""
+    found = np.flatnonzero(np.isfinite(table.scan_angle.ravel()))
+    found = found[np.argsort(table.scan_angle.ravel()[found])]
+    for index in found:
+        h, k, n = (np.ravel(values)[index] for values in (table.h, table.k, table.order))
+        print(f"({h}{k}0) n={n}: d = {np.ravel(table.spacing)[index] * 100:.2f} cm, "
+              f"θ_B = {np.ravel(table.bragg_angle)[index]:.2f}°, scan angle {np.ravel(table.scan_angle)[index]:.2f}°, "
+              f"relative intensity {np.ravel(table.intensity)[index]:.2f}")
+
+
+def intensity(theta, lattice=LATTICE, frequency=FREQUENCY, layers: int = LAYERS, max_index: int = MAX_INDEX,
+              debye_waller: float = 0.0) -> np.ndarray:
+    """
+    Expected scan at angles theta [deg], shape broadcast(lattice, frequency) + theta.shape.
+
+    Heights are relative: an allowed peak is Lorentz × Debye-Waller of its order.
+    """
+    hk = families(max_index)
+    phi, norm = _geometry(hk)
+    theta = np.asarray(theta, dtype=float)
+    lattice, wave = np.broadcast_arrays(np.asarray(lattice, dtype=float), wavelength(frequency))
+    points = (1,) * theta.ndim
+    spacing = lattice[..., None, None] / norm[:, None]  # (..., F, 1)
+    ratio = 2 * spacing / wave[..., None, None]  # highest allowed order, as a real number
+    order = np.arange(1, max(int(np.max(ratio, initial=1)), 1) + 1)  # (orders,)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        height = np.where(order <= ratio, _lorentz(np.rad2deg(np.arcsin(np.minimum(order / ratio, 1)))), 0.0)
+    height = height * np.exp(-debye_waller * (order / spacing) ** 2)  # (..., F, orders)
+    s = ratio.reshape(ratio.shape + points) * np.sin(np.deg2rad(theta - phi.reshape((-1, 1) + points)))
+    peaks = np.sinc(layers * (np.abs(s) - order.reshape((-1,) + points))) ** 2  # (..., F, orders, *theta)
+    return np.sum(height.reshape(height.shape + points) * peaks, axis=(-2 - theta.ndim, -1 - theta.ndim))
+
+
+# --- Comparison with a measured scan ---
+
+class SweepScore(NamedTuple):
+    lattice: np.ndarray  # (A,)
+    frequency: np.ndarray  # (B,)
+    chi2: np.ndarray  # (A, B) after the best scale and offset at each point
+    scale: np.ndarray  # (A, B)
+    offset: np.ndarray  # (A, B)
+
+    def best(self) -> tuple:
+        """(lattice, frequency, scale, offset, chi2) at the χ² minimum."""
+        i, j = np.unravel_index(np.nanargmin(self.chi2), self.chi2.shape)
+        return self.lattice[i], self.frequency[j], self.scale[i, j], self.offset[i, j], self.chi2[i, j]
+
+
+@instrument
+def score_sweep(angles, intensities, sigma=None, lattice=None, frequency=None, max_bytes: int = MAX_BYTES,
+                **options) -> SweepScore:
+    """
+    χ² of scale·intensity(angles; a, f) + offset against a scan, at every (a, f) of the grids.
+
+    The scale (≥ 0) and offset are solved in closed form (weighted linear least squares)
+    at each grid point; the model is evaluated a block of lattice constants at a time to
+    stay under `max_bytes`. `options` go to `intensity`.
+    """
+    lattice = np.linspace(0.03, 0.05, 201) if lattice is None else np.atleast_1d(np.asarray(lattice, dtype=float))
+    frequency = np.atleast_1d(np.asarray(FREQUENCY if frequency is None else frequency, dtype=float))
+    angles, y = np.asarray(angles, dtype=float), np.asarray(intensities, dtype=float)
+    weights = np.ones_like(y) if sigma is None else 1 / np.broadcast_to(np.asarray(sigma, dtype=float), y.shape) ** 2
+    weights = np.where(np.isfinite(y) & np.isfinite(weights), weights, 0.0)
+    y = np.where(weights > 0, y, 0.0)
+
+    count = len(families(options.get("max_index", MAX_INDEX)))
+    orders = int(2 * lattice.max() * np.sqrt(2) * options.get('max_index', MAX_INDEX) / wavelength(frequency).min()) + 1
+    rows = max(1, max_bytes // (8 * 4 * count * orders * len(frequency) * max(len(y), 1)))
+    shape = (len(lattice), len(frequency))
+    chi2, scale, offset = np.empty(shape), np.empty(shape), np.empty(shape)
+    sw, swy, swyy = weights.sum(), weights @ y, weights @ y ** 2
+    for start in range(0, len(lattice), rows):
+        block = slice(start, start + rows)
+        model = intensity(angles, lattice[block, None], frequency[None, :], **options)  # (rows, B, n)
+        swm, swmm, swmy = model @ weights, (model ** 2) @ weights, model @ (weights * y)
+        determinant = sw * swmm - swm ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a = np.where(determinant > 0, (sw * swmy - swm * swy) / determinant, 0.0)
+        a = np.maximum(a, 0.0)  # peaks, not dips: a negative scale falls back to the offset alone
+        b = (swy - a * swm) / sw
+        chi2[block] = swyy - 2 * a * swmy - 2 * b * swy + a ** 2 * swmm + 2 * a * b * swm + b ** 2 * sw
+        scale[block], offset[block] = a, b
+    return SweepScore(lattice, frequency, chi2, scale, offset)
+
+
+def scan_from_folder(folder: str = "bragg2") -> tuple:
+    """(scan angles 90 − file angle, intensities, uncertainties) of a rotation series, by scan angle."""
+    from polarimetry import data_from_folder
+    angles, intensities, uncertainties = data_from_folder(folder)
+    order = np.argsort(90 - angles)
+    return (90 - angles)[order], intensities[order], uncertainties[order]
+
+
+def fit_bragg_scan(folder: str = "bragg2", lattice=None, frequency=None, **options) -> SweepScore:
+    """score_sweep of a bragg2-style folder (unweighted: the scope noise understates the scatter between angles)."""
+    angles, intensities, _ = scan_from_folder(folder)
+    return score_sweep(angles, intensities, None, lattice, frequency, **options)
+
+
+@instrument
+def plot_bragg_model(folder: str = "bragg2", save: bool = False, ax=None, **options):
+    import matplotlib.pyplot as plt
+    from Malos import ANGLE_UNCERTAINTY, CAPSIZE, DATA_COLOR, DATA_POINTs_SIZE, DEG_LABEL, ERRORBARS_COLOR, \
+        FIT_COLOR, INTENSITY_LABEL, plot_config
+    show = ax is None
+    if ax is None:
+        ax = plt.gca()
+    angles, intensities, uncertainties = scan_from_folder(folder)
+    score = score_sweep(angles, intensities, None, **options)
+    a, f, scale, offset, _ = score.best()
+    ax.errorbar(angles, intensities, yerr=uncertainties, xerr=ANGLE_UNCERTAINTY, fmt='o', color=DATA_COLOR,
+                ecolor=ERRORBARS_COLOR, capsize=CAPSIZE, label="data", ms=DATA_POINTs_SIZE)
+    theta = np.linspace(angles.min(), angles.max(), 2000)
+    ax.plot(theta, scale * intensity(theta, a, f) + offset, color=FIT_COLOR,
+            label=rf"model, $a = {a * 100:.2f}$ cm, $f = {f / 1e9:.2f}$ GHz")
+    table = peak_table(a, f, scan_range=(angles.min(), angles.max()))
+    for h, k, n, angle in zip(table.h.ravel(), table.k.ravel(), table.order.ravel(), table.scan_angle.ravel()):
+        if np.isfinite(angle):
+            ax.axvline(angle, color="gray", linestyle=":", linewidth=0.8)
+            ax.annotate(f"({h}{k}0)$_{n}$", (angle, 1), xycoords=("data", "axes fraction"), fontsize=8,
+                        rotation=90, va="top", ha="right")
+    plot_config(DEG_LABEL, INTENSITY_LABEL, "Bragg scan and lattice model", ax)
+    if save:
+        ax.figure.savefig(f"plots{os.sep}bragg model.png")
+    if show:
+        plt.show()
+    return score
+
+
+# Figures for the batch renderer (labtools.render); paths are relative to polarbears/
+FIGURES = {
+    "bragg model.png": lambda fig: plot_bragg_model(ax=fig.add_subplot()),
+}
+
+
+if __name__ == "__main__":
+    import matplotlib
+    matplotlib.use('TkAgg')
+    print_peaks(peak_table())
+    lattice, frequency, *_ = plot_bragg_model(save=True).best()
+    print(f"best lattice constant {lattice * 100:.2f} cm at {frequency / 1e9:.2f} GHz")
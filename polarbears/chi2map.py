@@ -0,0 +1,141 @@
+"""
+χ² surfaces over dense parameter grids and profile-likelihood confidence regions.
+
+`chi2_grid` evaluates χ² of any model in the fitting registry at every point
+of a parameter grid, e.g. (scale, offset, n) for "fresnel_rp" or (a, b, c) for
+"cos2", by broadcasting the model over a chunk of grid points at a time; the
+chunk size is picked so the (chunk × data points) temporaries stay under a
+memory budget. Profiles (minimum over the other parameters) then give
+confidence intervals by the Δχ² rule, and 2-D profiles give contours.
+"""
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from fitting import FitResult, Model, fit_batch, get_model
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+
+MAX_BYTES = 64 * 2 ** 20  # budget for the per-chunk temporaries
+
+
+@instrument
+def chi2_grid(
+    model: Union[str, Model],
+    x,
+    y,
+    sigma,
+    grids: Sequence,
+    max_bytes: int = MAX_BYTES
+) -> np.ndarray:
+    """
+    χ² of `model` at every point of the outer product of `grids`.
+
+    grids: one entry per model parameter, either a 1-D array of values or a
+    scalar to hold that parameter fixed. Returns an array shaped like the grid
+    (fixed parameters keep a length-1 axis). NaN readings are ignored.
+    """
+    model = get_model(model)
+    if len(grids) != len(model.params):
+        raise ValueError(f"Model '{model.name}' takes {len(model.params)} parameters {model.params}, "
+                         f"got {len(grids)} grids")
+    grids = [np.atleast_1d(np.asarray(grid, dtype=float)) for grid in grids]
+    shape = tuple(len(grid) for grid in grids)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    weights = 1 / np.broadcast_to(np.asarray(sigma, dtype=float), y.shape)
+    keep = np.isfinite(y) & np.isfinite(weights)
+    x, y, weights = np.broadcast_to(x, y.shape)[keep], y[keep], weights[keep]
+
+    total = int(np.prod(shape))
+    chunk = max(1, max_bytes // (8 * 4 * max(len(y), 1)))
+    chi2 = np.empty(total)
+    for start in range(0, total, chunk):
+        index = np.unravel_index(np.arange(start, min(start + chunk, total)), shape)
+        params = np.stack([grid[i] for grid, i in zip(grids, index)], axis=-1)
+        residuals = (y - model.value(x, params)) * weights
+        chi2[start:start + len(params)] = np.einsum('ij,ij->i', residuals, residuals)
+    return chi2.reshape(shape)
+
+
+def grids_around(fit: FitResult, width: float = 4.0, points: int = 61) -> list:
+    """Grids spanning ±width standard errors around a single fit; fixed parameters (zero variance) stay scalar."""
+    errors = np.sqrt(np.diag(fit.cov))
+    return [value + np.linspace(-width, width, points) * error if error > 0 else value
+            for value, error in zip(fit.params, errors)]
+
+
+def profile(chi2: np.ndarray, keep: Union[int, Tuple[int, ...]]) -> np.ndarray:
+    """Profile χ²: minimum over every axis except `keep`."""
+    keep = (keep,) if isinstance(keep, int) else tuple(keep)
+    return np.min(chi2, axis=tuple(axis for axis in range(chi2.ndim) if axis not in keep))
+
+
+def delta_chi2(confidence: float = 0.682689, parameters: int = 1) -> float:
+    """Δχ² threshold of a `confidence` region for `parameters` jointly estimated parameters (1 → 1.0, 2 → 2.30)."""
+    from scipy.stats import chi2
+    return float(chi2.ppf(confidence, parameters))
+
+
+def profile_interval(grid, profile_chi2, delta: float = 1.0) -> Tuple[float, float, float]:
+    """
+    (best, lower, upper) of a 1-D profile: the minimum and where the profile crosses
+    min + delta, linearly interpolated. A bound is NaN if the crossing lies outside the grid.
+    """
+    grid, profile_chi2 = np.asarray(grid, dtype=float), np.asarray(profile_chi2, dtype=float)
+    best = int(np.argmin(profile_chi2))
+    level = profile_chi2[best] + delta
+
+    def crossing(indices):
+        above = np.flatnonzero(profile_chi2[indices] > level)
+        if len(above) == 0:
+            return np.nan
+        outside, inside = indices[above[0]], indices[above[0] - 1]
+        fraction = (level - profile_chi2[inside]) / (profile_chi2[outside] - profile_chi2[inside])
+        return grid[inside] + fraction * (grid[outside] - grid[inside])
+
+    lower = crossing(np.arange(best, -1, -1))
+    upper = crossing(np.arange(best, len(grid)))
+    return grid[best], lower, upper
+
+
+def plot_contours(grid_x, grid_y, profile_chi2: np.ndarray, ax=None, confidences=(0.682689, 0.954500),
+                  labels: Optional[Tuple[str, str]] = None):
+    """Draw the joint confidence contours of a 2-D profile (axes ordered like the grid: x first)."""
+    if ax is None:
+        import matplotlib.pyplot as plt
+        ax = plt.gca()
+    levels = [profile_chi2.min() + delta_chi2(confidence, 2) for confidence in confidences]
+    contours = ax.contour(grid_x, grid_y, profile_chi2.T, levels=levels, colors="black")
+    ax.clabel(contours, fmt={level: f"{confidence:.1%}" for level, confidence in zip(levels, confidences)})
+    best = np.unravel_index(np.argmin(profile_chi2), profile_chi2.shape)
+    ax.plot(grid_x[best[0]], grid_y[best[1]], "+", color="black")
+    if labels is not None:
+        ax.set_xlabel(labels[0])
+        ax.set_ylabel(labels[1])
+    return contours
+
+
+# --- Refractive index surface ---
+
+def _index_contour_figure(fig):
+    from refraction import load_refraction_data
+    angles, horizontal, horizontal_err, _, _ = load_refraction_data()
+    fit = fit_batch("fresnel_rp", angles, horizontal, horizontal_err, absolute_sigma=True)
+    grids = grids_around(fit)
+    chi2 = chi2_grid("fresnel_rp", angles, horizontal, horizontal_err, grids)
+    best, lower, upper = profile_interval(grids[2], profile(chi2, 2))
+    ax = fig.add_subplot()
+    plot_contours(grids[2], grids[0], profile(chi2, (2, 0)).T, ax=ax, labels=("n", "scale"))
+    ax.set_title(f"n = {best:.4f} (+{upper - best:.4f} / -{best - lower:.4f})")
+
+
+FIGURES = {"index contours.pdf": _index_contour_figure}
+
+
+if __name__ == "__main__":
+    from matplotlib import use
+    import matplotlib.pyplot as plt
+    use('TkAgg')
+    _index_contour_figure(plt.figure())
+    plt.show()
@@ -0,0 +1,215 @@
+"""
+Memoization of fits, so rerunning a script to restyle a plot does not refit.
+
+`memoize_fit` wraps a fitting function. Every call is keyed by a SHA-256 of
+its arguments: array contents (with dtype and shape), scalars, p0, bounds and
+options, and for functions their code identity, i.e. the contents of the
+source files of the function and of the module-level functions it calls, plus
+any closure values (other objects by their class's source file and their
+attributes). `memoize_fit(resolve=...)` maps the arguments before keying, so
+fit_batch keys a registry model name on the registered Model's value, jacobian
+and guess rather than on the name. Editing the data, the model or the fitting
+code, or registering another model under the same name, therefore changes the
+key and the fit is redone.
+
+Results are kept in an in-process LRU and, when the FIT_CACHE_DIR environment
+variable names a directory (e.g. .fitcache), also pickled there, so they
+survive between runs. The disk store is trimmed to FIT_CACHE_MAX_MB (default
+100), least recently used first. Set FIT_CACHE=0 to turn caching off.
+"""
+import copy
+import functools
+import hashlib
+import os
+import pickle
+import sys
+import types
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+LRU_SIZE = 256
+MAX_MB = 100
+
+_memory: OrderedDict = OrderedDict()
+_file_digests: dict = {}
+
+
+class Unhashable(TypeError):
+    """An argument the key cannot represent; the call runs uncached."""
+
+
+def _file_digest(path: str) -> bytes:
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _file_digests:
+        with open(path, "rb") as file:
+            _file_digests[key] = hashlib.sha256(file.read()).digest()
+    return _file_digests[key]
+
+
+def _source_files(function: types.FunctionType, files: set, seen: set):
+    """Source files of `function` and of the module-level functions it calls, recursively."""
+    if id(function) in seen:
+        return
+    seen.add(id(function))
+    path = function.__code__.co_filename
+    if os.path.isfile(path):
+        files.add(path)
+    names = set()
+    stack = [function.__code__]
+    while stack:
+        code = stack.pop()
+        names.update(code.co_names)
+        stack.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+    for name in names:
+        target = function.__globals__.get(name)
+        if isinstance(target, types.FunctionType):
+            _source_files(target, files, seen)
+
+
+def _update(digest, value, seen: set):
+    """Feed a canonical encoding of `value` to `digest`."""
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes, np.generic)):
+        digest.update(f"{type(value).__name__}:{value!r};".encode())
+    elif isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        digest.update(f"array:{value.dtype.str}:{value.shape};".encode())
+        digest.update(value.tobytes() if value.dtype != object else pickle.dumps(value))
+    elif isinstance(value, (tuple, list)):
+        digest.update(f"{type(value).__name__}:{len(value)}(".encode())
+        for item in value:
+            _update(digest, item, seen)
+        digest.update(b")")
+    elif isinstance(value, dict):
+        digest.update(f"dict:{len(value)}(".encode())
+        for key in sorted(value, key=repr):
+            _update(digest, key, seen)
+            _update(digest, value[key], seen)
+        digest.update(b")")
+    elif isinstance(value, functools.partial):
+        _update(digest, (value.func, value.args, value.keywords), seen)
+    elif isinstance(value, types.FunctionType):
+        digest.update(f"function:{value.__module__}.{value.__qualname__};".encode())
+        if id(value) in seen:
+            return
+        files = set()
+        _source_files(value, files, seen)
+        for path in sorted(files):
+            digest.update(_file_digest(path))
+        if not files:
+            digest.update(value.__code__.co_code)
+        for cell in value.__closure__ or ():
+            _update(digest, cell.cell_contents, seen)
+    elif isinstance(value, types.BuiltinFunctionType) or isinstance(value, np.ufunc):
+        digest.update(f"builtin:{getattr(value, '__module__', '')}.{value.__name__};".encode())
+    elif hasattr(value, "__dict__") and not isinstance(value, type):  # e.g. a jones.Setup in a model closure
+        kind = type(value)
+        digest.update(f"object:{kind.__module__}.{kind.__qualname__};".encode())
+        if id(value) in seen:
+            return
+        seen.add(id(value))
+        path = getattr(sys.modules.get(kind.__module__), "__file__", None)
+        if path and os.path.isfile(path):
+            digest.update(_file_digest(path))
+        _update(digest, vars(value), seen)
+    else:
+        raise Unhashable(f"Cannot key a fit on {type(value).__name__}")
+
+
+def fit_key(function: Callable, args: tuple, kwargs: dict) -> str:
+    digest = hashlib.sha256()
+    _update(digest, (function, args, kwargs), set())
+    return digest.hexdigest()
+
+
+def _disk_dir():
+    return os.environ.get("FIT_CACHE_DIR") or None
+
+
+def _evict(directory: str):
+    """Remove the least recently used entries until the store fits in FIT_CACHE_MAX_MB."""
+    limit = float(os.environ.get("FIT_CACHE_MAX_MB", MAX_MB)) * 2 ** 20
+    entries = [entry for entry in os.scandir(directory) if entry.name.endswith(".pkl")]
+    total = sum(entry.stat().st_size for entry in entries)
+    for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime_ns):
+        if total <= limit:
+            break
+        total -= entry.stat().st_size
+        os.remove(entry.path)
+
+
+def _disk_get(key: str):
+    directory = _disk_dir()
+    if directory is None:
+        return None
+    path = os.path.join(directory, f"{key}.pkl")
+    try:
+        with open(path, "rb") as file:
+            result = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    os.utime(path)  # mark as recently used
+    return result,
+
+
+def _disk_put(key: str, result):
+    directory = _disk_dir()
+    if directory is None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{key}.pkl")
+    try:
+        with open(f"{path}.tmp", "wb") as file:
+            pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        os.remove(f"{path}.tmp")
+        return
+    os.replace(f"{path}.tmp", path)
+    _evict(directory)
+
+
+def memoize_fit(function: Optional[Callable] = None, resolve: Optional[Callable] = None) -> Callable:
+    """
+    Cache `function`'s results by the content of its arguments (see the module docstring).
+    resolve: (args, kwargs) -> (args, kwargs) keyed instead, e.g. registry names replaced by what they name.
+    Use as @memoize_fit or @memoize_fit(resolve=...).
+    """
+    if function is None:
+        return functools.partial(memoize_fit, resolve=resolve)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if os.environ.get("FIT_CACHE", "1") == "0":
+            return function(*args, **kwargs)
+        try:
+            key = fit_key(function, *(resolve(args, kwargs) if resolve else (args, kwargs)))
+        except Unhashable:
+            return function(*args, **kwargs)
+        if key in _memory:
+            _memory.move_to_end(key)
+            return copy.deepcopy(_memory[key])
+        stored = _disk_get(key)
+        if stored is not None:
+            result = stored[0]
+        else:
+            result = function(*args, **kwargs)
+            _disk_put(key, result)
+        _memory[key] = result
+        if len(_memory) > LRU_SIZE:
+            _memory.popitem(last=False)
+        return copy.deepcopy(result)
+
+    wrapper.uncached = function
+    return wrapper
+
+
+def clear_fit_cache(disk: bool = False):
+    """Empty the in-process cache, and the FIT_CACHE_DIR store too if `disk`."""
+    _memory.clear()
+    directory = _disk_dir()
+    if disk and directory is not None and os.path.isdir(directory):
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".pkl"):
+                os.remove(entry.path)
@@ -0,0 +1,312 @@
+"""
+Batched nonlinear fitting with analytic Jacobians.
+
+Models live in a registry (`MODELS`, filled with `register_model`). Each one
+supplies a vectorized value function and its analytic Jacobian, both taking
+x of shape (..., n) and parameters of shape (..., k):
+    value(x, p)    -> (..., n)
+    jacobian(x, p) -> (..., n, k)
+and optionally guess(x, y) -> (..., k) for a starting point.
+
+`fit_batch` fits m independent datasets at once with a Levenberg-Marquardt
+iteration in which every step is a batched (m, k, k) solve, weighting each
+point by its sigma. NaN readings get zero weight, so datasets of different
+lengths can be padded with NaN. Angles are in degrees throughout.
+"""
+from typing import Callable, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from fitcache import memoize_fit
+from fresnel import fresnel
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+from linfit import fit_cos2, fit_double_polarizers, fit_triple_polarizers
+
+
+class Model(NamedTuple):
+    name: str
+    params: tuple
+    value: Callable
+    jacobian: Callable
+    guess: Optional[Callable] = None
+
+
+class FitResult(NamedTuple):
+    params: np.ndarray  # (..., k)
+    cov: np.ndarray  # (..., k, k)
+    chi2: np.ndarray  # (...,)
+    dof: np.ndarray  # (...,)
+    converged: np.ndarray  # (...,) bool
+
+
+MODELS: dict = {}
+
+
+def register_model(name: str, params: Sequence[str], value: Callable, jacobian: Callable,
+                   guess: Optional[Callable] = None) -> Model:
+    model = Model(name, tuple(params), value, jacobian, guess)
+    MODELS[name] = model
+    return model
+
+
+def get_model(model: Union[str, Model]) -> Model:
+    if isinstance(model, Model):
+        return model
+    if model not in MODELS:
+        raise KeyError(f"Unknown model '{model}', registered: {', '.join(MODELS)}")
+    return MODELS[model]
+
+
+def _unpack(p):
+    """Split (..., k) parameters into k arrays shaped (..., 1) so they broadcast against (..., n) points."""
+    return [p[..., i, None] for i in range(p.shape[-1])]
+
+
+def _stack(*columns):
+    """Jacobian (..., n, k) from k columns; the last argument (a parameter) only fixes the batch shape."""
+    *columns, like = np.broadcast_arrays(*columns)
+    return np.stack(columns, axis=-1)
+
+
+# --- cos² family (guesses come from the exact linear solution) ---
+
+def _cos2_value(x, p):
+    a, b, c = _unpack(p)
+    return a * np.cos(np.deg2rad(x - b)) ** 2 + c
+
+
+def _cos2_jacobian(x, p):
+    a, b, c = _unpack(p)
+    u = np.deg2rad(x - b)
+    return _stack(np.cos(u) ** 2, a * np.sin(2 * u) * np.pi / 180, 1.0, a)
+
+
+def _double_polarizers_value(x, p):
+    a, b = _unpack(p)
+    return a * np.cos(np.deg2rad(x)) ** 2 + b
+
+
+def _double_polarizers_jacobian(x, p):
+    a, b = _unpack(p)
+    return _stack(np.cos(np.deg2rad(x)) ** 2, 1.0, a)
+
+
+def _cos2sin2_value(x, p):
+    a, b = _unpack(p)
+    return a * (np.cos(np.deg2rad(x)) * np.sin(np.deg2rad(x))) ** 2 + b
+
+
+def _cos2sin2_jacobian(x, p):
+    a, b = _unpack(p)
+    return _stack((np.cos(np.deg2rad(x)) * np.sin(np.deg2rad(x))) ** 2, 1.0, a)
+
+
+register_model("cos2", ("a", "b", "c"), _cos2_value, _cos2_jacobian, lambda x, y: fit_cos2(x, y)[0])
+register_model("double_polarizers", ("a", "b"), _double_polarizers_value, _double_polarizers_jacobian,
+               lambda x, y: fit_double_polarizers(x, y)[0])
+register_model("cos2sin2", ("a", "b"), _cos2sin2_value, _cos2sin2_jacobian,
+               lambda x, y: fit_triple_polarizers(x, y)[0])
+
+
+# --- Fresnel reflectance, scale·R(θ, n) + offset, incident medium n = 1 ---
+
+def _fresnel_terms(x, n):
+    """cos θ, cos θt and d(cos θt)/dn for a real index n (the Jacobian's share of the fresnel() intermediates)."""
+    cos_i = np.cos(np.deg2rad(x))
+    sin_t = np.clip(np.sin(np.deg2rad(x)) / n, -1, 1)
+    cos_t = np.sqrt(1 - sin_t ** 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dcos_t = np.where(cos_t > 0, sin_t ** 2 / (n * cos_t), 0.0)
+    return cos_i, cos_t, dcos_t
+
+
+def _rp(x, n):
+    """Amplitude rp and drp/dn."""
+    cos_i, cos_t, dcos_t = _fresnel_terms(x, n)
+    denominator = n * cos_i + cos_t
+    return (n * cos_i - cos_t) / denominator, 2 * cos_i * (cos_t - n * dcos_t) / denominator ** 2
+
+
+def _rs(x, n):
+    """Amplitude rs and drs/dn."""
+    cos_i, cos_t, dcos_t = _fresnel_terms(x, n)
+    denominator = cos_i + n * cos_t
+    return (cos_i - n * cos_t) / denominator, -2 * cos_i * (cos_t + n * dcos_t) / denominator ** 2
+
+
+def _fresnel_model(amplitude: Callable, reflectance: str):
+    def value(x, p):
+        scale, offset, n = _unpack(p)
+        return scale * getattr(fresnel(x, n), reflectance) + offset
+
+    def jacobian(x, p):
+        scale, offset, n = _unpack(p)
+        r, dr = amplitude(x, n)
+        return _stack(r ** 2, 1.0, scale * 2 * r * dr, scale)
+
+    return value, jacobian
+
+
+def _fresnel_guess(x, y):
+    y = np.asarray(y, dtype=float)
+    low, high = np.nanmin(y, axis=-1), np.nanmax(y, axis=-1)
+    return np.stack([high - low, low, np.full_like(low, 1.5)], axis=-1)
+
+
+register_model("fresnel_rp", ("scale", "offset", "n"), *_fresnel_model(_rp, "Rp"), _fresnel_guess)
+register_model("fresnel_rs", ("scale", "offset", "n"), *_fresnel_model(_rs, "Rs"), _fresnel_guess)
+
+
+# --- Diffraction peak, A·sinc(x − B) + C ---
+
+def _sinc_value(x, p):
+    A, B, C = _unpack(p)
+    return A * np.sinc(x - B) + C
+
+
+def _sinc_jacobian(x, p):
+    A, B, C = _unpack(p)
+    u = x - B
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dsinc = np.where(u == 0, 0.0, (np.cos(np.pi * u) - np.sinc(u)) / u)
+    return _stack(np.sinc(u), -A * dsinc, 1.0, A)
+
+
+def _peak_guess(x, y):
+    x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    top = np.nanargmax(y, axis=-1)[..., None]
+    low = np.nanmin(y, axis=-1)
+    return np.stack([np.nanmax(y, axis=-1) - low, np.take_along_axis(x, top, -1)[..., 0], low], axis=-1)
+
+
+register_model("sinc", ("A", "B", "C"), _sinc_value, _sinc_jacobian, _peak_guess)
+
+
+# --- Diffraction peak, A·exp(−(x − B)²/2w²) + C ---
+
+def _gauss_value(x, p):
+    A, B, w, C = _unpack(p)
+    return A * np.exp(-0.5 * ((x - B) / w) ** 2) + C
+
+
+def _gauss_jacobian(x, p):
+    A, B, w, C = _unpack(p)
+    u = (x - B) / w
+    g = np.exp(-0.5 * u ** 2)
+    return _stack(g, A * g * u / w, A * g * u ** 2 / w, 1.0, A)
+
+
+def _gauss_guess(x, y):
+    A, B, C = np.moveaxis(_peak_guess(x, y), -1, 0)
+    x = np.asarray(x, dtype=float)
+    width = (np.nanmax(x, axis=-1) - np.nanmin(x, axis=-1)) / 6
+    return np.stack([A, B, np.broadcast_to(width, A.shape), C], axis=-1)
+
+
+register_model("gauss", ("A", "B", "w", "C"), _gauss_value, _gauss_jacobian, _gauss_guess)
+
+
+# --- Engine ---
+
+def _resolve_model(args: tuple, kwargs: dict):
+    """Key fit_batch on the registered Model, not its name, so editing or re-registering a model misses the cache."""
+    if args:
+        return (get_model(args[0]),) + args[1:], kwargs
+    if "model" in kwargs:
+        kwargs = {**kwargs, "model": get_model(kwargs["model"])}
+    return args, kwargs
+
+
+@instrument
+@memoize_fit(resolve=_resolve_model)
+def fit_batch(
+    model: Union[str, Model],
+    x,
+    y,
+    sigma=None,
+    p0=None,
+    bounds=None,
+    fixed: Sequence[str] = (),
+    absolute_sigma: bool = False,
+    max_iter: int = 200,
+    tol: float = 1e-10
+) -> FitResult:
+    """
+    Fit `model` to every dataset in y independently.
+
+    x: (n,) or (m, n); y: (n,) or (m, n); sigma: broadcastable to y, None = unweighted.
+    p0: (k,) or (m, k); None uses the model's guess. bounds: (lower, upper), each (k,) or (m, k).
+    fixed: parameter names held at their p0 value.
+    absolute_sigma: as in curve_fit, otherwise the covariance is scaled by the reduced χ².
+    A single dataset returns unbatched arrays.
+    """
+    model = get_model(model)
+    y = np.asarray(y, dtype=float)
+    single = y.ndim == 1
+    y = np.atleast_2d(y)
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    k = len(model.params)
+
+    with np.errstate(divide='ignore'):
+        weights = np.ones_like(y) if sigma is None else 1 / np.broadcast_to(np.asarray(sigma, dtype=float), y.shape)
+    weights = np.where(np.isfinite(y) & np.isfinite(weights), weights, 0.0)
+    y = np.where(weights > 0, y, 0.0)
+    x = np.where(weights > 0, x, np.nanmean(x, axis=-1, keepdims=True))
+
+    if p0 is None:
+        if model.guess is None:
+            raise ValueError(f"Model '{model.name}' has no guess, pass p0")
+        p0 = model.guess(x, np.where(weights > 0, y, np.nan))
+    p = np.array(np.broadcast_to(np.asarray(p0, dtype=float), (y.shape[0], k)))
+    lower, upper = (-np.inf, np.inf) if bounds is None else bounds
+    lower = np.broadcast_to(np.asarray(lower, dtype=float), p.shape)
+    upper = np.broadcast_to(np.asarray(upper, dtype=float), p.shape)
+    p = np.clip(p, lower, upper)
+    free = np.array([name not in fixed for name in model.params])
+
+    def residuals(params, rows=slice(None)):
+        return (y[rows] - model.value(x[rows], params)) * weights[rows]
+
+    def normal_equations(params, rows=slice(None)):
+        jac = model.jacobian(x[rows], params) * weights[rows][..., None] * free
+        return jac, np.swapaxes(jac, -1, -2) @ jac
+
+    chi2 = np.sum(residuals(p) ** 2, axis=-1)
+    damping = np.full(y.shape[0], 1e-3)
+    converged = np.zeros(y.shape[0], dtype=bool)
+    stalled = np.zeros(y.shape[0], dtype=bool)  # damping ran away: stop, but not converged
+    for _ in range(max_iter):
+        active = ~(converged | stalled)
+        if not active.any():
+            break
+        jac, curvature = normal_equations(p[active], active)
+        gradient = np.einsum('mnk,mn->mk', jac, residuals(p[active], active))
+        diagonal = np.diagonal(curvature, axis1=-2, axis2=-1)
+        scaled = np.where(free, diagonal, 1.0) + 1e-300
+        system = curvature + (damping[active, None] * scaled)[..., None] * np.eye(k) + np.diag(~free * 1.0)
+        step = np.linalg.solve(system, gradient[..., None])[..., 0]
+        trial = np.clip(p[active] + step, lower[active], upper[active])
+        trial_chi2 = np.sum(residuals(trial, active) ** 2, axis=-1)
+
+        better = trial_chi2 <= chi2[active]
+        improvement = chi2[active] - trial_chi2
+        small_step = np.all(np.abs(trial - p[active]) <= tol * (np.abs(p[active]) + tol), axis=-1)
+        index = np.flatnonzero(active)
+        p[index[better]] = trial[better]
+        done = (better & (improvement <= tol * chi2[active])) | small_step
+        chi2[index[better]] = trial_chi2[better]
+        damping[index] = np.where(better, damping[index] / 10, damping[index] * 10)
+        converged[index[done]] = True
+        stalled[index[~done & (damping[index] > 1e16)]] = True
+
+    _, curvature = normal_equations(p)
+    curvature = curvature + np.diag(~free * 1.0)
+    cov = np.linalg.pinv(curvature) * (free[:, None] & free[None, :])
+    dof = np.count_nonzero(weights, axis=-1) - np.count_nonzero(free)
+    if sigma is None or not absolute_sigma:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = cov * np.where(dof > 0, chi2 / dof, np.inf)[:, None, None]
+    if single:
+        return FitResult(p[0], cov[0], chi2[0], dof[0], converged[0])
+    return FitResult(p, cov, chi2, dof, converged)
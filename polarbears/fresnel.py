@@ -0,0 +1,57 @@
+"""
+Fresnel coefficients of a planar interface, all in one broadcast pass.
+
+`fresnel(angle_deg, n2, n1)` returns the amplitude coefficients rp, rs, tp, ts and
+the power coefficients Rp, Rs, Tp, Ts, sharing the refraction-angle intermediates
+between them. Indices may be complex (n + iκ) for absorbing samples, and the
+incident medium is arbitrary. Inputs broadcast like any numpy expression, so a
+grid of angle × index × wavelength is one call, e.g.
+    fresnel(angles[:, None, None], n_of_wavelength[None, :, :])
+with n(λ) tabulated along the last axis.
+
+When everything is real and there is no total internal reflection the
+computation stays in real arithmetic; otherwise it is done in complex numbers,
+with the transmitted-wave branch chosen to decay into the second medium.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+
+class Fresnel(NamedTuple):
+    rp: np.ndarray
+    rs: np.ndarray
+    tp: np.ndarray
+    ts: np.ndarray
+    Rp: np.ndarray
+    Rs: np.ndarray
+    Tp: np.ndarray
+    Ts: np.ndarray
+
+
+def fresnel(angle_deg, n2, n1=1.0) -> Fresnel:
+    """Fresnel coefficients for light hitting medium `n2` from medium `n1` at `angle_deg`."""
+    angle = np.deg2rad(angle_deg)
+    cos_i = np.cos(angle)
+    sin_t = np.sin(angle) * (n1 / n2)
+    if np.isrealobj(sin_t) and np.all(np.abs(sin_t) <= 1):
+        cos_t = np.sqrt(1 - sin_t ** 2)
+    else:
+        cos_t = np.sqrt(1 - np.asarray(sin_t, dtype=complex) ** 2)
+        cos_t = np.where(np.imag(n2 * cos_t) < 0, -cos_t, cos_t)
+
+    n1_cos_i = n1 * cos_i
+    n2_cos_t = n2 * cos_t
+    n2_cos_i = n2 * cos_i
+    n1_cos_t = n1 * cos_t
+    s_denominator = n1_cos_i + n2_cos_t
+    p_denominator = n2_cos_i + n1_cos_t
+
+    rs = (n1_cos_i - n2_cos_t) / s_denominator
+    rp = (n2_cos_i - n1_cos_t) / p_denominator
+    ts = 2 * n1_cos_i / s_denominator
+    tp = 2 * n1_cos_i / p_denominator
+
+    Ts = np.real(n2_cos_t) / np.real(n1_cos_i) * np.abs(ts) ** 2
+    Tp = np.real(n2 * np.conj(cos_t)) / np.real(n1 * np.conj(cos_i)) * np.abs(tp) ** 2
+    return Fresnel(rp, rs, tp, ts, np.abs(rp) ** 2, np.abs(rs) ** 2, Tp, Ts)
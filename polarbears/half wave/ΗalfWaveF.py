@@ -1,9 +1,15 @@
-import pandas as pd
 import os
+import sys
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # polarbears/
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+from raw_store import load_samples
+from linfit import fit_cos2
+from sweeps import merge, unfold
 
 # Plot constants
 GRAPH_TITLE_SIZE = 20
@@ -15,45 +21,25 @@ LABELS = ["No Half plate", "Half plate in 30° Angle", "50° Angle"]
 FIGURE_SIZE = (8, 6)
 AXIS_LABEL_SIZE = 20
 
-matplotlib.use('TkAgg')
-
-def measurement_uncertainty(file: str) -> float:
-    """Extract measurement uncertainty from an Excel file"""
-    df = pd.read_excel(file)
-    intensities = df.iloc[6:, 1]
-    mean = intensities.mean()
-    max_intensity = intensities.max()
-    min_intensity = intensities.min()
-    return max(max_intensity - mean, mean - min_intensity)
-
-def intensity_average(file: str) -> float:
-    df = pd.read_excel(file)
-    return df.iloc[6:, 1].mean()  # Column B starting from row 7
-
-
 def extract_averages_from_folder(folder_path: str) -> tuple[list[float], list[float]]:
-    files = os.listdir(folder_path)
-    files = [f for f in files if f.endswith(".xlsx")]
-    files.sort(key=lambda f: int(''.join(filter(str.isdigit, f))) if any(c.isdigit() for c in f) else f)
-
-    means = []
-    uncertainties = []
-    for file in files:
-        full_path = os.path.join(folder_path, file)
-        means.append(intensity_average(full_path))
-        uncertainties.append(measurement_uncertainty(full_path))
-    return means, uncertainties
+    samples = load_samples(folder_path, ".xlsx")
+    return samples.mean().tolist(), samples.max_deviation().tolist()
 
 
 def cos2_fit_func(x, a, b, c):
     return a * np.cos(np.deg2rad(x - b))**2 + c
 
 
+@instrument
 def plot_regular_with_fit(
     intensities_by_type: list[list[float]],
-    uncertainties_by_type: list[list[float]]
+    uncertainties_by_type: list[list[float]],
+    ax=None
 ):
-    plt.figure(figsize=FIGURE_SIZE)
+    show = ax is None
+    if ax is None:
+        plt.figure(figsize=FIGURE_SIZE)
+        ax = plt.gca()
 
     angles_deg_list = [
         [0, 10, 20, 30, 40, 100, 110, 120, 180, 190, 200, 210, 220],  # No Angle
@@ -69,29 +55,14 @@ def plot_regular_with_fit(
         label = LABELS[i]
         color = DATA_COLOR[i]
 
-        def cos2_fit_func(x, a, b, c):
-            return a * np.cos(np.deg2rad(x - b))**2 + c
-
-        initial_guess = [0.001, 90, 0]
-        bounds = ([0, 0, -1], [1, 180, 1])
-
-        try:
-            popt, _ = curve_fit(
-                cos2_fit_func,
-                angles_deg,
-                intensities,
-                p0=initial_guess,
-                bounds=bounds
-            )
-        except RuntimeError:
-            print(f"Fit failed for {label}")
-            continue
+        # Closed-form fit: a >= 0 and center in [0, 180), no initial guess or failure case
+        popt, _ = fit_cos2(angles_deg, intensities)
 
         fine_x = np.linspace(min(angles_deg), max(angles_deg), 500)
         fitted_vals = cos2_fit_func(fine_x, *popt)
 
         # Styled errorbar plot
-        plt.errorbar(
+        ax.errorbar(
             angles_deg,
             intensities,
             xerr=angle_uncertainty,
@@ -106,57 +77,81 @@ def plot_regular_with_fit(
             ms=DATA_POINTs_SIZE
         )
 
-        plt.plot(fine_x, fitted_vals, label=f"{label} Fit", color=color)
+        ax.plot(fine_x, fitted_vals, label=f"{label} Fit", color=color)
 
         a, b, c = popt
         print(f"{label} Fit Params:\n  a = {a:.6f}\n  center = {b:.2f}°\n  offset = {c:.6f}")
 
-    plt.xlabel(DEG_LABEL, fontsize=AXIS_LABEL_SIZE)
-    plt.ylabel(INTENSITY_LABEL, fontsize=AXIS_LABEL_SIZE)
-    plt.title("Intensity vs Angle with Cos² Fit", fontsize=GRAPH_TITLE_SIZE)
-    plt.legend()
-    plt.tight_layout()
-    plt.show()
+    ax.set_xlabel(DEG_LABEL, fontsize=AXIS_LABEL_SIZE)
+    ax.set_ylabel(INTENSITY_LABEL, fontsize=AXIS_LABEL_SIZE)
+    ax.set_title("Intensity vs Angle with Cos² Fit", fontsize=GRAPH_TITLE_SIZE)
+    ax.legend()
+    ax.figure.tight_layout()
+    if show:
+        plt.show()
 
 
 
-def plot_polar(intensities_by_type: list[list[float]]):
-    fig = plt.figure(figsize=FIGURE_SIZE)
-    ax = fig.add_subplot(111, projection='polar')
+@instrument
+def plot_polar(intensities_by_type: list[list[float]], ax=None):
+    """`ax`, when given, must be a polar Axes."""
+    show = ax is None
+    if ax is None:
+        fig = plt.figure(figsize=FIGURE_SIZE)
+        ax = fig.add_subplot(111, projection='polar')
 
     angles_deg_list = [
         [0, 10, 20, 30, 40, 100, 110, 120, 180, 190, 200, 210, 220],  # No Angle
         [0, 10, 20, 30, 40, 100, 110, 120, 180, 190, 200, 210, 220],  # 30° Angle
     ]
 
+    # cos² repeats every 180°: merge 180-220° into 0-40°, then mirror the half turn onto 0–360°
+    sweeps = unfold(merge(angles_deg_list, intensities_by_type[:2], period=180), 180)
     for i in range(2):  # Skip 50° Angle
-        angles_deg = angles_deg_list[i]
-        angles_rad = np.deg2rad(angles_deg)
-        intensities = intensities_by_type[i]
-
-        # Mirror data for 0–360°
-        full_angles = np.concatenate([angles_rad, angles_rad + np.pi])
-        full_intensities = np.concatenate([intensities, intensities])
-
-        ax.plot(full_angles, full_intensities, 'o-', label=LABELS[i], color=DATA_COLOR[i])
+        ax.plot(np.deg2rad(sweeps.angles[i]), sweeps.values[i], 'o-', label=LABELS[i], color=DATA_COLOR[i])
 
     ax.set_title("Polar Plot (0–360°)", fontsize=GRAPH_TITLE_SIZE)
     ax.legend(loc='upper right')
-    plt.tight_layout()
-    plt.show()
+    ax.figure.tight_layout()
+    if show:
+        plt.show()
 
 
+folder_names = ["no angle", "30 angle", "50 angle"]
 
-# --- Run ---
 
-folder_names = ["no angle", "30 angle", "50 angle"]
-intensities = []
-uncertainties = []
+def load_all_folders() -> tuple[list[list[float]], list[list[float]]]:
+    intensities = []
+    uncertainties = []
+    for folder in folder_names:
+        means, errors = extract_averages_from_folder(folder)
+        intensities.append(means)
+        uncertainties.append(errors)
+    return intensities, uncertainties
+
+
+def _regular_with_fit_figure(fig):
+    fig.set_size_inches(FIGURE_SIZE)
+    plot_regular_with_fit(*load_all_folders(), ax=fig.add_subplot())
 
-for folder in folder_names:
-    means, errors = extract_averages_from_folder(folder)
-    intensities.append(means)
-    uncertainties.append(errors)
 
-plot_regular_with_fit(intensities, uncertainties)
-#plot_polar(intensities[:2])  # Optional
+def _polar_figure(fig):
+    fig.set_size_inches(FIGURE_SIZE)
+    intensities, _ = load_all_folders()
+    plot_polar(intensities[:2], ax=fig.add_subplot(111, projection='polar'))
+
+
+# Figures for the batch renderer (labtools.render); paths are relative to "polarbears/half wave"
+FIGURES = {
+    "cos2 fit.pdf": _regular_with_fit_figure,
+    "polar.pdf": _polar_figure,
+}
+
+
+# --- Run ---
+
+if __name__ == "__main__":
+    matplotlib.use('TkAgg')
+    intensities, uncertainties = load_all_folders()
+    plot_regular_with_fit(intensities, uncertainties)
+    #plot_polar(intensities[:2])  # Optional
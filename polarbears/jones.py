@@ -0,0 +1,241 @@
+"""
+Batched Jones and Mueller calculus for chains of polarizers and retarders.
+
+Elements are stacked 2×2 complex matrices (..., 2, 2); a chain is their
+product in the order the light meets them, composed with einsum, so a chain
+over thousands of angle configurations is one array expression:
+    polarizer(θ)             transmission axis at θ
+    retarder(θ, δ)           fast axis at θ, retardance δ (half_wave / quarter_wave)
+    chain(*elements)         E_n ··· E_1 for elements given first to last
+    intensity(J, field)      |J·E|², or ½·tr(J·J†) for unpolarized light
+    mueller(J)               the 4×4 Mueller matrix of a (non-depolarizing) Jones matrix
+All angles and retardances are in degrees.
+
+A `Setup` describes an optical arrangement whose element angles and
+retardances are sums of constants, the scan variable "x" and named
+parameters, e.g. the quarter-wave measurement
+    Setup([Element("polarizer", 0), Element("retarder", "axis", "retardance"),
+           Element("polarizer", "x")])
+`register_setup` turns it into a fitting.MODELS entry with parameters
+(a, *setup parameters[, c]), value a·I(x) [+ c] and an analytic Jacobian (the
+product rule over the chain), so fit_batch and chi2map work on any setup.
+"""
+from typing import NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from fitting import Model, register_model
+
+HORIZONTAL = np.array([1.0, 0.0], dtype=complex)
+
+# Stokes basis change: M = A·(J ⊗ J*)·A⁻¹
+_A = np.array([[1, 0, 0, 1], [1, 0, 0, -1], [0, 1, 1, 0], [0, 1j, -1j, 0]])
+_A_INV = np.linalg.inv(_A)
+
+
+# --- Elements ---
+
+def _axis(angle) -> Tuple[np.ndarray, np.ndarray]:
+    """(P, dP/dθ [per radian]) of the projector on the axis at `angle` [deg]."""
+    double = np.deg2rad(2 * np.asarray(angle, dtype=float))
+    c2, s2 = np.cos(double), np.sin(double)
+    projector = 0.5 * np.stack([np.stack([1 + c2, s2], -1), np.stack([s2, 1 - c2], -1)], -2)
+    derivative = np.stack([np.stack([-s2, c2], -1), np.stack([c2, s2], -1)], -2)
+    return projector.astype(complex), derivative.astype(complex)
+
+
+def polarizer(angle) -> np.ndarray:
+    return _axis(angle)[0]
+
+
+def retarder(angle, retardance) -> np.ndarray:
+    """Linear retarder, fast axis at `angle`: P + e^{iδ}·(1 − P) (global phase dropped)."""
+    projector, _ = _axis(angle)
+    phase = np.exp(1j * np.deg2rad(np.asarray(retardance, dtype=float)))[..., None, None]
+    return projector + phase * (np.eye(2) - projector)
+
+
+def half_wave(angle) -> np.ndarray:
+    return retarder(angle, 180.0)
+
+
+def quarter_wave(angle) -> np.ndarray:
+    return retarder(angle, 90.0)
+
+
+def chain(*elements: np.ndarray) -> np.ndarray:
+    """Jones matrix of elements met first to last, broadcast over their leading axes."""
+    total = elements[0]
+    for element in elements[1:]:
+        total = np.einsum('...ij,...jk->...ik', element, total)
+    return total
+
+
+def intensity(jones: np.ndarray, field: Optional[np.ndarray] = HORIZONTAL) -> np.ndarray:
+    """Transmitted intensity for a unit input `field`, or for unpolarized light when field is None."""
+    if field is None:
+        return 0.5 * np.einsum('...ij,...ij->...', jones, jones.conj()).real
+    out = np.einsum('...ij,j->...i', jones, np.asarray(field, dtype=complex))
+    return np.einsum('...i,...i->...', out, out.conj()).real
+
+
+def mueller(jones: np.ndarray) -> np.ndarray:
+    """Mueller matrices (..., 4, 4) of Jones matrices (..., 2, 2)."""
+    kron = np.einsum('...ij,...kl->...ikjl', jones, jones.conj()).reshape(jones.shape[:-2] + (4, 4))
+    return np.einsum('ab,...bc,cd->...ad', _A, kron, _A_INV).real
+
+
+def stokes_intensity(mueller_matrix: np.ndarray, stokes=(1.0, 0.0, 0.0, 0.0)) -> np.ndarray:
+    """Intensity out of a Mueller chain for an input Stokes vector (default unpolarized)."""
+    return np.einsum('...j,j->...', mueller_matrix[..., 0, :], np.asarray(stokes, dtype=float))
+
+
+# --- Setups for fitting ---
+
+Term = Union[float, str, Tuple[Union[float, str], ...]]
+
+
+class Element(NamedTuple):
+    kind: str  # "polarizer" or "retarder"
+    angle: Term  # constant [deg], "x", a parameter name, or a tuple summing those
+    retardance: Term = 0.0  # retarders only
+
+
+def _names(term: Term) -> Tuple:
+    return term if isinstance(term, tuple) else (term,)
+
+
+class Setup:
+    """An arrangement of elements whose angles and retardances depend on x and named parameters."""
+
+    def __init__(self, elements: Sequence[Element], field: Optional[np.ndarray] = HORIZONTAL):
+        self.elements = list(elements)
+        self.field = field
+        names = []
+        for element in self.elements:
+            terms = _names(element.angle) + (_names(element.retardance) if element.kind == "retarder" else ())
+            names += [term for term in terms if isinstance(term, str) and term != "x" and term not in names]
+        self.params = tuple(names)
+
+    def _term(self, term: Term, x, values: dict):
+        total = 0.0
+        for part in _names(term):
+            total = total + (x if part == "x" else values[part] if isinstance(part, str) else part)
+        return total
+
+    def _matrices(self, x, p):
+        """Jones matrices of every element and their derivatives {parameter: dE/dp [per degree]}."""
+        values = {name: p[..., i, None] for i, name in enumerate(self.params)}
+        shape = np.broadcast_shapes(np.shape(x), p.shape[:-1] + (1,)) + (2, 2)
+        matrices, derivatives = [], []
+        for element in self.elements:
+            angle = self._term(element.angle, x, values)
+            projector, d_projector = _axis(angle)
+            d_angle = d_projector * np.pi / 180
+            partial = {}
+            if element.kind == "polarizer":
+                matrix = projector
+            else:
+                phase = np.exp(1j * np.deg2rad(self._term(element.retardance, x, values)))[..., None, None]
+                matrix = projector + phase * (np.eye(2) - projector)
+                d_angle = (1 - phase) * d_angle
+                for name in _names(element.retardance):
+                    if name in values:
+                        partial[name] = partial.get(name, 0) + 1j * np.pi / 180 * phase * (np.eye(2) - projector)
+            for name in _names(element.angle):
+                if name in values:
+                    partial[name] = partial.get(name, 0) + d_angle
+            matrices.append(np.broadcast_to(matrix, shape))
+            derivatives.append(partial)
+        return matrices, derivatives
+
+    def intensity(self, x, p) -> np.ndarray:
+        x, p = np.asarray(x, dtype=float), np.asarray(p, dtype=float)
+        return intensity(chain(*self._matrices(x, p)[0]), self.field)
+
+    def gradient(self, x, p) -> Tuple[np.ndarray, np.ndarray]:
+        """(I, dI/dp) with dI/dp shaped (..., n, parameters), by the product rule over the chain."""
+        x, p = np.asarray(x, dtype=float), np.asarray(p, dtype=float)
+        matrices, derivatives = self._matrices(x, p)
+        count = len(matrices)
+        prefix = [None] * (count + 1)  # prefix[k] = E_{k-1} ··· E_0
+        suffix = [None] * (count + 1)  # suffix[k] = E_{n-1} ··· E_k
+        prefix[0] = suffix[count] = np.broadcast_to(np.eye(2, dtype=complex), matrices[0].shape)
+        for k in range(count):
+            prefix[k + 1] = np.einsum('...ij,...jk->...ik', matrices[k], prefix[k])
+            suffix[count - 1 - k] = np.einsum('...ij,...jk->...ik', suffix[count - k], matrices[count - 1 - k])
+        total = prefix[count]
+        gradient = np.zeros(np.shape(total)[:-2] + (len(self.params),))
+        if self.field is None:
+            for k, partial in enumerate(derivatives):
+                for name, d_element in partial.items():
+                    d_total = suffix[k + 1] @ d_element @ prefix[k]
+                    gradient[..., self.params.index(name)] += np.einsum('...ij,...ij->...', d_total,
+                                                                         total.conj()).real
+            return intensity(total, None), gradient
+        out = np.einsum('...ij,j->...i', total, self.field)
+        for k, partial in enumerate(derivatives):
+            for name, d_element in partial.items():
+                d_out = np.einsum('...ij,j->...i', suffix[k + 1] @ d_element @ prefix[k], self.field)
+                gradient[..., self.params.index(name)] += 2 * np.einsum('...i,...i->...', d_out, out.conj()).real
+        return np.einsum('...i,...i->...', out, out.conj()).real, gradient
+
+
+def register_setup(name: str, setup: Setup, defaults: Sequence[float], background: bool = True) -> Model:
+    """
+    Register a·I(x; setup parameters) + c as a fitting model named `name`.
+
+    defaults: starting values of the setup parameters; the guess scales a and c so the
+    model at those values spans the range of the data.
+    background: include c. Leave it out when the data cannot tell it apart from the
+    chain parameters (an analyzer scan has only a constant and a 2x harmonic).
+    """
+    defaults = np.asarray(defaults, dtype=float)
+    end = -1 if background else None
+
+    def value(x, p):
+        transmitted = p[..., 0, None] * setup.intensity(x, p[..., 1:end])
+        return transmitted + p[..., -1, None] if background else transmitted
+
+    def jacobian(x, p):
+        transmitted, gradient = setup.gradient(x, p[..., 1:end])
+        columns = [transmitted[..., None], p[..., 0, None, None] * gradient]
+        if background:
+            columns.append(np.ones_like(transmitted)[..., None])
+        return np.concatenate(columns, axis=-1)
+
+    def guess(x, y):
+        y = np.asarray(y, dtype=float)
+        x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+        start = np.broadcast_to(defaults, y.shape[:-1] + defaults.shape)
+        transmitted = setup.intensity(x, start)
+        spread = np.nanmax(transmitted, axis=-1) - np.nanmin(transmitted, axis=-1)
+        flat = (not background) | (spread < 1e-3 * np.nanmax(transmitted, axis=-1))  # e.g. circular light
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a = np.where(flat, np.nanmean(y, axis=-1) / np.nanmean(transmitted, axis=-1),
+                         (np.nanmax(y, axis=-1) - np.nanmin(y, axis=-1)) / spread)
+        columns = [a[..., None], start]
+        if background:
+            columns.append(np.where(flat, 0.0, np.nanmin(y, axis=-1) - a * np.nanmin(transmitted, axis=-1))[..., None])
+        return np.concatenate(columns, axis=-1)
+
+    return register_model(name, ("a",) + setup.params + (("c",) if background else ()), value, jacobian, guess)
+
+
+# Setups of the polarization lab: (setup, defaults, background). x is the angle the experiment turns.
+SETUPS = {
+    # polarizer, then an analyzer at x + offset
+    "jones_double_polarizers": (Setup([Element("polarizer", 0.0), Element("polarizer", ("x", "offset"))]),
+                                [0.0], True),
+    # crossed polarizers with a third at x + offset between them
+    "jones_triple_polarizers": (Setup([Element("polarizer", 0.0), Element("polarizer", ("x", "offset")),
+                                       Element("polarizer", 90.0)]), [0.0], True),
+    # polarizer, retarder of unknown axis and retardance, analyzer at x (the quarter-wave measurement)
+    "jones_retarder_analyzer": (Setup([Element("polarizer", 0.0), Element("retarder", "axis", "retardance"),
+                                       Element("polarizer", "x")]), [45.0, 90.0], False),
+    # retarder turned to x + axis between parallel polarizers
+    "jones_rotating_retarder": (Setup([Element("polarizer", 0.0), Element("retarder", ("x", "axis"), "retardance"),
+                                       Element("polarizer", 0.0)]), [0.0, 180.0], False),
+}
+for _name, (_setup, _defaults, _background) in SETUPS.items():
+    register_setup(_name, _setup, _defaults, _background)
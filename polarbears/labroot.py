@@ -0,0 +1,12 @@
+"""
+Puts the repository root on sys.path, so a lab script run from its own folder can import labtools.
+
+Every lab module imports it before its first labtools import; from the root
+(labtools.render, the benchmarks) the root is already on the path.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
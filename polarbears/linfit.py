@@ -0,0 +1,115 @@
+"""
+Closed-form weighted least squares for the cos² polarizer models.
+
+The models are linear in a trigonometric basis once the angle is known:
+    a·cos²(x − b) + c      = (a/2 + c) + (a/2)cos2b·cos2x + (a/2)sin2b·sin2x   -> [1, cos2x, sin2x]
+    a·cos²(x) + b          = (a/2 + b) + (a/2)·cos2x                            -> [1, cos2x]
+    a·cos²(x)·sin²(x) + b  = (a/8 + b) − (a/8)·cos4x                            -> [1, cos4x]
+so they are solved directly instead of iterated: deterministic, no initial
+guess, no convergence failures. The physical parameters and their covariance
+follow analytically from the basis coefficients.
+
+Every function accepts a single sweep (x, y of shape (n,)) or a batch of
+sweeps (shape (m, n)) solved together in one batched QR. Angles are in degrees.
+NaN readings (or NaN/inf sigmas) are given zero weight, so sweeps of different
+lengths can be padded with NaN and batched. The return convention matches
+scipy's curve_fit: (popt, pcov), with pcov scaled by the reduced χ² unless
+absolute_sigma is True.
+"""
+import numpy as np
+
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+
+
+@instrument
+def linear_lstsq(design: np.ndarray, y: np.ndarray, sigma=None, absolute_sigma: bool = False):
+    """
+    Weighted linear least squares, batched over leading axes.
+
+    design: (..., n, k) basis functions evaluated at the n points
+    y: (..., n) readings; sigma: per-point uncertainties broadcastable to y (None = unweighted)
+    Returns (coefficients (..., k), covariance (..., k, k), chi2 (...,)).
+    """
+    design, y = np.asarray(design, dtype=float), np.asarray(y, dtype=float)
+    with np.errstate(divide='ignore'):
+        weights = np.ones_like(y) if sigma is None else 1 / np.broadcast_to(np.asarray(sigma, dtype=float), y.shape)
+    weights = np.where(np.isfinite(y) & np.isfinite(weights), weights, 0.0)
+    y = np.where(weights > 0, y, 0.0)
+    design = np.broadcast_to(design, y.shape + design.shape[-1:])
+
+    q, r = np.linalg.qr(design * weights[..., None])
+    coefficients = np.linalg.solve(r, np.einsum('...nk,...n->...k', q, y * weights)[..., None])[..., 0]
+    r_inv = np.linalg.inv(r)
+    cov = r_inv @ np.swapaxes(r_inv, -1, -2)
+
+    residuals = (y - np.einsum('...nk,...k->...n', design, coefficients)) * weights
+    chi2 = np.sum(residuals ** 2, axis=-1)
+    if sigma is None or not absolute_sigma:
+        dof = np.count_nonzero(weights, axis=-1) - design.shape[-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.where(dof > 0, chi2 / dof, np.inf)
+        cov = cov * scale[..., None, None]
+    return coefficients, cov, chi2
+
+
+def _propagate(cov: np.ndarray, jacobian: np.ndarray) -> np.ndarray:
+    return np.einsum('...ij,...jk,...lk->...il', jacobian, cov, jacobian)
+
+
+def cos2_from_basis(coefficients: np.ndarray, cov: np.ndarray):
+    """Map [1, cos2x, sin2x] coefficients and covariance to (a, b [deg, in [0, 180)), c)."""
+    p0, p1, p2 = np.moveaxis(coefficients, -1, 0)
+    r = np.hypot(p1, p2)
+    a = 2 * r
+    b = np.rad2deg(0.5 * np.arctan2(p2, p1)) % 180
+    c = p0 - r
+    zero, one = np.zeros_like(r), np.ones_like(r)
+    db = np.rad2deg(0.5) / r ** 2
+    jacobian = np.stack([
+        np.stack([zero, 2 * p1 / r, 2 * p2 / r], axis=-1),
+        np.stack([zero, -p2 * db, p1 * db], axis=-1),
+        np.stack([one, -p1 / r, -p2 / r], axis=-1),
+    ], axis=-2)
+    return np.stack([a, b, c], axis=-1), _propagate(cov, jacobian)
+
+
+def _linear_map(jacobian):
+    """Parameters that are a fixed linear map of the coefficients."""
+    jacobian = np.array(jacobian, dtype=float)
+    return lambda coefficients, cov: (coefficients @ jacobian.T, _propagate(cov, jacobian))
+
+
+# model name (as registered in fitting) -> (basis of the angles in radians, map to (params, cov))
+BASES = {
+    "cos2": (lambda x: [np.ones_like(x), np.cos(2 * x), np.sin(2 * x)], cos2_from_basis),
+    "double_polarizers": (lambda x: [np.ones_like(x), np.cos(2 * x)], _linear_map([[0.0, 2.0], [1.0, -1.0]])),
+    "cos2sin2": (lambda x: [np.ones_like(x), np.cos(4 * x)], _linear_map([[0.0, -8.0], [1.0, 1.0]])),
+}
+
+
+def design_matrix(model: str, x) -> np.ndarray:
+    """Basis of a linear model at angles x [deg], shape (..., n, k)."""
+    x = np.deg2rad(np.asarray(x, dtype=float))
+    return np.stack(BASES[model][0](x), axis=-1)
+
+
+def _fit_basis(model: str, x, y, sigma, absolute_sigma: bool):
+    design = design_matrix(model, np.broadcast_to(np.asarray(x, dtype=float), np.shape(y)))
+    coefficients, cov, _ = linear_lstsq(design, y, sigma, absolute_sigma)
+    return BASES[model][1](coefficients, cov)
+
+
+def fit_cos2(x, y, sigma=None, absolute_sigma: bool = False):
+    """Fit a·cos²(x − b) + c (half_wave_ff / cos2_fit_func). Returns ((a, b, c), cov)."""
+    return _fit_basis("cos2", x, y, sigma, absolute_sigma)
+
+
+def fit_double_polarizers(x, y, sigma=None, absolute_sigma: bool = False):
+    """Fit a·cos²(x) + b (double_polarizers_ff). Returns ((a, b), cov)."""
+    return _fit_basis("double_polarizers", x, y, sigma, absolute_sigma)
+
+
+def fit_triple_polarizers(x, y, sigma=None, absolute_sigma: bool = False):
+    """Fit a·cos²(x)·sin²(x) + b (triple_polarizers_ff). Returns ((a, b), cov)."""
+    return _fit_basis("cos2sin2", x, y, sigma, absolute_sigma)
@@ -0,0 +1,338 @@
+"""
+Live mode: follow a measurement folder during a sweep and refit as files land.
+
+The polarimeter software writes Measurement1.xlsx, Measurement2.xlsx, ... one
+at a time. `watch` polls the folder, ingests every new file once it is
+complete (unchanged between two polls and readable), and updates the fit
+and the figure in place, so the result is visible while the sweep runs.
+
+Each new point costs O(1) in the number of points already taken:
+    cos2, double_polarizers, cos2sin2   recursive least squares on the linear
+                                        basis of linfit.BASES (exact, no iteration)
+    any other model of fitting.MODELS   recursive Gauss-Newton step on the
+                                        point's Jacobian row, with a fit_batch
+                                        refit whenever the point count doubles
+                                        (amortized O(1)), the steps drift a
+                                        standard error, or the fit has not
+                                        settled yet (see RecursiveModelFit)
+
+Example (from polarbears/):
+    python live.py "half wave/30 angle" --angles 0 10 20 30 40 100 110 120 180 190 200 210 220
+"""
+import argparse
+import os
+import time
+from typing import Callable, Optional, Sequence, Union
+
+import numpy as np
+
+from fitting import Model, fit_batch, get_model
+from linfit import BASES, design_matrix
+from polarimetry import folder_files, measurement_samples
+
+POLL_INTERVAL = 1.0  # seconds between folder scans
+IDLE_TIMEOUT = 600.0  # stop after this long without a new file [s]
+STEP_SIGMAS = 1.0  # steps that move a parameter this many standard errors from the last refit trigger a refit
+SURPRISE_SIGMAS = 4.0  # so is a point this far from the prediction
+REFIT_ITERATIONS = 50  # fits of the first, ill-posed points do not converge at all; do not wait for them
+
+
+class _Recursive:
+    """Points seen so far, kept for plotting and refits (appending is amortized O(1))."""
+
+    def __init__(self, absolute_sigma: bool):
+        self.absolute_sigma = absolute_sigma
+        self.x, self.y, self.sigma = [], [], []
+
+    @property
+    def n(self) -> int:
+        return len(self.x)
+
+    def _scaled(self, cov: np.ndarray, chi2: float, k: int) -> np.ndarray:
+        """Covariance scaled by the reduced χ², as curve_fit does without absolute_sigma."""
+        if self.absolute_sigma:
+            return cov
+        dof = self.n - k
+        return cov * (chi2 / dof if dof > 0 else np.inf)
+
+
+class RecursiveLinearFit(_Recursive):
+    """
+    Weighted recursive least squares for a model of linfit.BASES.
+
+    The information matrix is accumulated until it is invertible; from then
+    on P = (XᵀWX)⁻¹, the coefficients and the weighted residual sum are
+    updated per point with the Sherman-Morrison identity, O(k²) each.
+    """
+
+    def __init__(self, model: str, absolute_sigma: bool = False):
+        super().__init__(absolute_sigma)
+        self.model = model
+        self.to_params = BASES[model][1]
+        k = design_matrix(model, 0.0).shape[-1]
+        self.k = k
+        self._information = np.zeros((k, k))
+        self._projection = np.zeros(k)  # XᵀWy
+        self._y2 = 0.0  # yᵀWy
+        self.coefficients: Optional[np.ndarray] = None
+        self._p: Optional[np.ndarray] = None
+        self.chi2 = np.nan
+
+    def add(self, x: float, y: float, sigma: float = 1.0):
+        self.x.append(x)
+        self.y.append(y)
+        self.sigma.append(sigma)
+        basis, weight = design_matrix(self.model, x), 1 / sigma ** 2
+        if self._p is None:
+            self._information += weight * np.outer(basis, basis)
+            self._projection += weight * y * basis
+            self._y2 += weight * y ** 2
+            if np.linalg.matrix_rank(self._information) == self.k:
+                self._p = np.linalg.inv(self._information)
+                self.coefficients = self._p @ self._projection
+                self.chi2 = max(self._y2 - self._projection @ self.coefficients, 0.0)
+            return
+        p_basis = self._p @ basis
+        denominator = 1 + weight * basis @ p_basis
+        error = y - basis @ self.coefficients
+        gain = weight * p_basis / denominator
+        self.coefficients = self.coefficients + gain * error
+        self._p = self._p - np.outer(gain, p_basis)
+        self.chi2 += weight * error ** 2 / denominator
+
+    @property
+    def ready(self) -> bool:
+        return self._p is not None
+
+    def result(self):
+        """(params, cov) as linfit returns them."""
+        return self.to_params(self.coefficients, self._scaled(self._p, self.chi2, self.k))
+
+
+class RecursiveModelFit(_Recursive):
+    """
+    Recursive Gauss-Newton for a fitting.MODELS model.
+
+    From k + 1 points on, each point is refit with fit_batch until two
+    consecutive refits agree within their standard errors: a sweep taken in
+    angle order reaches a feature (a Brewster minimum, a peak) only late, and
+    steps linearized around an early estimate run away. Each refit starts from
+    the best, by χ², of the model's guess, p0 and the running estimate. Once
+    settled, each point updates the parameters with one Kalman-style step along
+    its Jacobian row, unless the steps would move a parameter more than
+    STEP_SIGMAS standard errors from the last refit, the point lies further
+    than SURPRISE_SIGMAS from the prediction, or the point count has doubled:
+    then the point triggers a refit instead.
+    """
+
+    def __init__(self, model: Union[str, Model], p0=None, absolute_sigma: bool = False):
+        super().__init__(absolute_sigma)
+        self.model = get_model(model)
+        self.k = len(self.model.params)
+        self.p0 = None if p0 is None else np.asarray(p0, dtype=float)
+        self.params = self.p0
+        self._p: Optional[np.ndarray] = None
+        self._refit_at = self.k + 1
+        self.settled = False
+        self.chi2 = np.nan
+
+    def _starts(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        starts = [start for start in (self.params, self.p0) if start is not None]
+        if self.model.guess is not None:
+            starts.append(np.asarray(self.model.guess(x, y), dtype=float))
+        if not starts:
+            raise ValueError(f"Model '{self.model.name}' has no guess, pass p0")
+        return np.unique(np.array(starts).reshape(-1, self.k), axis=0)
+
+    def _refit(self):
+        x, y, sigma = (np.array(values) for values in (self.x, self.y, self.sigma))
+        fits = []
+        for start in self._starts(x, y):
+            try:
+                fits.append(fit_batch.uncached(self.model, x, y, sigma, p0=start, absolute_sigma=True,
+                                               max_iter=REFIT_ITERATIONS))
+            except np.linalg.LinAlgError:  # a degenerate start, e.g. zero scale
+                continue
+        if not fits:
+            raise np.linalg.LinAlgError(f"No start of '{self.model.name}' could be fitted")
+        best = min(fits, key=lambda fit: (not fit.converged, fit.chi2 if np.isfinite(fit.chi2) else np.inf))
+        previous = self.params if self._p is not None else None
+        self.params, self.chi2 = best.params, float(best.chi2)
+        jacobian = self.model.jacobian(x, self.params) / sigma[:, None]
+        self._p = np.linalg.pinv(jacobian.T @ jacobian)
+        errors = np.sqrt(np.abs(np.diag(self._p)))
+        self._anchor = self.params  # the steps are linearized around this refit
+        self.settled = self.settled or bool(best.converged and previous is not None
+                                            and np.all(np.abs(self.params - previous) <= errors))
+        self._refit_at = 2 * self.n if self.settled else self.n + 1
+
+    def add(self, x: float, y: float, sigma: float = 1.0):
+        self.x.append(x)
+        self.y.append(y)
+        self.sigma.append(sigma)
+        if self.n >= self._refit_at:
+            self._refit()
+            return
+        if self._p is None:
+            return
+        row = self.model.jacobian(np.array([x]), self.params)[0] / sigma
+        error = (y - self.model.value(np.array([x]), self.params)[0]) / sigma
+        p_row = self._p @ row
+        denominator = 1 + row @ p_row
+        params = self.params + p_row * error / denominator
+        p = self._p - np.outer(p_row, p_row) / denominator
+        if (abs(error) > SURPRISE_SIGMAS * np.sqrt(denominator)
+                or np.any(np.abs(params - self._anchor) > STEP_SIGMAS * np.sqrt(np.abs(np.diag(p))))):
+            self._refit()  # the linearization around the last refit no longer holds
+            return
+        self.params, self._p = params, p
+        self.chi2 += error ** 2 / denominator
+
+    @property
+    def ready(self) -> bool:
+        return self._p is not None
+
+    def result(self):
+        return self.params, self._scaled(self._p, self.chi2, self.k)
+
+
+def live_fit(model: Union[str, Model] = "cos2", p0=None, absolute_sigma: bool = False):
+    """Recursive least squares for the linear cos² models, recursive Gauss-Newton otherwise."""
+    if isinstance(model, str) and model in BASES:
+        return RecursiveLinearFit(model, absolute_sigma)
+    return RecursiveModelFit(model, p0, absolute_sigma)
+
+
+# --- Folder polling ---
+
+class FolderWatcher:
+    """New measurement files of a folder, each reported once after it stopped changing."""
+
+    def __init__(self, folder: str, suffix: str = ".xlsx"):
+        self.folder = folder
+        self.suffix = suffix
+        self.seen: set = set()
+        self._pending: dict = {}  # file -> (mtime, size) at the last poll
+
+    def poll(self) -> list[str]:
+        """Files that were unchanged since the previous poll, in natural order."""
+        settled = []
+        for file in folder_files(self.folder, self.suffix):
+            if file in self.seen or os.path.basename(file).startswith("~$"):  # Excel lock files
+                continue
+            try:
+                stat = os.stat(file)
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if self._pending.get(file) == signature:
+                settled.append(file)
+            self._pending[file] = signature
+        return settled
+
+    def done(self, file: str):
+        self.seen.add(file)
+        self._pending.pop(file, None)
+
+
+def _read(file: str) -> Optional[tuple[float, float]]:
+    """(mean, std) of a measurement, or None while the file cannot be parsed yet."""
+    try:
+        samples = measurement_samples(file)
+    except Exception:  # still being written: any parse error means try again next poll
+        return None
+    if len(samples) == 0:
+        return None
+    return float(samples.mean()), float(samples.std())
+
+
+# --- Figure ---
+
+class LivePlot:
+    """Data points and fit curve of one axes, redrawn in place."""
+
+    def __init__(self, model: Union[str, Model], ax=None, title: str = ""):
+        import matplotlib.pyplot as plt
+        from Malos import DATA_COLOR, DEG_LABEL, ERRORBARS_COLOR, INTENSITY_LABEL, plot_config
+        self.model = get_model(model)
+        self.ax = ax if ax is not None else plt.gca()
+        self.style = dict(fmt='o', color=DATA_COLOR, ecolor=ERRORBARS_COLOR, capsize=5, label="data")
+        self.points = self.ax.errorbar([], [], yerr=[], **self.style)
+        (self.curve,) = self.ax.plot([], [], color='blue', label="fit")
+        plot_config(DEG_LABEL, INTENSITY_LABEL, title, self.ax)
+
+    def update(self, fit):
+        self.points.remove()
+        self.points = self.ax.errorbar(fit.x, fit.y, yerr=fit.sigma, **self.style)
+        if fit.ready:
+            params, cov = fit.result()
+            x_fit = np.linspace(min(fit.x), max(fit.x), 1000)
+            self.curve.set_data(x_fit, self.model.value(x_fit, params))
+            errors = np.sqrt(np.diag(cov))
+            self.curve.set_label(", ".join(f"{name} = {value:.3g} ± {error:.2g}"
+                                           for name, value, error in zip(self.model.params, params, errors)))
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.ax.legend()
+        self.ax.figure.canvas.draw_idle()
+
+
+def watch(folder: str, angles: Union[Sequence[float], Callable[[str], float]], model: Union[str, Model] = "cos2",
+          p0=None, weighted: bool = True, interval: float = POLL_INTERVAL, idle_timeout: float = IDLE_TIMEOUT,
+          ax=None, plot: bool = True):
+    """
+    Follow `folder` and refit after every new measurement until no file arrives for `idle_timeout`
+    seconds, all `angles` are measured, or Ctrl-C. Returns the live fit.
+
+    angles: the angle of the i-th file in natural order, or a function of the file path.
+    weighted: weight each point by the spread of its readings (otherwise all weigh the same).
+    """
+    import matplotlib.pyplot as plt
+    fit = live_fit(model, p0)
+    watcher = FolderWatcher(folder)
+    figure = LivePlot(model, ax, f"Live fit: {folder}") if plot else None
+    last_new = time.monotonic()
+    try:
+        while time.monotonic() - last_new < idle_timeout:
+            for file in watcher.poll():
+                if not callable(angles) and len(watcher.seen) >= len(angles):
+                    print(f"{file}: no angle left for it, stopping")
+                    return fit
+                reading = _read(file)
+                if reading is None:
+                    continue
+                watcher.done(file)
+                mean, std = reading
+                angle = angles(file) if callable(angles) else angles[len(watcher.seen) - 1]
+                if weighted and std <= 0:
+                    print(f"{file}: readings have no spread to weight by, skipped")
+                    continue
+                fit.add(float(angle), mean, std if weighted else 1.0)
+                last_new = time.monotonic()
+                if fit.ready:
+                    params, cov = fit.result()
+                    print(f"{os.path.basename(file)} @ {angle}°: "
+                          + ", ".join(f"{name}={value:.4g}" for name, value in zip(get_model(model).params, params)))
+                if figure is not None:
+                    figure.update(fit)
+            if not callable(angles) and len(watcher.seen) >= len(angles):
+                break
+            if figure is not None:
+                plt.pause(interval)
+            else:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    return fit
+
+
+if __name__ == "__main__":
+    import matplotlib
+    matplotlib.use('TkAgg')
+    parser = argparse.ArgumentParser(description="Fit a sweep live while its files are written")
+    parser.add_argument("folder")
+    parser.add_argument("--angles", type=float, nargs="+", required=True, help="angle of each file, in order")
+    parser.add_argument("--model", default="cos2")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL)
+    args = parser.parse_args()
+    watch(args.folder, args.angles, args.model, interval=args.interval)
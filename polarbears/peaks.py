@@ -0,0 +1,286 @@
+"""
+Inverse stage of the Bragg analysis: peaks of angle scans -> lattice spacing.
+
+Scans are stacked into NaN-padded (m, n) arrays (`stack_scans`), so every
+step runs over all of them at once:
+    find_peaks    local maxima with their topographic prominence, computed for
+                  every sample of every scan together (O(m·n²), fine for scans
+                  of a few hundred angles)
+    fit_peaks     a "gauss" (or "sinc") fit of the window around every peak of
+                  every scan, as one fitting.fit_batch call
+    fit_spacing   orders n from the current spacing, then the weighted
+                  through-origin fit of sin θ = n·λ/(2d) per scan, with its
+                  uncertainty from the peak-centre errors; peaks of other plane
+                  families fall off the line and are rejected
+
+`analyze_folders` chains them over rotation series like bragg2, whose scan
+angle is 90 − the file's angle (see bragg.scan_from_folder).
+"""
+import os
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from bragg import FREQUENCY, LATTICE, scan_from_folder, wavelength
+from fitting import fit_batch, get_model
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+
+ANGLE_UNCERTAINTY = 0.5  # reading of the rotation stage [deg], as in Malos
+REL_PROMINENCE = 0.15  # default minimum prominence, as a fraction of each scan's range
+HALF_WIDTH = 6.0  # half-width of the window fitted around a peak [deg]
+
+
+def stack_scans(scans: Sequence[tuple]) -> tuple:
+    """(angles, intensities, uncertainties) of every scan, NaN-padded to (m, n_max)."""
+    length = max(len(scan[0]) for scan in scans)
+    stacked = np.full((3, len(scans), length), np.nan)
+    for row, scan in enumerate(scans):
+        for field, values in enumerate(scan):
+            stacked[field, row, :len(values)] = values
+    return tuple(stacked)
+
+
+# --- Detection ---
+
+class Peaks(NamedTuple):
+    index: np.ndarray  # (m, P) sample index of each peak, -1 for padding
+    position: np.ndarray  # (m, P) angle [deg], NaN for padding
+    height: np.ndarray  # (m, P)
+    prominence: np.ndarray  # (m, P)
+
+    @property
+    def count(self) -> np.ndarray:
+        return np.count_nonzero(self.index >= 0, axis=-1)
+
+
+def prominence(y: np.ndarray) -> np.ndarray:
+    """
+    Topographic prominence of every sample of (m, n) scans (NaN where y is NaN).
+
+    For sample i the nearest strictly higher sample on each side bounds a
+    stretch; the base is the higher of the two stretch minima (the scan edge
+    ends a stretch that has no higher sample).
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    n = y.shape[-1]
+    position = np.arange(n)
+    valid = np.isfinite(y)
+    higher = (y[:, None, :] > y[:, :, None]) & valid[:, None, :]  # (m, i, j): y[j] > y[i]
+    left = np.where(higher & (position < position[:, None]), position, -1).max(axis=-1)  # (m, i)
+    right = np.where(higher & (position > position[:, None]), position, n).min(axis=-1)
+    filled = np.where(valid, y, np.inf)[:, None, :]
+    left_base = np.min(np.where((position > left[..., None]) & (position <= position[:, None]), filled, np.inf), -1)
+    right_base = np.min(np.where((position < right[..., None]) & (position >= position[:, None]), filled, np.inf), -1)
+    return np.where(valid, y - np.maximum(left_base, right_base), np.nan)
+
+
+@instrument
+def find_peaks(x, y, min_prominence=None, rel_prominence: float = REL_PROMINENCE,
+               max_peaks: Optional[int] = None) -> Peaks:
+    """
+    Local maxima of (m, n) scans (or one (n,) scan) whose prominence reaches
+    `min_prominence` (absolute, scalar or per scan) or else `rel_prominence` of
+    each scan's range. Peaks are ordered by angle; max_peaks keeps the most prominent.
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    left = np.concatenate([np.full((len(y), 1), -np.inf), y[:, :-1]], axis=1)
+    right = np.concatenate([y[:, 1:], np.full((len(y), 1), -np.inf)], axis=1)
+    left, right = np.where(np.isnan(left), -np.inf, left), np.where(np.isnan(right), -np.inf, right)
+    heights = prominence(y)
+    if min_prominence is None:
+        min_prominence = rel_prominence * (np.nanmax(y, axis=-1) - np.nanmin(y, axis=-1))
+    threshold = np.broadcast_to(np.asarray(min_prominence, dtype=float), (len(y),))[:, None]
+    found = (y > left) & (y >= right) & (heights >= threshold)
+
+    if max_peaks is not None:  # drop all but the max_peaks most prominent of each scan
+        rank = np.argsort(np.argsort(-np.where(found, heights, -np.inf), axis=-1), axis=-1)
+        found &= rank < max_peaks
+    count = max(int(found.sum(axis=-1).max(initial=0)), 1)
+    order = np.argsort(~found, axis=-1, kind="stable")[:, :count]  # found samples first, in angle order
+    keep = np.take_along_axis(found, order, -1)
+    index = np.where(keep, order, -1)
+
+    def take(values):
+        return np.where(keep, np.take_along_axis(values, order, -1), np.nan)
+    return Peaks(index, take(x), take(y), take(heights))
+
+
+# --- Local fits ---
+
+class PeakFits(NamedTuple):
+    center: np.ndarray  # (m, P) [deg], NaN where there is no peak or the fit failed
+    center_err: np.ndarray  # (m, P), fit error and ANGLE_UNCERTAINTY in quadrature
+    height: np.ndarray  # (m, P) above the local background
+    width: np.ndarray  # (m, P) Gaussian σ [deg] (NaN for "sinc")
+    converged: np.ndarray  # (m, P) bool
+    params: np.ndarray  # (m, P, k) all of the model's parameters, NaN like center
+
+
+@instrument
+def fit_peaks(x, y, peaks: Peaks, sigma=None, half_width: float = HALF_WIDTH, model: str = "gauss") -> PeakFits:
+    """Fit `model` to the ±half_width window around every peak, all peaks of all scans in one batch."""
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    sigma = np.ones_like(y) if sigma is None else np.broadcast_to(np.asarray(sigma, dtype=float), y.shape)
+    model = get_model(model)
+    scan, slot = np.nonzero(peaks.index >= 0)
+    center = np.full(peaks.index.shape, np.nan)
+    center_err, height, width = center.copy(), center.copy(), center.copy()
+    converged = np.zeros(peaks.index.shape, dtype=bool)
+    params = np.full(peaks.index.shape + (len(model.params),), np.nan)
+    if len(scan) == 0:
+        return PeakFits(center, center_err, height, width, converged, params)
+
+    inside = np.abs(x[scan] - peaks.position[scan, slot][:, None]) <= half_width  # (k, n)
+    window_x = np.where(inside, x[scan], np.nan)
+    window_y = np.where(inside, y[scan], np.nan)
+    window_sigma = np.where(inside, sigma[scan], np.nan)
+    p0 = model.guess(window_x, window_y)
+    position = model.params.index("B")
+    p0[:, position] = peaks.position[scan, slot]
+    fit = fit_batch(model, x[scan], window_y, window_sigma, p0=p0)
+
+    errors = np.sqrt(np.diagonal(fit.cov, axis1=-2, axis2=-1))
+    good = (fit.converged & np.isfinite(errors[:, position]) & (fit.params[:, 0] > 0)
+            & (np.abs(fit.params[:, position] - peaks.position[scan, slot]) <= half_width))
+    center[scan, slot] = np.where(good, fit.params[:, position], np.nan)
+    center_err[scan, slot] = np.where(good, np.hypot(errors[:, position], ANGLE_UNCERTAINTY), np.nan)
+    height[scan, slot] = np.where(good, fit.params[:, 0], np.nan)
+    if "w" in model.params:
+        width[scan, slot] = np.where(good, np.abs(fit.params[:, model.params.index("w")]), np.nan)
+    converged[scan, slot] = good
+    params[scan, slot] = np.where(good[:, None], fit.params, np.nan)
+    return PeakFits(center, center_err, height, width, converged, params)
+
+
+# --- Lattice spacing ---
+
+class SpacingFit(NamedTuple):
+    spacing: np.ndarray  # (m,) d of the reflecting planes [m]
+    spacing_err: np.ndarray  # (m,)
+    orders: np.ndarray  # (m, P) order assigned to every peak, 0 where unused
+    chi2: np.ndarray  # (m,)
+    dof: np.ndarray  # (m,)
+
+
+def _line(sine, spread, usable, spacing, wave) -> tuple:
+    """Orders from `spacing`, then the weighted through-origin line sin θ = s·n: (orders, slope, residual [σ])."""
+    weight = np.where(usable, 1 / spread ** 2, 0.0)
+    orders = np.where(usable, np.maximum(np.rint(2 * spacing[:, None] * sine / wave), 1), 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.sum(weight * orders * sine, axis=-1) / np.sum(weight * orders ** 2, axis=-1)
+    residual = np.where(usable, np.abs(sine - slope[:, None] * orders) / spread, 0.0)
+    return orders, slope, residual
+
+
+@instrument
+def fit_spacing(centers, center_errors, frequency=FREQUENCY, guess=LATTICE, tilt: float = 0.0,
+                reject: float = 3.0, iterations: int = 10) -> SpacingFit:
+    """
+    Plane spacing d of every scan from its peak angles [deg].
+
+    The glancing angle on the planes is θ = centre − tilt (the family's normal angle φ
+    of bragg.families, 0 for the (100) face). Orders are n = round(2·d·sin θ / λ) from
+    the current d (starting at `guess`, scalar or per scan), and d follows from the
+    weighted fit of sin θ = s·n, s = λ/(2d), with σ(sin θ) = cos θ·σθ. Each iteration
+    reassigns the orders, keeps only the peak closest to the line of any order assigned
+    twice in a scan, and drops the peak furthest off the line if it is more than
+    `reject` σ away (a peak of another family), keeping at least two; NaN centres are
+    skipped. d, orders and χ² come from one last fit of the peaks left. The error is
+    scaled by the reduced χ² when it exceeds 1.
+    """
+    theta = np.deg2rad(np.atleast_2d(np.asarray(centers, dtype=float)) - tilt)
+    error = np.deg2rad(np.atleast_2d(np.asarray(center_errors, dtype=float)))
+    wave = wavelength(frequency)
+    usable = np.isfinite(theta) & np.isfinite(error) & (theta > 0)
+    sine = np.where(usable, np.sin(theta), 0.0)
+    spread = np.where(usable, np.cos(theta) * error, np.inf)
+    spacing = np.broadcast_to(np.asarray(guess, dtype=float), (len(theta),)).astype(float)
+    slot = np.arange(theta.shape[-1])
+    for _ in range(iterations):
+        orders, slope, residual = _line(sine, spread, usable, spacing, wave)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            spacing = wave / (2 * slope)
+        # of two peaks given the same order, the one further off the line (the later on a tie) goes
+        same = (orders[:, :, None] == orders[:, None, :]) & usable[:, :, None] & usable[:, None, :]
+        worse = (residual[:, :, None] > residual[:, None, :]) | (
+                (residual[:, :, None] == residual[:, None, :]) & (slot[:, None] > slot[None, :]))
+        usable &= ~np.any(same & worse, axis=-1)
+        residual = np.where(usable, residual, 0.0)
+        worst = np.argmax(residual, axis=-1)  # drop one peak per scan and iteration, the worst
+        drop = (np.take_along_axis(residual, worst[:, None], -1)[:, 0] > reject) & (usable.sum(axis=-1) > 2)
+        usable[np.flatnonzero(drop), worst[drop]] = False
+    orders, slope, _ = _line(sine, spread, usable, spacing, wave)
+    weight = np.where(usable, 1 / spread ** 2, 0.0)
+    chi2 = np.sum(weight * (sine - slope[:, None] * orders) ** 2, axis=-1)
+    dof = np.count_nonzero(usable, axis=-1) - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spacing = wave / (2 * slope)
+        slope_err = np.sqrt(1 / np.sum(weight * orders ** 2, axis=-1)
+                            * np.where(dof > 0, np.maximum(chi2 / dof, 1.0), 1.0))
+    return SpacingFit(spacing, spacing * slope_err / slope, orders.astype(int), chi2, dof)
+
+
+def analyze_folders(folders: Sequence[str], frequency=FREQUENCY, model: str = "gauss", **detection) -> tuple:
+    """
+    Peaks, peak fits and spacing of every rotation-series folder, in one batch each.
+    Returns (angles, intensities, peaks, fits, spacing), the arrays stacked over folders.
+    """
+    angles, intensities, uncertainties = stack_scans([scan_from_folder(folder) for folder in folders])
+    peaks = find_peaks(angles, intensities, **detection)
+    fits = fit_peaks(angles, intensities, peaks, uncertainties, model=model)
+    return angles, intensities, peaks, fits, fit_spacing(fits.center, fits.center_err, frequency)
+
+
+def print_spacing(folders: Sequence[str], fits: PeakFits, spacing: SpacingFit):
+    for row, folder in enumerate(folders):
+        used = spacing.orders[row] > 0
+        print(f"{folder}: d = {spacing.spacing[row] * 100:.3f} ± {spacing.spacing_err[row] * 100:.3f} cm "
+              f"from {used.sum()} peaks (χ²/dof = {spacing.chi2[row]:.2f}/{spacing.dof[row]})")
+        for center, error, order in zip(fits.center[row][used], fits.center_err[row][used], spacing.orders[row][used]):
+            print(f"    n = {order}: θ = {center:.2f} ± {error:.2f}°")
+
+
+@instrument
+def plot_peaks(folder: str = "bragg2", save: bool = False, ax=None, model: str = "gauss"):
+    """A scan with its fitted peaks, labelled by the order assigned to each."""
+    import matplotlib.pyplot as plt
+    from Malos import CAPSIZE, DATA_COLOR, DATA_POINTs_SIZE, DEG_LABEL, ERRORBARS_COLOR, FIT_COLOR, \
+        INTENSITY_LABEL, plot_config
+    show = ax is None
+    if ax is None:
+        ax = plt.gca()
+    angles, intensities, uncertainties = scan_from_folder(folder)
+    peaks = find_peaks(angles, intensities)
+    fits = fit_peaks(angles, intensities, peaks, uncertainties, model=model)
+    spacing = fit_spacing(fits.center, fits.center_err)
+    ax.errorbar(angles, intensities, yerr=uncertainties, xerr=ANGLE_UNCERTAINTY, fmt='o', color=DATA_COLOR,
+                ecolor=ERRORBARS_COLOR, capsize=CAPSIZE, label="data", ms=DATA_POINTs_SIZE)
+    value = get_model(model).value
+    for slot in np.flatnonzero(np.isfinite(fits.center[0])):
+        window = np.linspace(fits.center[0, slot] - HALF_WIDTH, fits.center[0, slot] + HALF_WIDTH, 200)
+        order = spacing.orders[0, slot]
+        ax.plot(window, value(window, fits.params[0, slot]), color=FIT_COLOR if order else "gray",
+                label=f"n = {order}, θ = {fits.center[0, slot]:.1f}°" if order else "rejected peak")
+    plot_config(DEG_LABEL, INTENSITY_LABEL,
+                f"Bragg peaks, d = {spacing.spacing[0] * 100:.2f} ± {spacing.spacing_err[0] * 100:.2f} cm", ax)
+    if save:
+        ax.figure.savefig(f"plots{os.sep}bragg peaks.png")
+    if show:
+        plt.show()
+    return spacing
+
+
+# Figures for the batch renderer (labtools.render); paths are relative to polarbears/
+FIGURES = {
+    "bragg peaks.png": lambda fig: plot_peaks(ax=fig.add_subplot()),
+}
+
+
+if __name__ == "__main__":
+    import sys
+    folders = sys.argv[1:] or ["bragg2"]
+    _, _, _, peak_fits, spacing_fit = analyze_folders(folders)
+    print_spacing(folders, peak_fits, spacing_fit)
@@ -0,0 +1,112 @@
+"""
+Lightweight core of the polarization analysis: data loaders, fit models and statistics.
+
+Files are parsed by labtools.readers. Only numpy is imported up front; pandas
+(CSV parsing) and scipy (fitting) are imported on first use, and nothing runs at import time, so data-only
+queries start in milliseconds. The plotting scripts get all of this through
+`from Malos import *`.
+"""
+import os
+
+import numpy as np
+
+from fitcache import memoize_fit
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+from labtools.readers import folder_files, load_folder, natural_key, read  # noqa: F401  (re-exported loaders)
+from sweeps import wrap
+
+
+# --- Loaders ---
+
+@instrument(path_arg="file")
+def measurement_samples(file: str) -> np.ndarray:
+    """Raw polarimeter readings of an Excel file: column B from the seventh row on."""
+    return read(file, ("current",))[0]
+
+
+def intensity_avarage(file: str) -> float:
+    return measurement_samples(file).mean()
+
+
+def measurement_uncertainty(file: str) -> float:
+    """Extract measurement uncertainty from an Excel file"""
+    return np.std(measurement_samples(file))
+
+
+def measurement_max_deviation(file: str) -> float:
+    """Largest deviation of a reading from the mean of its file."""
+    intensities = measurement_samples(file)
+    mean = intensities.mean()
+    return max(intensities.max() - mean, mean - intensities.min())
+
+
+def extract_averages_from_folder(folder_name: str) -> np.ndarray:
+    from raw_store import load_samples  # raw_store builds on this module, so it is imported on use
+    return load_samples(folder_name).mean()
+
+
+def extract_uncertainties_from_folder(folder_name: str) -> np.ndarray:
+    from raw_store import load_samples
+    return load_samples(folder_name).std()
+
+
+@instrument(path_arg="file")
+def scope_column(file: str, channel: str = "ch1") -> np.ndarray:
+    """One voltage channel of a Tektronix CSV export."""
+    return read(file, (channel,))[0]
+
+
+def extract_intensity(file: str) -> float:
+    return scope_column(file).mean()
+
+
+def extract_uncertainty(file: str) -> float:
+    return scope_column(file).std(ddof=1)
+
+
+def data_from_folder(folder: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(angles, intensities, uncertainties) of a folder of scope exports named "<angle>.csv"."""
+    stack = load_folder(folder)
+    samples = stack.row("ch1")
+    return stack.index.keys, np.nanmean(samples, axis=1), np.nanstd(samples, axis=1, ddof=1)
+
+
+# --- Models ---
+
+def double_polarizers_ff(x, a, b):
+    return a * (np.cos(np.deg2rad(x))) ** 2 + b
+
+
+def triple_polarizers_ff(x, a, b):
+    return a * (np.cos(np.deg2rad(x)) * np.sin(np.deg2rad(x))) ** 2 + b
+
+
+def half_wave_ff(x, a, b, c):
+    return a * np.cos(np.deg2rad(x - b))**2 + c
+
+
+cos2_fit_func = half_wave_ff
+
+
+def sinc(x, A, B, C):
+    return A * np.sinc(x - B) + C
+
+
+# --- Statistics ---
+
+def fix_angles(angles: np.ndarray, center: int, cycle: int):
+    """Angles from `center` wrapped onto [0, cycle); see sweeps.merge to also merge repeats."""
+    return wrap(angles, cycle, center)
+
+
+def chi_squared(observed, expected, error):
+    return np.sum(((observed - expected) / error) ** 2)
+
+
+@instrument
+@memoize_fit
+def curve_fit(*args, **kwargs):
+    """scipy.optimize.curve_fit, imported on first use and memoized by fitcache."""
+    from scipy.optimize import curve_fit as scipy_curve_fit
+    return scipy_curve_fit(*args, **kwargs)
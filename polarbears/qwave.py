@@ -1,43 +1,72 @@
 import matplotlib.pyplot as plt
 import numpy as np
 
+from fitting import fit_batch, get_model
+import jones  # registers the Jones-calculus models
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
 from Malos import *
-def plot_q_wave(angles:np.ndarray, intensities:np.ndarray, uncertainties:np.ndarray, save=False):
-    coefficients, cov_mat = np.polyfit(angles, intensities, 0, cov=True)
-    ff = np.poly1d(coefficients)
+from sweeps import merge
+
+# Polarizer at 0°, the plate, analyzer at the measured angle (jones.SETUPS)
+Q_WAVE_MODEL = "jones_retarder_analyzer"
+
+
+def fit_q_wave(angles: np.ndarray, intensities: np.ndarray, uncertainties: np.ndarray):
+    """Fit the plate's fast axis and retardance [deg]: FitResult with params (a, axis, retardance)."""
+    return fit_batch(Q_WAVE_MODEL, angles, intensities, uncertainties)
+
+
+@instrument
+def plot_q_wave(angles:np.ndarray, intensities:np.ndarray, uncertainties:np.ndarray, save=False, ax=None):
+    show = ax is None
+    if ax is None:
+        ax = plt.gca()
     x_fit = np.linspace(min(angles), max(angles), 1000)
-    average_intensity = np.average(q_wave_intensities)
-    difference = cov_mat - average_intensity
-    plt.axhline(y=average_intensity, color='black', label='Average Intensity')
-    plt.errorbar(q_wave_angles, q_wave_intensities, xerr=ANGLE_UNCERTAINTY, yerr=uncertainties, fmt='o', color=DATA_COLOR, ecolor=ERRORBARS_COLOR, capsize=5, label='Measured Intensity', ms=DATA_POINTs_SIZE)
-    plot_config(DEG_LABEL, INTENSITY_LABEL, "Intensity vs Angle")
+    average_intensity = np.average(intensities)
+    ax.axhline(y=average_intensity, color='black', label='Average Intensity')
+    fit = fit_q_wave(angles, intensities, uncertainties)
+    errors = np.sqrt(np.diag(fit.cov))
+    ax.plot(x_fit, get_model(Q_WAVE_MODEL).value(x_fit, fit.params), '--', color=FIT_COLOR,
+            label=rf'Jones fit: $\delta = {fit.params[2]:.1f} \pm {errors[2]:.1f}^\circ$, '
+                  rf'axis $= {fit.params[1]:.1f} \pm {errors[1]:.1f}^\circ$')
+    ax.errorbar(angles, intensities, xerr=ANGLE_UNCERTAINTY, yerr=uncertainties, fmt='o', color=DATA_COLOR, ecolor=ERRORBARS_COLOR, capsize=5, label='Measured Intensity', ms=DATA_POINTs_SIZE)
+    plot_config(DEG_LABEL, INTENSITY_LABEL, "Intensity vs Angle", ax)
 
     if save:
-        plt.savefig(f"figures{os.sep}q wave.pdf", format="pdf")
-    plt.show()
+        ax.figure.savefig(f"figures{os.sep}q wave.pdf", format="pdf")
+    if show:
+        plt.show()
 
-    return coefficients, cov_mat
+    return fit
 
 
-def plot_q_wave_polar(angles: np.ndarray, intensities: np.ndarray, uncertainties: np.ndarray, save=False):
-    coefficients, cov_mat = np.polyfit(angles, intensities, 1, cov=True)
-    ff = np.poly1d(coefficients)
+@instrument
+def plot_q_wave_polar(angles: np.ndarray, intensities: np.ndarray, uncertainties: np.ndarray, save=False, ax=None):
+    """`ax`, when given, must be a polar Axes."""
+    fit = fit_q_wave(angles, intensities, uncertainties)
+    errors = np.sqrt(np.diag(fit.cov))
 
     # Create x_fit from 0 to 360 degrees for a full circle
     x_fit = np.linspace(0, 360, 1000)
+    y_fit = get_model(Q_WAVE_MODEL).value(x_fit, fit.params)
 
-    fig = plt.figure(figsize=FIGURE_SIZE)
-    ax = fig.add_subplot(111, polar=True)
+    show = ax is None
+    if ax is None:
+        fig = plt.figure(figsize=FIGURE_SIZE)
+        ax = fig.add_subplot(111, polar=True)
 
     # Plot the fit line
-    ax.plot(np.deg2rad(x_fit), ff(x_fit), color=FIT_COLOR, label=rf'$I = {coefficients[0]:.2e} \theta + {coefficients[1]:.2e}$')
+    ax.plot(np.deg2rad(x_fit), y_fit, color=FIT_COLOR,
+            label=rf'Jones fit: $\delta = {fit.params[2]:.1f} \pm {errors[2]:.1f}^\circ$, '
+                  rf'axis $= {fit.params[1]:.1f} \pm {errors[1]:.1f}^\circ$')
 
     # Plot the measured data points with error bars
     ax.errorbar(np.deg2rad(angles), intensities,
                 xerr=np.deg2rad(ANGLE_UNCERTAINTY), yerr=uncertainties,
                 fmt='o', color=DATA_COLOR, ecolor=ERRORBARS_COLOR,
                 capsize=5, label='Measured Intensity', ms=DATA_POINTs_SIZE)
-    max_intensity = max(np.max(intensities), np.max(ff(x_fit)))
+    max_intensity = max(np.max(intensities), np.max(y_fit))
     ax.set_rlim(0, max_intensity * 1.2)  # 20% headroom above highest point
     # Match the polar plot configuration
     ax.set_theta_zero_location('E')  # 0° to the right
@@ -47,19 +76,42 @@ def plot_q_wave_polar(angles: np.ndarray, intensities: np.ndarray, uncertainties
     ax.set_title("Intensity vs Angle", size=GRAPH_TITLE_SIZE)
     ax.legend(fontsize=LEGEND_SIZE)
     ax.grid(True)
-    plt.tight_layout()
+    ax.figure.tight_layout()
 
     if save:
-        plt.savefig(f"figures{os.sep}q wave polar.pdf", format="pdf")
-    plt.show()
+        ax.figure.savefig(f"figures{os.sep}q wave polar.pdf", format="pdf")
+    if show:
+        plt.show()
 
-    return coefficients, cov_mat
+    return fit
 
 
 #q_wave_angles = np.array([340, 350, 0, 10, 20, 80, 90, 100, 250, 170, 180, 190])
 q_wave_angles = np.array([340, 10, 40, 70, 100, 130, 160, 190, 210, 240, 270, 300])
 
 
+def _q_wave_figure(fig, polar=False):
+    # Sorted from 0°, so the sweep no longer starts at 340°
+    sweep = merge(q_wave_angles, extract_averages_from_folder("q wave")[-12:],
+                  extract_uncertainties_from_folder("q wave")[-12:])
+    angles, intensities, uncertainties = sweep.angles, sweep.values, sweep.sigma
+    if polar:
+        fig.set_size_inches(FIGURE_SIZE)
+        plot_q_wave_polar(angles, intensities, uncertainties, ax=fig.add_subplot(111, polar=True))
+    else:
+        plot_q_wave(angles, intensities, uncertainties, ax=fig.add_subplot())
+
+
+# Figures for the batch renderer (labtools.render); paths are relative to polarbears/
+FIGURES = {
+    "q wave.pdf": _q_wave_figure,
+    "q wave polar.pdf": lambda fig: _q_wave_figure(fig, polar=True),
+}
+
+
 if __name__ == "__main__":
     q_wave_uncertainties = extract_uncertainties_from_folder("q wave")[-12:]
     q_wave_intensities = extract_averages_from_folder("q wave")[-12:]
+    fit = fit_q_wave(q_wave_angles, q_wave_intensities, q_wave_uncertainties)
+    for name, value, error in zip(get_model(Q_WAVE_MODEL).params, fit.params, np.sqrt(np.diag(fit.cov))):
+        print(f"{name} = {value:.4g} ± {error:.2g}")
@@ -0,0 +1,129 @@
+"""
+Ragged store of the raw polarimeter readings of a folder.
+
+`RaggedSamples` keeps every reading of every measurement file back to back in
+one flat float array, with `offsets` marking where each measurement starts
+(and the total length at the end), next to the file names and, when known,
+the angles. Per-measurement statistics are segmented reductions over the flat
+array (`np.add.reduceat` and friends, a single lexsort for order statistics),
+so a new estimator costs neither I/O nor a Python loop over files.
+
+`load_samples` reads a folder once per process and serves later calls from
+memory while the folder's files are unchanged; `save`/`load` keep a folder as
+one .npz.
+"""
+import os
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
+from polarimetry import folder_files, measurement_samples
+
+
+class RaggedSamples(NamedTuple):
+    values: np.ndarray  # all readings, measurement after measurement
+    offsets: np.ndarray  # (n + 1,) start of every measurement, then len(values)
+    files: tuple = ()  # (n,) source file of every measurement
+    angles: Optional[np.ndarray] = None  # (n,) angle of every measurement, if known
+
+    @classmethod
+    def from_arrays(cls, samples: Sequence[np.ndarray], files: Sequence[str] = (), angles=None) -> "RaggedSamples":
+        counts = np.array([len(s) for s in samples], dtype=np.intp)
+        if np.any(counts == 0):
+            raise ValueError("Every measurement needs at least one reading")
+        values = np.concatenate(samples).astype(float) if len(samples) else np.empty(0)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.intp)
+        return cls(values, offsets, tuple(files), None if angles is None else np.asarray(angles, dtype=float))
+
+    @classmethod
+    def from_folder(cls, folder: str, suffix: str = "", angles=None) -> "RaggedSamples":
+        files = folder_files(folder, suffix)
+        return cls.from_arrays([measurement_samples(file) for file in files], files, angles)
+
+    def with_angles(self, angles) -> "RaggedSamples":
+        return self._replace(angles=np.asarray(angles, dtype=float))
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def segment_ids(self) -> np.ndarray:
+        """Measurement index of every reading."""
+        return np.repeat(np.arange(len(self.counts)), self.counts)
+
+    def segments(self) -> list[np.ndarray]:
+        """The readings of every measurement as views into `values`."""
+        return np.split(self.values, self.offsets[1:-1])
+
+    # --- Segmented reductions, one value per measurement ---
+
+    def sum(self) -> np.ndarray:
+        return np.add.reduceat(self.values, self.offsets[:-1])
+
+    def mean(self) -> np.ndarray:
+        return self.sum() / self.counts
+
+    def std(self, ddof: int = 0) -> np.ndarray:
+        deviations = self.values - np.repeat(self.mean(), self.counts)
+        return np.sqrt(np.add.reduceat(deviations ** 2, self.offsets[:-1]) / (self.counts - ddof))
+
+    def min(self) -> np.ndarray:
+        return np.minimum.reduceat(self.values, self.offsets[:-1])
+
+    def max(self) -> np.ndarray:
+        return np.maximum.reduceat(self.values, self.offsets[:-1])
+
+    def max_deviation(self) -> np.ndarray:
+        """Largest deviation of a reading from the mean of its measurement."""
+        mean = self.mean()
+        return np.maximum(self.max() - mean, mean - self.min())
+
+    def sorted_values(self) -> np.ndarray:
+        """`values` sorted within every measurement."""
+        return self.values[np.lexsort((self.values, self.segment_ids))]
+
+    def quantile(self, q: float) -> np.ndarray:
+        """Per-measurement quantile, linearly interpolated like np.quantile."""
+        ordered = self.sorted_values()
+        position = self.offsets[:-1] + q * (self.counts - 1)
+        below = np.floor(position).astype(np.intp)
+        above = np.minimum(below + 1, self.offsets[1:] - 1)
+        return ordered[below] + (position - below) * (ordered[above] - ordered[below])
+
+    def median(self) -> np.ndarray:
+        return self.quantile(0.5)
+
+    # --- Persistence ---
+
+    def save(self, path: str):
+        angles = np.full(len(self.counts), np.nan) if self.angles is None else self.angles
+        np.savez_compressed(path, values=self.values, offsets=self.offsets, files=np.array(self.files, dtype=str),
+                            angles=angles)
+
+    @classmethod
+    def load(cls, path: str) -> "RaggedSamples":
+        with np.load(path) as data:
+            angles = data["angles"]
+            return cls(data["values"], data["offsets"], tuple(data["files"].tolist()),
+                       None if np.all(np.isnan(angles)) else angles)
+
+
+_CACHE: dict = {}
+
+
+def _folder_signature(folder: str, suffix: str) -> tuple:
+    return tuple(sorted((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                        for entry in os.scandir(folder) if entry.name.endswith(suffix)))
+
+
+@instrument
+def load_samples(folder: str, suffix: str = "") -> RaggedSamples:
+    """RaggedSamples of a folder, re-read only when its files change."""
+    key = (os.path.abspath(folder), suffix)
+    signature = _folder_signature(folder, suffix)
+    if key not in _CACHE or _CACHE[key][0] != signature:
+        _CACHE[key] = (signature, RaggedSamples.from_folder(folder, suffix))
+    return _CACHE[key][1]
@@ -1,58 +1,114 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
 import os
+from typing import NamedTuple
 
+from fitcache import memoize_fit
+from fitting import fit_batch
+from fresnel import fresnel
+import labroot  # noqa: F401  (puts the repository root on sys.path for labtools)
+from labtools.instrument import instrument
 from Malos import *  # Assumes this includes: ANGLE_UNCERTAINTY, ERRORBARS_COLOR, CAPSIZE, DATA_POINTs_SIZE, plot_config, DEG_LABEL, INTENSITY_LABEL
 
 VERTICAL_COLOR = "blue"
 HORIZONTAL_COLOR = "hotpink"
 
 
-def rp(angle_deg, nout):
-    angle = np.deg2rad(angle_deg)
-    nin = 1
-    sin_t = nin / nout * np.sin(angle)
-    sin_t = np.clip(sin_t, -1, 1)
-    cos_t = np.sqrt(1 - sin_t ** 2)
-    numerator = nout * np.cos(angle) - nin * cos_t
-    denominator = nout * np.cos(angle) + nin * cos_t
-    return numerator / denominator
+# Thin wrappers over the fresnel() kernel, which computes all coefficients in one pass
+def rp(angle_deg, nout, nin=1): return fresnel(angle_deg, nout, nin).rp
 
 
-def rs(angle_deg, nout):
-    angle = np.deg2rad(angle_deg)
-    nin = 1
-    sin_t = nin / nout * np.sin(angle)
-    sin_t = np.clip(sin_t, -1, 1)
-    cos_t = np.sqrt(1 - sin_t ** 2)
-    numerator = nin * np.cos(angle) - nout * cos_t
-    denominator = nin * np.cos(angle) + nout * cos_t
-    return numerator / denominator
+def rs(angle_deg, nout, nin=1): return fresnel(angle_deg, nout, nin).rs
 
 
-def Rp(angle_deg, nout): return abs(rp(angle_deg, nout)) ** 2
+def Rp(angle_deg, nout, nin=1): return fresnel(angle_deg, nout, nin).Rp
 
 
-def Rs(angle_deg, nout): return abs(rs(angle_deg, nout)) ** 2
+def Rs(angle_deg, nout, nin=1): return fresnel(angle_deg, nout, nin).Rs
 
 
-def scaled_offset_Rp(angle_deg, scale, offset): return scale * Rp(angle_deg, 1.49) + offset
+NOMINAL_N = 1.49  # acrylic, for the single-sweep fits that hold n fixed
 
 
-def scaled_offset_Rs(angle_deg, scale, offset): return scale * Rs(angle_deg, 1.49) + offset
+def scaled_offset_Rp(angle_deg, scale, offset, n=NOMINAL_N): return scale * Rp(angle_deg, n) + offset
 
 
-def chi_squared(observed, expected, error):
-    return np.sum(((observed - expected) / error) ** 2)
+def scaled_offset_Rs(angle_deg, scale, offset, n=NOMINAL_N): return scale * Rs(angle_deg, n) + offset
 
 
 def brewster_angle(nin, nout):
     return np.rad2deg(np.arctan(nout / nin))
 
 
+class IndexFit(NamedTuple):
+    n: float
+    n_err: float
+    brewster: float  # degrees, nin = 1
+    brewster_err: float
+    linear: np.ndarray  # (sets, 2) scale, offset per dataset at the fitted n, in the data's units
+    chi2: float
+    dof: int
+
+
+def _profile_chi2(n, datasets):
+    """
+    χ² of every dataset with scale and offset solved in closed form, for each index in `n`.
+
+    Scale and offset enter linearly, so for a fixed n each dataset is a weighted
+    straight-line fit of intensity against R(θ, n). Returns (total χ² (len(n),), linear (len(n), sets, 2)).
+    """
+    n = np.asarray(n, dtype=float)[:, None]
+    total = np.zeros(n.shape[0])
+    linear = []
+    for angles, intensities, uncertainties, reflectance in datasets:
+        r = reflectance(np.asarray(angles, dtype=float)[None, :], n)
+        w = np.broadcast_to(1 / np.asarray(uncertainties, dtype=float) ** 2, r.shape[-1:])
+        w = w / w.sum()  # only relative weights matter for the solution
+        r_mean = r @ w
+        y_mean = intensities @ w
+        dr = r - r_mean[:, None]
+        scale = (dr * w) @ (intensities - y_mean) / np.sum(dr ** 2 * w, axis=1)
+        offset = y_mean - scale * r_mean
+        residuals = (intensities - scale[:, None] * r - offset[:, None]) / uncertainties
+        total += np.sum(residuals ** 2, axis=1)
+        linear.append(np.stack([scale, offset], axis=-1))
+    return total, np.stack(linear, axis=1)
+
+
+@instrument
+@memoize_fit
+def fit_refractive_index(datasets, n_range=(1.05, 3.0), grid_size=2000, absolute_sigma=False) -> IndexFit:
+    """
+    Variable-projection fit of a refractive index shared by several reflectance sweeps.
+
+    datasets: list of (angles, intensities, uncertainties, Rp or Rs); every set gets its
+    own scale and offset, only n is shared. The profile χ²(n) is evaluated on a dense
+    grid in one broadcast, then refined by a bounded 1-D minimization around the best
+    grid point. The uncertainty of n comes from the curvature of the profile
+    (Δχ² = 1), scaled by the reduced χ² unless absolute_sigma is True.
+    """
+    from scipy.optimize import minimize_scalar
+
+    grid = np.linspace(*n_range, grid_size)
+    chi2_grid, _ = _profile_chi2(grid, datasets)
+    best = int(np.argmin(chi2_grid))
+    bracket = (grid[max(best - 1, 0)], grid[min(best + 1, grid_size - 1)])
+    n = minimize_scalar(lambda value: _profile_chi2([value], datasets)[0][0], bounds=bracket,
+                        method="bounded", options={"xatol": 1e-10}).x
+
+    h = 1e-4 * n
+    (chi2_minus, chi2, chi2_plus), linear = _profile_chi2([n - h, n, n + h], datasets)
+    curvature = (chi2_plus - 2 * chi2 + chi2_minus) / h ** 2
+    dof = sum(len(data[0]) for data in datasets) - 2 * len(datasets) - 1
+    n_var = 2 / curvature if curvature > 0 else np.inf
+    if not absolute_sigma:
+        n_var *= chi2 / dof
+    n_err = np.sqrt(n_var)
+    return IndexFit(n, n_err, brewster_angle(1, n), np.rad2deg(n_err / (1 + n ** 2)), linear[1], chi2, dof)
+
+
 def print_fresnel_and_brewster():
-    nout = 1.49
+    nout = NOMINAL_N
     angles = np.array([55, 56, 57, 58, 59, 60, 61, 62, 63, 64, 65])
     Rp_vals = Rp(angles, nout)
     Rs_vals = Rs(angles, nout)
@@ -65,90 +121,165 @@ def print_fresnel_and_brewster():
     print(f"Fitted Brewster angle (n = {horizontal_n:.3f}): {brewster_fitted:.2f}°): {brewster_angle(1, nout):.2f}°")
 
 
-def plot_fresnel_with_and_without_brewster():
+@instrument
+def plot_fresnel(angles, horizontal_intensities, horizontal_uncertainties, vertical_intensities,
+                 vertical_uncertainties, index_fit: IndexFit, brewster=True, ax=None):
+    """
+    Both sweeps, normalized to their maxima, with the joint fit's Rp and Rs curves: the fitted n
+    and the horizontal (index_fit.linear[0]) and vertical (linear[1]) scale and offset.
+    """
+    if ax is None:
+        plt.figure(figsize=FIGURE_SIZE)
+        ax = plt.gca()
+    horizontal_max, vertical_max = np.max(horizontal_intensities), np.max(vertical_intensities)
     x_fit = np.linspace(min(angles), max(angles), 1000)
+    ax.plot(x_fit, scaled_offset_Rp(x_fit, *index_fit.linear[0], n=index_fit.n) / horizontal_max, color="pink",
+            label=f"Rp fit, n = {index_fit.n:.3f}")
+    ax.plot(x_fit, scaled_offset_Rs(x_fit, *index_fit.linear[1], n=index_fit.n) / vertical_max, color="lightblue",
+            label=f"Rs fit, n = {index_fit.n:.3f}")
+    ax.errorbar(angles, horizontal_intensities / horizontal_max, xerr=ANGLE_UNCERTAINTY,
+                yerr=horizontal_uncertainties / horizontal_max, fmt='s', color=HORIZONTAL_COLOR,
+                capsize=CAPSIZE, label='Measured Horizontal', ms=DATA_POINTs_SIZE)
+    ax.errorbar(angles[:len(vertical_intensities)], vertical_intensities / vertical_max,
+                xerr=ANGLE_UNCERTAINTY,
+                yerr=vertical_uncertainties / vertical_max, fmt='o', color=VERTICAL_COLOR,
+                capsize=CAPSIZE, label='Measured Vertical', ms=DATA_POINTs_SIZE)
+    if brewster:
+        ax.axvline(x=index_fit.brewster, color='gray', linestyle='--',
+                   label=f'Brewster angle {index_fit.brewster:.1f}°')
+        ax.set_title("Fresnel Fit with Brewster Angle", fontsize=GRAPH_TITLE_SIZE)
+    else:
+        ax.set_title("Fresnel Fit", fontsize=GRAPH_TITLE_SIZE)
+    ax.set_xlabel(DEG_LABEL, fontsize=AXIS_LABEL_SIZE)
+    ax.set_ylabel(INTENSITY_LABEL, fontsize=AXIS_LABEL_SIZE)
+    ax.legend()
+    ax.grid(True)
+    ax.figure.tight_layout()
+    return ax
+
+
+def plot_fresnel_with_and_without_brewster(index_fit: IndexFit):
+    fits = (angles, horizontal_intensities, horizontal_uncertainties, vertical_intensities, vertical_uncertainties,
+            index_fit)
 
     # Plot 1: With Brewster angle line
-    plt.figure(figsize=FIGURE_SIZE)
-    plt.plot(x_fit, scaled_offset_Rp(x_fit, horizontal_scale, horizontal_offset), color="pink", label="Rp fit")
-    plt.plot(x_fit, scaled_offset_Rs(x_fit, vertical_scale, vertical_offset), color="lightblue", label="Rs fit")
-    plt.errorbar(angles, horizontal_intensities / np.max(horizontal_intensities), xerr=ANGLE_UNCERTAINTY,
-                 yerr=horizontal_uncertainties / np.max(horizontal_intensities), fmt='s', color=HORIZONTAL_COLOR,
-                 capsize=CAPSIZE, label='Measured Horizontal', ms=DATA_POINTs_SIZE)
-    plt.errorbar(angles[:len(vertical_intensities)], vertical_intensities / np.max(vertical_intensities),
-                 xerr=ANGLE_UNCERTAINTY,
-                 yerr=vertical_uncertainties / np.max(vertical_intensities), fmt='o', color=VERTICAL_COLOR,
-                 capsize=CAPSIZE, label='Measured Vertical', ms=DATA_POINTs_SIZE)
-    plt.axvline(x=brewster_angle(1, 1.49), color='gray', linestyle='--', label='Brewster angle')
-    plt.title("Fresnel Fit with Brewster Angle", fontsize=GRAPH_TITLE_SIZE)
-    plt.xlabel(DEG_LABEL, fontsize=AXIS_LABEL_SIZE)
-    plt.ylabel(INTENSITY_LABEL, fontsize=AXIS_LABEL_SIZE)
-    plt.legend()
-    plt.grid(True)
-    plt.tight_layout()
-    plt.savefig(f"figures{os.sep}fresnel_with_brewster.pdf")
+    plot_fresnel(*fits, brewster=True).figure.savefig(f"figures{os.sep}fresnel_with_brewster.pdf")
 
     # Plot 2: Without Brewster line
-    plt.figure(figsize=FIGURE_SIZE)
-    plt.plot(x_fit, scaled_offset_Rp(x_fit, horizontal_scale, horizontal_offset), color="pink", label="Rp fit")
-    plt.plot(x_fit, scaled_offset_Rs(x_fit, vertical_scale, vertical_offset), color="lightblue", label="Rs fit")
-    plt.errorbar(angles, horizontal_intensities / np.max(horizontal_intensities), xerr=ANGLE_UNCERTAINTY,
-                 yerr=horizontal_uncertainties / np.max(horizontal_intensities), fmt='s', color=HORIZONTAL_COLOR,
-                 capsize=CAPSIZE, label='Measured Horizontal', ms=DATA_POINTs_SIZE)
-    plt.errorbar(angles[:len(vertical_intensities)], vertical_intensities / np.max(vertical_intensities),
-                 xerr=ANGLE_UNCERTAINTY,
-                 yerr=vertical_uncertainties / np.max(vertical_intensities), fmt='o', color=VERTICAL_COLOR,
-                 capsize=CAPSIZE, label='Measured Vertical', ms=DATA_POINTs_SIZE)
-    plt.title("Fresnel Fit", fontsize=GRAPH_TITLE_SIZE)
-    plt.xlabel(DEG_LABEL, fontsize=AXIS_LABEL_SIZE)
-    plt.ylabel(INTENSITY_LABEL, fontsize=AXIS_LABEL_SIZE)
-    plt.legend()
-    plt.grid(True)
-    plt.tight_layout()
-    plt.savefig(f"figures{os.sep}fresnel_no_brewster.pdf")
+    plot_fresnel(*fits, brewster=False).figure.savefig(f"figures{os.sep}fresnel_no_brewster.pdf")
 
     plt.show()
 
 
-def plot_horizontal(angles: np.ndarray, intensities: np.ndarray, uncertainties: np.ndarray, save=False):
-    intensities = intensities / np.max(intensities)
-    uncertainties = uncertainties / np.max(intensities)
-    coefficients, cov_mat = curve_fit(scaled_offset_Rp, angles, intensities, p0=[0.9, 0.01], bounds=([0, -1], [10, 1]))
+@instrument
+def fit_scaled_offset(model, angles: np.ndarray, intensities: np.ndarray, uncertainties=None):
+    """Fit (scale, offset) of scaled_offset_Rp/Rs with n fixed at NOMINAL_N, weighted by the uncertainties if given."""
+    peak = np.max(intensities)
+    intensities = intensities / peak
+    uncertainties = None if uncertainties is None else np.asarray(uncertainties) / peak
+    result = fit_batch("fresnel_rp" if model is scaled_offset_Rp else "fresnel_rs", angles, intensities,
+                       uncertainties, p0=[0.9, 0.01, NOMINAL_N], bounds=([0, -1, 1], [10, 1, 3]), fixed=["n"])
+    return result.params[:2], result.cov[:2, :2]
+
+
+@instrument
+def plot_horizontal(angles: np.ndarray, intensities: np.ndarray, uncertainties: np.ndarray, save=False, ax=None):
+    if ax is None:
+        ax = plt.gca()
+    peak = np.max(intensities)  # normalize data and σ by the same factor
+    intensities, uncertainties = intensities / peak, uncertainties / peak
+    coefficients, cov_mat = fit_scaled_offset(scaled_offset_Rp, angles, intensities, uncertainties)
     x_fit = np.linspace(min(angles), max(angles), 1000)
     fit_vals = scaled_offset_Rp(angles, *coefficients)
-    plt.plot(x_fit, scaled_offset_Rp(x_fit, *coefficients), color=HORIZONTAL_COLOR, label="horizontal fit")
-    plt.errorbar(angles, intensities, xerr=ANGLE_UNCERTAINTY, yerr=uncertainties, fmt='o', color=HORIZONTAL_COLOR,
-                 ecolor=ERRORBARS_COLOR, capsize=CAPSIZE, label="horizontal data", ms=DATA_POINTs_SIZE)
-    plot_config(DEG_LABEL, INTENSITY_LABEL, "Intensity vs Angle")
+    ax.plot(x_fit, scaled_offset_Rp(x_fit, *coefficients), color=HORIZONTAL_COLOR, label="horizontal fit")
+    ax.errorbar(angles, intensities, xerr=ANGLE_UNCERTAINTY, yerr=uncertainties, fmt='o', color=HORIZONTAL_COLOR,
+                ecolor=ERRORBARS_COLOR, capsize=CAPSIZE, label="horizontal data", ms=DATA_POINTs_SIZE)
+    plot_config(DEG_LABEL, INTENSITY_LABEL, "Intensity vs Angle", ax)
     if save:
-        plt.savefig(f"figures{os.sep}horizontal.pdf", format="pdf")
+        ax.figure.savefig(f"figures{os.sep}horizontal.pdf", format="pdf")
 
     chi2 = chi_squared(intensities, fit_vals, uncertainties)
     print(f"Chi-squared (horizontal): {chi2:.2f}")
     return coefficients, cov_mat
 
 
-def plot_vertical(angles: np.ndarray, intensities: np.ndarray, uncertainties: np.ndarray, save=False):
-    intensities = intensities / np.max(intensities)
-    uncertainties = uncertainties / np.max(intensities)
-    coefficients, cov_mat = curve_fit(scaled_offset_Rs, angles, intensities, p0=[0.9, 0.01], bounds=([0, -1], [10, 1]))
+@instrument
+def plot_vertical(angles: np.ndarray, intensities: np.ndarray, uncertainties: np.ndarray, save=False, ax=None):
+    if ax is None:
+        ax = plt.gca()
+    peak = np.max(intensities)  # normalize data and σ by the same factor
+    intensities, uncertainties = intensities / peak, uncertainties / peak
+    coefficients, cov_mat = fit_scaled_offset(scaled_offset_Rs, angles, intensities, uncertainties)
     x_fit = np.linspace(min(angles), max(angles), 1000)
     fit_vals = scaled_offset_Rs(angles, *coefficients)
-    plt.plot(x_fit, scaled_offset_Rs(x_fit, *coefficients), color=VERTICAL_COLOR, label="vertical fit")
-    plt.errorbar(angles, intensities, xerr=ANGLE_UNCERTAINTY, yerr=uncertainties, fmt='o', color=VERTICAL_COLOR,
-                 ecolor=ERRORBARS_COLOR, capsize=CAPSIZE, label="vertical data", ms=DATA_POINTs_SIZE)
-    plot_config(DEG_LABEL, INTENSITY_LABEL, "Intensity vs Angle")
+    ax.plot(x_fit, scaled_offset_Rs(x_fit, *coefficients), color=VERTICAL_COLOR, label="vertical fit")
+    ax.errorbar(angles, intensities, xerr=ANGLE_UNCERTAINTY, yerr=uncertainties, fmt='o', color=VERTICAL_COLOR,
+                ecolor=ERRORBARS_COLOR, capsize=CAPSIZE, label="vertical data", ms=DATA_POINTs_SIZE)
+    plot_config(DEG_LABEL, INTENSITY_LABEL, "Intensity vs Angle", ax)
     if save:
-        plt.savefig(f"figures{os.sep}vertical.pdf", format="pdf")
+        ax.figure.savefig(f"figures{os.sep}vertical.pdf", format="pdf")
 
     chi2 = chi_squared(intensities, fit_vals, uncertainties)
     print(f"Chi-squared (vertical): {chi2:.2f}")
     return coefficients, cov_mat
 
 
+REFRACTION_ANGLES = np.array([30, 35, 40, 45, 50, 55, 60, 65, 70, 75, 80, 85, 25, 20, 15, 10])
+BREWSTER_ANGLES = np.array([55, 56, 57, 58, 59, 60, 61, 62, 63, 64, 65, 50, 51, 52, 53, 54, 55])
+
+
+def fit_refraction_index() -> IndexFit:
+    """Fit n jointly over the horizontal (Rp), vertical (Rs) and Brewster (Rp) sweeps."""
+    def sweep(name, angles, reflectance):
+        return (angles, extract_averages_from_folder(f"refraction{os.sep}{name}"),
+                extract_uncertainties_from_folder(f"refraction{os.sep}{name}"), reflectance)
+    return fit_refractive_index([sweep("horizontal", REFRACTION_ANGLES, Rp), sweep("vertical", REFRACTION_ANGLES, Rs),
+                                 sweep("brewster", BREWSTER_ANGLES, Rp)])
+
+
+def load_refraction_data():
+    """Return (angles, horizontal, horizontal_err, vertical, vertical_err) with the Brewster sweep appended to horizontal."""
+    horizontal = np.append(extract_averages_from_folder(f"refraction{os.sep}horizontal"),
+                           extract_averages_from_folder(f"refraction{os.sep}brewster"))
+    horizontal_err = np.append(extract_uncertainties_from_folder(f"refraction{os.sep}horizontal"),
+                               extract_uncertainties_from_folder(f"refraction{os.sep}brewster"))
+    vertical = extract_averages_from_folder(f"refraction{os.sep}vertical")
+    vertical_err = extract_uncertainties_from_folder(f"refraction{os.sep}vertical")
+    return np.append(REFRACTION_ANGLES, BREWSTER_ANGLES), horizontal, horizontal_err, vertical, vertical_err
+
+
+def _fresnel_figure(brewster: bool):
+    def build(fig):
+        angles, horizontal, horizontal_err, vertical, vertical_err = load_refraction_data()
+        fig.set_size_inches(FIGURE_SIZE)
+        plot_fresnel(angles, horizontal, horizontal_err, vertical, vertical_err, fit_refraction_index(),
+                     brewster=brewster, ax=fig.add_subplot())
+    return build
+
+
+def _horizontal_figure(fig):
+    angles, horizontal, horizontal_err, _, _ = load_refraction_data()
+    plot_horizontal(angles, horizontal, horizontal_err, ax=fig.add_subplot())
+
+
+def _vertical_figure(fig):
+    _, _, _, vertical, vertical_err = load_refraction_data()
+    plot_vertical(REFRACTION_ANGLES, vertical, vertical_err, ax=fig.add_subplot())
+
+
+# Figures for the batch renderer (labtools.render); paths are relative to polarbears/
+FIGURES = {
+    "fresnel_with_brewster.pdf": _fresnel_figure(True),
+    "fresnel_no_brewster.pdf": _fresnel_figure(False),
+    "horizontal.pdf": _horizontal_figure,
+    "vertical.pdf": _vertical_figure,
+}
+
+
 if __name__ == "__main__":
-    angles = np.array([30, 35, 40, 45, 50, 55, 60, 65, 70, 75, 80, 85, 25, 20, 15, 10])
-    brewster_angles = np.array([55, 56, 57, 58, 59, 60, 61, 62, 63, 64, 65, 50, 51, 52, 53, 54, 55])
+    matplotlib.use('TkAgg')
+    angles = REFRACTION_ANGLES
+    brewster_angles = BREWSTER_ANGLES
     vertical_intensities = extract_averages_from_folder(f"refraction{os.sep}vertical")
     horizontal_intensities = extract_averages_from_folder(f"refraction{os.sep}horizontal")
     brewster_intensities = extract_averages_from_folder(f"refraction{os.sep}brewster")
@@ -158,8 +289,9 @@ if __name__ == "__main__":
 
     (vertical_scale, vertical_offset), vertical_cov = plot_vertical(angles, vertical_intensities,
                                                                     vertical_uncertainties, save=True)
+    index_fit = fit_refraction_index()
     global vertical_n
-    vertical_n = 1.49  # Fixed in fit, for completeness
+    vertical_n = index_fit.n
 
     angles = np.append(angles, brewster_angles)
     horizontal_intensities = np.append(horizontal_intensities, brewster_intensities)
@@ -167,13 +299,16 @@ if __name__ == "__main__":
     (horizontal_scale, horizontal_offset), horizontal_cov = plot_horizontal(angles, horizontal_intensities,
                                                                             horizontal_uncertainties, save=True)
     global horizontal_n
-    horizontal_n = 1.49  # Fixed in fit, but needed for derived Brewster
+    horizontal_n = index_fit.n
 
     print(f"Vertical fit: scale = {vertical_scale:.3e}, offset = {vertical_offset:.3e}")
     print(f"Horizontal fit: scale = {horizontal_scale:.3e}, offset = {horizontal_offset:.3e}")
+    print(f"Joint fit: n = {index_fit.n:.3f} ± {index_fit.n_err:.3f}, "
+          f"Brewster angle = {index_fit.brewster:.2f} ± {index_fit.brewster_err:.2f}°, "
+          f"chi2/dof = {index_fit.chi2:.1f}/{index_fit.dof}")
 
     print_fresnel_and_brewster()
-    plot_fresnel_with_and_without_brewster()
+    plot_fresnel_with_and_without_brewster(index_fit)
 
     plt.show()
 
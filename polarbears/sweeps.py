@@ -0,0 +1,85 @@
+"""
+Angle sweeps on a circle: wrap raw angles, merge repeated ones, sort.
+
+A sweep is recorded in the order the polarizer was turned, often across the
+0°/360° seam (340, 10, 40, ...) and with some angles measured twice. `merge`
+maps the angles onto [0, period) from an origin, averages the readings of
+each repeated angle with inverse-variance weights and returns every sweep
+sorted, one point per angle:
+
+    merge(angles, values, sigma, period=180)     -> Sweep(angles, values, sigma, counts)
+    unfold(sweep, period=180, span=360)          -> the sweep repeated around the full circle
+
+Sweeps are batched over leading axes: values (..., n) with angles (n,) or
+(..., n). The group-by is one lexsort on (sweep, angle) and np.add.reduceat
+segment sums, so the cost does not depend on how the points split into
+sweeps. Sweeps that end up with fewer distinct angles are NaN padded
+(counts 0). Without sigma every reading weighs the same and the merged sigma
+is 1/sqrt(count), in units of one reading's uncertainty, which is what a
+relative-weight fit needs.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+ANGLE_DECIMALS = 6  # angles equal to this many decimals after wrapping are the same angle
+
+
+class Sweep(NamedTuple):
+    angles: np.ndarray  # (..., m) distinct wrapped angles, ascending, NaN padded
+    values: np.ndarray  # (..., m) inverse-variance weighted mean at each angle
+    sigma: np.ndarray  # (..., m) uncertainty of that mean, (Σ 1/σ²)^-1/2
+    counts: np.ndarray  # (..., m) readings merged into each point, 0 for padding
+
+
+def wrap(angles, period: float = 360.0, origin: float = 0.0) -> np.ndarray:
+    """Angles measured from `origin`, mapped onto [0, period)."""
+    wrapped = np.mod(np.asarray(angles, dtype=float) - origin, period)
+    return np.where(wrapped >= period, 0.0, wrapped)  # -1e-17 % 360 rounds up to 360
+
+
+def merge(angles, values, sigma=None, period: float = 360.0, origin: float = 0.0,
+          decimals: int = ANGLE_DECIMALS) -> Sweep:
+    """
+    Wrap, deduplicate and sort sweeps. Points with a non-finite angle, value or
+    sigma, or sigma <= 0, are left out.
+    """
+    values = np.asarray(values, dtype=float)
+    n = values.shape[-1]
+    batch = values.shape[:-1]
+    sweeps = int(np.prod(batch))
+    angles = np.broadcast_to(wrap(angles, period, origin), values.shape).reshape(sweeps, n)
+    sigma = np.ones(values.shape) if sigma is None else np.broadcast_to(np.asarray(sigma, dtype=float), values.shape)
+    values, sigma = values.reshape(sweeps, n), sigma.reshape(sweeps, n)
+
+    valid = np.isfinite(angles) & np.isfinite(values) & np.isfinite(sigma) & (sigma > 0)
+    sweep = np.broadcast_to(np.arange(sweeps)[:, None], values.shape)[valid]
+    key = np.round(angles[valid], decimals)
+    order = np.lexsort((key, sweep))
+    sweep, key = sweep[order], key[order]
+    weight = sigma[valid][order] ** -2.0
+    weighted = weight * values[valid][order]
+
+    first = np.ones(len(key), dtype=bool)
+    first[1:] = (key[1:] != key[:-1]) | (sweep[1:] != sweep[:-1])
+    starts = np.flatnonzero(first)
+    per_sweep = np.bincount(sweep[starts], minlength=sweeps)
+    width = per_sweep.max(initial=0)
+    out = Sweep(np.full((sweeps, width), np.nan), np.full((sweeps, width), np.nan),
+                np.full((sweeps, width), np.nan), np.zeros((sweeps, width), dtype=np.intp))
+    if len(starts):
+        group_sweep = sweep[starts]
+        slot = np.arange(len(starts)) - (np.cumsum(per_sweep) - per_sweep)[group_sweep]
+        total = np.add.reduceat(weight, starts)
+        out.angles[group_sweep, slot] = key[starts]
+        out.values[group_sweep, slot] = np.add.reduceat(weighted, starts) / total
+        out.sigma[group_sweep, slot] = total ** -0.5
+        out.counts[group_sweep, slot] = np.diff(np.append(starts, len(key)))
+    return Sweep(*(field.reshape(batch + (width,)) for field in out))
+
+
+def unfold(sweep: Sweep, period: float, span: float = 360.0) -> Sweep:
+    """A sweep of period `period` repeated to cover [0, span), e.g. a 180° cos² sweep on a polar plot."""
+    copies = int(round(span / period))
+    shifts = np.repeat(np.arange(copies) * period, sweep.angles.shape[-1])
+    return Sweep(np.tile(sweep.angles, copies) + shifts, *(np.tile(field, copies) for field in sweep[1:]))
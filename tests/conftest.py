@@ -0,0 +1,6 @@
+"""The lab modules import each other flat, as when a script runs from its own folder."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "polarbears"), os.path.join(ROOT, "magnetism")]
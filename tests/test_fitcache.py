@@ -0,0 +1,69 @@
+import importlib
+import sys
+
+import numpy as np
+import pytest
+
+import fitcache
+from fitting import MODELS, fit_batch, register_model
+
+MODEL_SOURCE = '''
+import numpy as np
+
+SLOPE = {slope}
+
+
+def value(x, p):
+    return p[..., 0, None] * SLOPE * x
+
+
+def jacobian(x, p):
+    return (SLOPE * x * np.ones_like(p[..., :1]))[..., None]
+'''
+
+
+@pytest.fixture
+def model_module(tmp_path, monkeypatch):
+    """A model defined in its own file, which the test edits between fits."""
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delenv("FIT_CACHE_DIR", raising=False)
+    monkeypatch.delenv("FIT_CACHE", raising=False)
+    fitcache.clear_fit_cache()
+    path = tmp_path / "edited_model.py"
+
+    def write(slope):
+        path.write_text(MODEL_SOURCE.format(slope=slope))
+        sys.modules.pop("edited_model", None)
+        importlib.invalidate_caches()
+        module = importlib.import_module("edited_model")
+        register_model("edited_line", ("a",), module.value, module.jacobian, lambda x, y: np.ones(np.shape(y)[:-1] + (1,)))
+        return module
+
+    yield write
+    MODELS.pop("edited_line", None)
+    sys.modules.pop("edited_model", None)
+    fitcache.clear_fit_cache()
+
+
+def test_editing_a_registered_model_misses_the_cache(model_module):
+    x = np.linspace(1, 10, 10)
+    y = 6.0 * x
+    model_module(1.0)
+    first = fit_batch("edited_line", x, y)
+    assert np.isclose(first.params[0], 6.0)
+    assert np.isclose(fit_batch("edited_line", x, y).params[0], 6.0)  # unchanged: served from the cache
+    model_module(2.0)
+    assert np.isclose(fit_batch("edited_line", x, y).params[0], 3.0)
+
+
+def test_reregistering_a_model_name_misses_the_cache(model_module):
+    x = np.linspace(1, 10, 10)
+    y = 4.0 * x ** 2
+    model_module(1.0)
+    line = fit_batch("edited_line", x, y).params[0]
+    register_model("edited_line", ("a",), lambda x, p: p[..., 0, None] * x ** 2,
+                   lambda x, p: (x ** 2 * np.ones_like(p[..., :1]))[..., None],
+                   lambda x, y: np.ones(np.shape(y)[:-1] + (1,)))
+    assert not np.isclose(line, 4.0)
+    assert np.isclose(fit_batch("edited_line", x, y).params[0], 4.0)
+    assert np.isclose(fit_batch(model="edited_line", x=x, y=y).params[0], 4.0)
@@ -0,0 +1,10 @@
+import numpy as np
+
+import jones  # noqa: F401  (registers the jones_* models)
+from fitting import get_model
+
+
+def test_background_guess_spans_the_data():
+    x = np.arange(0, 360, 10.0)
+    y = 5 * np.cos(np.deg2rad(x - 20)) ** 2 + 1
+    assert np.allclose(get_model("jones_double_polarizers").guess(x, y), [5.0, 0.0, 1.0])
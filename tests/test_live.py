@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from fitting import fit_batch
+from fresnel import fresnel
+from live import live_fit
+
+SIGMA = 0.01
+
+
+@pytest.mark.parametrize("p0", [[4.0, 0.0, 1.45], None])
+@pytest.mark.parametrize("seed", [0, 56])
+def test_ordered_brewster_sweep_matches_the_batch_fit(seed, p0):
+    x = np.linspace(20, 78, 30)  # in angle order: the Brewster minimum arrives late
+    y = 5 * fresnel(x, 1.5).Rp + 0.1 + np.random.default_rng(seed).normal(0, SIGMA, x.size)
+    batch = fit_batch.uncached("fresnel_rp", x, y, np.full(x.size, SIGMA), absolute_sigma=True)
+    live = live_fit("fresnel_rp", p0, absolute_sigma=True)
+    for xi, yi in zip(x, y):
+        live.add(xi, yi, SIGMA)
+    params, cov = live.result()
+    errors = np.sqrt(np.diag(batch.cov))
+    assert np.all(np.abs(params - batch.params) <= errors)
+    assert np.allclose(np.sqrt(np.diag(cov)), errors, rtol=0.5)
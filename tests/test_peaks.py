@@ -0,0 +1,15 @@
+import numpy as np
+
+from bragg import FREQUENCY, wavelength
+from peaks import fit_spacing
+
+SPACING = 0.038  # [m]
+
+
+def test_one_peak_per_order_and_spacing_from_the_peaks_kept():
+    true = np.rad2deg(np.arcsin(np.array([1, 2]) * wavelength(FREQUENCY) / (2 * SPACING)))
+    centers = [[true[0] - 5.0, true[0], true[1]]]  # a stray peak that also rounds to n = 1
+    fit = fit_spacing(centers, [[2.0, 1.0, 0.5]], guess=SPACING)
+    assert fit.orders.tolist() == [[0, 1, 2]]
+    assert np.isclose(fit.spacing[0], SPACING)
+    assert fit.dof[0] == 1 and np.isclose(fit.chi2[0], 0.0, atol=1e-12)